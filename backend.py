@@ -1,9 +1,50 @@
-from fastapi import FastAPI
+import json
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from src.legal_agent import LegalAgent  # Asegúrate de que 'src' esté bien ubicado
+from src.llm_scheduler import LLMBusyError, LLMQueueFullError
+from src.metadata_index import normalize_filters
 
-app = FastAPI()
+# El agente (LangChain, LangGraph, Chroma y los índices) se carga en segundo plano
+# para que el servidor acepte conexiones y responda /health de inmediato
+agent = None
+estado = {"fase": "iniciando", "error": None, "segundos": None}
+
+
+def _iniciar_agente():
+    """Importa, inicializa y precalienta el agente; /ready responde 200 al terminar"""
+    global agent
+    inicio = time.perf_counter()
+    try:
+        from src.legal_agent import LegalAgent
+
+        nuevo = LegalAgent()
+        nuevo.initialize()
+        agent = nuevo
+        estado["fase"] = "precalentando"
+        nuevo.warm_up()
+        estado["fase"] = "listo"
+    except Exception as e:
+        print(f"Error iniciando el agente: {e}")
+        estado["fase"] = "error"
+        estado["error"] = str(e)
+    estado["segundos"] = round(time.perf_counter() - inicio, 2)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    threading.Thread(target=_iniciar_agente, name="inicio-agente", daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,17 +53,118 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(LLMBusyError)
+async def llm_ocupado(request: Request, exc: LLMBusyError):
+    # Cola del LLM llena: 429; sin cupo dentro del tiempo máximo de espera: 503
+    return JSONResponse(
+        status_code=429 if isinstance(exc, LLMQueueFullError) else 503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "5"}
+    )
+
+class Filtros(BaseModel):
+    # Restringen los fallos buscados; las fechas aceptan dd-mm-aaaa o aaaa-mm-dd
+    corte: Optional[str] = None
+    fecha_desde: Optional[str] = None
+    fecha_hasta: Optional[str] = None
+    articulo: Optional[str] = None
+
 class Pregunta(BaseModel):
     pregunta: str
+    # Conversación a continuar; si se omite se crea una nueva y se retorna su id
+    session_id: Optional[str] = None
+    filtros: Optional[Filtros] = None
+
+
+def _filtros(pregunta: Pregunta) -> dict:
+    """Valida los filtros de la petición; un filtro mal formado responde 400"""
+    if pregunta.filtros is None:
+        return {}
+    try:
+        return normalize_filters(pregunta.filtros.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-agent = LegalAgent()
-agent.initialize()
+def _agente():
+    """Agente inicializado; mientras se carga, las consultas responden 503"""
+    if agent is None:
+        raise HTTPException(status_code=503, detail=f"Agente no disponible ({estado['fase']})",
+                            headers={"Retry-After": "5"})
+    return agent
+
+@app.get("/health")
+def salud():
+    # Liveness: el proceso responde aunque el agente siga cargando
+    return {"status": "ok"}
+
+@app.get("/ready")
+def listo():
+    # Readiness: 200 solo cuando el agente está inicializado y precalentado
+    return JSONResponse(status_code=200 if estado["fase"] == "listo" else 503, content=estado)
 
 @app.post("/ask")
-def responder(pregunta: Pregunta):
-    resultado = agent.chat(pregunta.pregunta)
+async def responder(pregunta: Pregunta):
+    # Ruta asíncrona: las llamadas a Ollama no bloquean el event loop
+    agent = _agente()
+    session_id = pregunta.session_id or str(uuid.uuid4())
+    filtros = _filtros(pregunta)
+    resultado = await agent.achat(pregunta.pregunta, thread_id=session_id, filters=filtros)
     return {
         "respuesta": resultado["answer"],
-        "sources": resultado.get("sources", {})
+        "sources": resultado.get("sources", {}),
+        "session_id": session_id
     }
 
+
+def _sse(event: str, data: dict) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/ask/stream")
+async def responder_stream(pregunta: Pregunta):
+    # Eventos: "sources" (fuentes recuperadas), "token" (texto incremental) y "end" (respuesta completa)
+    agent = _agente()
+    session_id = pregunta.session_id or str(uuid.uuid4())
+    filtros = _filtros(pregunta)
+
+    stream = agent.astream_chat(pregunta.pregunta, thread_id=session_id, filters=filtros)
+    # El primer evento se obtiene antes de responder: si el LLM no tiene cupo se
+    # responde 429/503 en vez de abrir un stream vacío
+    primero = await stream.__anext__()
+
+    async def eventos():
+        # Cerrar el stream del agente al terminar, si el cliente se desconecta o si la
+        # respuesta se cancela libera de inmediato el cupo del LLM y el estado de la fase 3
+        try:
+            event = primero
+            while True:
+                if event["type"] == "sources":
+                    yield _sse("sources", {"sources": event["sources"], "session_id": session_id})
+                elif event["type"] == "token":
+                    yield _sse("token", {"token": event["content"]})
+                elif event["type"] == "end":
+                    yield _sse("end", {
+                        "respuesta": event["answer"],
+                        "sources": event.get("sources", {}),
+                        "session_id": session_id
+                    })
+                try:
+                    event = await stream.__anext__()
+                except StopAsyncIteration:
+                    break
+        finally:
+            await stream.aclose()
+
+    async def cerrar():
+        await stream.aclose()
+
+    # Si la respuesta nunca llega a iterar eventos() (cliente desconectado antes de
+    # empezar), la tarea de fondo cierra igualmente el stream; aclose es idempotente
+    return StreamingResponse(eventos(), media_type="text/event-stream", background=BackgroundTask(cerrar))
+
+
+@app.get("/metrics")
+def metricas():
+    # Histogramas de latencia por etapa y de tokens del LLM en formato Prometheus
+    metricas = agent.metrics.render_prometheus() if agent is not None else ""
+    return PlainTextResponse(metricas, media_type="text/plain; version=0.0.4")
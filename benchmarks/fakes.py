@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Vocabulario de las respuestas simuladas
+_ANSWER_WORDS = (
+    "según", "el", "artículo", "de", "la", "ley", "del", "consumidor", "el", "proveedor",
+    "debe", "responder", "por", "la", "garantía", "legal", "dentro", "del", "plazo"
+)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Modelo de embeddings determinista para benchmarks
+
+    Cada texto se convierte en un vector unitario generado a partir del SHA-256 del
+    texto, por lo que el mismo texto produce siempre el mismo vector. Las latencias
+    simulan el costo de una llamada a Ollama.
+    """
+
+    def __init__(self, dimensions: int = 768, call_latency: float = 0.0, text_latency: float = 0.0):
+        """
+        Args:
+            dimensions: Dimensión de los vectores (768 como nomic-embed-text)
+            call_latency: Segundos fijos por solicitud
+            text_latency: Segundos adicionales por texto embebido
+        """
+        self.dimensions = dimensions
+        self.call_latency = call_latency
+        self.text_latency = text_latency
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimensions).astype(np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        return vector.tolist()
+
+    def _latency(self, count: int) -> float:
+        self.calls += 1
+        self.texts += count
+        return self.call_latency + self.text_latency * count
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        delay = self._latency(len(texts))
+        if delay:
+            time.sleep(delay)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        delay = self._latency(1)
+        if delay:
+            time.sleep(delay)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        delay = self._latency(len(texts))
+        if delay:
+            await asyncio.sleep(delay)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        delay = self._latency(1)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._vector(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Modelo de chat determinista que emite tokens con latencia fija
+
+    La respuesta es siempre la misma secuencia de response_tokens palabras. Antes del
+    primer token se espera first_token_latency (tiempo de prefill) y luego
+    token_latency por token, tanto en invoke como en stream.
+    """
+
+    response_tokens: int = 60
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark-chat"
+
+    def _tokens(self) -> List[str]:
+        return [
+            _ANSWER_WORDS[index % len(_ANSWER_WORDS)] + ("" if index == self.response_tokens - 1 else " ")
+            for index in range(self.response_tokens)
+        ]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.first_token_latency + self.token_latency * self.response_tokens)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(self._tokens())))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                         **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.first_token_latency + self.token_latency * self.response_tokens)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(self._tokens())))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for token in self._tokens():
+            time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for token in self._tokens():
+            await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
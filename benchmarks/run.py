@@ -0,0 +1,342 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: sin ru_maxrss
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from benchmarks.synthetic_data import generate_cases_csv
+from src import rag_system
+from src.config import Config
+from src.data_loader import DataLoader
+from src.legal_agent import LegalAgent
+
+SCENARIOS = (
+    "load_all_documents",
+    "initialize_cold",
+    "initialize_warm",
+    "retrieval",
+    "retrieval_cached",
+    "retrieval_concurrent",
+    "classify_query",
+    "chat",
+)
+
+_QUERY_TERMS = (
+    "garantía legal", "producto defectuoso", "derecho a retracto", "cobro indebido",
+    "publicidad engañosa", "devolución del dinero", "cláusula abusiva", "compra por internet",
+    "plazo para reclamar", "indemnización de perjuicios", "servicio no prestado", "despacho atrasado"
+)
+_QUERY_TEMPLATES = (
+    "¿Qué dice el artículo {article} sobre {term}?",
+    "¿Cuál es el plazo para {term}?",
+    "¿Puedo reclamar por {term}?",
+    "Compré algo y tuve un problema de {term}, ¿qué hago?",
+    "¿Tengo derecho a {term} si el proveedor no responde?",
+)
+
+
+def build_queries(count: int, seed: int = 1) -> List[str]:
+    """
+    Genera consultas de usuario sintéticas
+
+    Args:
+        count: Número de consultas
+        seed: Semilla para reproducibilidad
+
+    Returns:
+        List[str]: Consultas
+    """
+    rng = random.Random(seed)
+    return [
+        rng.choice(_QUERY_TEMPLATES).format(article=rng.randint(1, 60), term=rng.choice(_QUERY_TERMS))
+        for _ in range(count)
+    ]
+
+
+def configure(workdir: str, args: argparse.Namespace) -> int:
+    """
+    Prepara un entorno aislado: corpus sintético, rutas temporales y modelos simulados
+
+    Args:
+        workdir: Directorio temporal del benchmark
+        args: Argumentos de la línea de comandos
+
+    Returns:
+        int: Chunks de fallos generados
+    """
+    cases_file = os.path.join(workdir, "fallos.csv")
+    total_chunks = generate_cases_csv(
+        cases_file, args.rows, args.chunks_per_row, args.words_per_chunk,
+        args.duplicate_ratio, args.seed
+    )
+
+    Config.CASES_FILE = cases_file
+    Config.COMPILED_CORPUS_DIR = os.path.join(workdir, "compiled")
+    reset_index(workdir)
+    Config.EMBEDDING_CACHE_ENABLED = args.embedding_cache
+    Config.STREAM_RESPONSES = False
+
+    # RAGSystem construye los modelos con estos nombres: se reemplazan por los simulados
+    rag_system.OllamaEmbeddings = lambda **kwargs: FakeEmbeddings(
+        dimensions=args.dimensions,
+        call_latency=args.embed_call_latency / 1000,
+        text_latency=args.embed_text_latency / 1000
+    )
+    rag_system.ChatOllama = lambda **kwargs: FakeChatModel(
+        response_tokens=args.response_tokens,
+        first_token_latency=args.first_token_latency / 1000,
+        token_latency=args.token_latency / 1000
+    )
+    return total_chunks
+
+
+def reset_index(workdir: str):
+    """
+    Apunta la base vectorial y la caché de embeddings a directorios nuevos para forzar
+    un indexado en frío
+
+    Se usan directorios nuevos en lugar de borrar los anteriores porque Chroma
+    mantiene en memoria los clientes abiertos por ruta.
+
+    Args:
+        workdir: Directorio de trabajo del benchmark
+    """
+    run_dir = os.path.join(workdir, f"index_{uuid.uuid4().hex[:8]}")
+    Config.CHROMA_DIR = os.path.join(run_dir, "chroma_db")
+    Config.EMBEDDING_CACHE_PATH = os.path.join(run_dir, "embedding_cache", "embeddings.sqlite3")
+    Config.CONVERSATION_STORE_PATH = os.path.join(run_dir, "conversations", "checkpoints.sqlite3")
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Memoria residente máxima del proceso hasta el momento, en MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB; macOS informa bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def measure(name: str, iterations: int, run: Callable[[], Any],
+            setup: Optional[Callable[[], Any]] = None, trace_memory: bool = False,
+            quiet: bool = True) -> Dict[str, Any]:
+    """
+    Ejecuta un escenario varias veces y resume sus latencias y memoria
+
+    Args:
+        name: Nombre del escenario
+        iterations: Repeticiones medidas
+        run: Operación a medir
+        setup: Preparación antes de cada repetición (no se mide)
+        trace_memory: Medir el pico de memoria de Python con tracemalloc (más lento)
+        quiet: Silenciar los mensajes del sistema durante la medición
+
+    Returns:
+        Dict: Percentiles p50/p95/p99, media, máximo (ms) y memoria (MB)
+    """
+    durations = []
+    output = io.StringIO() if quiet else sys.stdout
+    if trace_memory:
+        tracemalloc.start()
+
+    with contextlib.redirect_stdout(output):
+        for _ in range(iterations):
+            if setup:
+                setup()
+            started = time.perf_counter()
+            run()
+            durations.append((time.perf_counter() - started) * 1000)
+
+    python_peak = None
+    if trace_memory:
+        python_peak = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+
+    values = np.asarray(durations)
+    return {
+        "scenario": name,
+        "iterations": iterations,
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "max_ms": round(float(values.max()), 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "python_peak_mb": python_peak
+    }
+
+
+def run_scenarios(workdir: str, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    Ejecuta los escenarios seleccionados en orden
+
+    Args:
+        workdir: Directorio de trabajo del benchmark
+        args: Argumentos de la línea de comandos
+
+    Returns:
+        List[Dict]: Resultados de cada escenario
+    """
+    selected = [name for name in SCENARIOS if name in args.scenarios]
+    queries = build_queries(max(args.iterations, 1), args.seed)
+    results = []
+    options = {"trace_memory": args.trace_memory, "quiet": not args.verbose}
+
+    def report(result: Dict[str, Any]):
+        results.append(result)
+        print(format_row(result), flush=True)
+
+    print(format_header())
+
+    if "load_all_documents" in selected:
+        loader = DataLoader()
+        report(measure("load_all_documents", args.load_iterations,
+                       lambda: loader.load_all_documents(Config.CASE_LOAD_BATCH_SIZE), **options))
+
+    if "initialize_cold" in selected:
+        report(measure("initialize_cold", args.load_iterations,
+                       lambda: rag_system.RAGSystem().initialize(),
+                       setup=lambda: reset_index(workdir), **options))
+
+    # Los escenarios siguientes usan un índice ya construido
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not os.path.exists(Config.CHROMA_DIR):
+            rag_system.RAGSystem().initialize()
+
+    if "initialize_warm" in selected:
+        report(measure("initialize_warm", args.load_iterations,
+                       lambda: rag_system.RAGSystem().initialize(), **options))
+
+    if {"retrieval", "retrieval_cached", "retrieval_concurrent"} & set(selected):
+        with contextlib.redirect_stdout(io.StringIO()):
+            system = rag_system.RAGSystem()
+            system.initialize()
+            system.warm_up()
+        query_iter = iter(queries * 2)
+
+        if "retrieval" in selected:
+            # Caché vacía antes de cada consulta: embedding + búsqueda en ambas colecciones
+            report(measure("retrieval", args.iterations,
+                           lambda: system.retrieve_documents(next(query_iter)),
+                           setup=system.query_cache.invalidate, **options))
+        if "retrieval_cached" in selected:
+            cached_query = queries[0]
+            system.retrieve_documents(cached_query)
+            report(measure("retrieval_cached", args.iterations,
+                           lambda: system.retrieve_documents(cached_query), **options))
+        if "retrieval_concurrent" in selected:
+            # Ráfagas de consultas simultáneas por la ruta asíncrona (la de la API);
+            # cada medición es la duración de la ráfaga completa
+            burst_queries = build_queries(args.iterations * args.concurrency, args.seed + 1)
+            bursts = iter([burst_queries[index:index + args.concurrency]
+                           for index in range(0, len(burst_queries), args.concurrency)])
+
+            async def burst():
+                await asyncio.gather(*(system.aretrieve_documents(query) for query in next(bursts)))
+
+            report(measure("retrieval_concurrent", args.iterations, lambda: asyncio.run(burst()),
+                           setup=system.query_cache.invalidate, **options))
+
+    if "classify_query" in selected or "chat" in selected:
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent = LegalAgent()
+            agent.initialize()
+            agent.warm_up()
+
+        if "classify_query" in selected:
+            classify_iter = iter(queries * (args.classify_iterations // len(queries) + 1))
+            report(measure("classify_query", args.classify_iterations,
+                           lambda: agent._classify_query(next(classify_iter)), **options))
+        if "chat" in selected:
+            chat_iter = iter(queries * 2)
+            # Una conversación nueva por consulta para que el historial no crezca entre mediciones
+            report(measure("chat", args.iterations,
+                           lambda: agent.chat(next(chat_iter), thread_id=str(uuid.uuid4())), **options))
+
+    return results
+
+
+def format_header() -> str:
+    columns = ("escenario", "n", "p50 ms", "p95 ms", "p99 ms", "media ms", "RSS MB", "py MB")
+    return f"{columns[0]:<20}{columns[1]:>6}" + "".join(f"{column:>11}" for column in columns[2:])
+
+
+def format_row(result: Dict[str, Any]) -> str:
+    values = [result["p50_ms"], result["p95_ms"], result["p99_ms"], result["mean_ms"],
+              result["peak_rss_mb"], result["python_peak_mb"]]
+    cells = "".join(f"{'-' if value is None else value:>11}" for value in values)
+    return f"{result['scenario']:<20}{result['iterations']:>6}{cells}"
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks del sistema RAG con modelos de Ollama simulados (sin servidor)"
+    )
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS),
+                        help="Escenarios a ejecutar (por defecto todos)")
+    parser.add_argument("--rows", type=int, default=1000, help="Fallos del CSV sintético")
+    parser.add_argument("--chunks-per-row", type=int, default=3)
+    parser.add_argument("--words-per-chunk", type=int, default=250)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=50, help="Repeticiones de retrieval y chat")
+    parser.add_argument("--load-iterations", type=int, default=3, help="Repeticiones de carga e inicialización")
+    parser.add_argument("--classify-iterations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16, help="Consultas por ráfaga en retrieval_concurrent")
+    parser.add_argument("--dimensions", type=int, default=768, help="Dimensión de los embeddings simulados")
+    parser.add_argument("--embed-call-latency", type=float, default=0.0, help="ms por solicitud de embeddings")
+    parser.add_argument("--embed-text-latency", type=float, default=0.0, help="ms por texto embebido")
+    parser.add_argument("--response-tokens", type=int, default=60, help="Tokens de cada respuesta simulada")
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="ms antes del primer token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="ms por token generado")
+    parser.add_argument("--embedding-cache", action="store_true", help="Usar la caché persistente de embeddings")
+    parser.add_argument("--trace-memory", action="store_true", help="Medir el pico de memoria de Python")
+    parser.add_argument("--workdir", help="Directorio de trabajo (por defecto uno temporal que se elimina)")
+    parser.add_argument("--json", dest="json_path", help="Guardar los resultados en un archivo JSON")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los mensajes del sistema")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag_bench_")
+    os.makedirs(workdir, exist_ok=True)
+
+    try:
+        total_chunks = configure(workdir, args)
+        print(f"Corpus sintético: {args.rows} fallos, {total_chunks} chunks "
+              f"({args.duplicate_ratio:.0%} casi duplicados) en {workdir}")
+        results = run_scenarios(workdir, args)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "parameters": {key: value for key, value in vars(args).items() if key != "json_path"},
+                "chunks": total_chunks,
+                "results": results
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Resultados guardados en {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import csv
+import random
+from typing import List
+
+# Vocabulario jurídico para construir textos de sentencias verosímiles
+_VOCABULARY = """
+consumidor proveedor garantía legal producto defectuoso devolución dinero reparación
+cambio retracto contrato servicio cobro indebido publicidad engañosa información veraz
+oportuna precio tarifa cláusula abusiva adhesión seguridad consumo infracción multa
+indemnización perjuicio daño moral juzgado policía local recurso apelación sentencia
+demanda denuncia querella tribunal resolución plazo días hábiles boleta factura compra
+venta tienda comercio electrónico despacho entrega incumplimiento obligación derecho
+""".split()
+_COURTS = (
+    "Corte Suprema",
+    "Corte de Apelaciones de Santiago",
+    "Corte de Apelaciones de Valparaíso",
+    "Corte de Apelaciones de Concepción",
+    "Corte de Apelaciones de San Miguel",
+    "Corte de Apelaciones de Temuco",
+)
+_ARTICLES = [str(number) for number in range(1, 62)] + ["3 bis", "12 A", "16 A"]
+_HEADER = ["Rol", "Fecha_Sentencia", "Corte de origen", "Leyes_mencionadas",
+           "Artículos_mencionados", "Texto_sentencia"]
+
+
+def _chunk(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_VOCABULARY) for _ in range(words)) + "."
+
+
+def generate_cases_csv(path: str, rows: int, chunks_per_row: int = 3, words_per_chunk: int = 250,
+                       duplicate_ratio: float = 0.05, seed: int = 0) -> int:
+    """
+    Genera un CSV de fallos sintéticos con el mismo esquema que el archivo real
+
+    Args:
+        path: Ruta del CSV a escribir
+        rows: Número de fallos
+        chunks_per_row: Chunks promedio por fallo (entre 1 y 2 veces este valor)
+        words_per_chunk: Palabras por chunk (~250 palabras ≈ CHUNK_SIZE_CASES caracteres)
+        duplicate_ratio: Fracción de fallos que repiten casi textualmente uno anterior
+        seed: Semilla para que el corpus sea reproducible
+
+    Returns:
+        int: Número total de chunks generados
+    """
+    rng = random.Random(seed)
+    previous: List[List[str]] = []
+    total_chunks = 0
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(_HEADER)
+
+        for index in range(rows):
+            if previous and rng.random() < duplicate_ratio:
+                # Fallo casi duplicado: mismos chunks con una palabra agregada
+                chunks = [chunk + " reiterado" for chunk in rng.choice(previous)]
+            else:
+                count = rng.randint(1, max(1, chunks_per_row * 2 - 1))
+                chunks = [_chunk(rng, words_per_chunk) for _ in range(count)]
+                if len(previous) < 1000:
+                    previous.append(chunks)
+
+            articles = rng.sample(_ARTICLES, rng.randint(1, 4))
+            writer.writerow([
+                f"{rng.randint(1, 99999)}-{rng.randint(2010, 2024)}-{index}",
+                f"{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-{rng.randint(2010, 2024)}",
+                rng.choice(_COURTS),
+                "['Ley 19.496']",
+                str([f"Art. {article}" for article in articles]),
+                repr(chunks)
+            ])
+            total_chunks += len(chunks)
+
+    return total_chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un CSV de fallos sintéticos")
+    parser.add_argument("path", help="Ruta del CSV a escribir")
+    parser.add_argument("--rows", type=int, default=1000, help="Número de fallos")
+    parser.add_argument("--chunks-per-row", type=int, default=3)
+    parser.add_argument("--words-per-chunk", type=int, default=250)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    total = generate_cases_csv(args.path, args.rows, args.chunks_per_row, args.words_per_chunk,
+                               args.duplicate_ratio, args.seed)
+    print(f"Generados {args.rows} fallos ({total} chunks) en {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,18 @@
 import sys
 import os
+import threading
 from datetime import datetime
 
 # Añadir el directorio src al path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.legal_agent import LegalAgent
-
 class LegalAgentInterface:
     """Interfaz interactiva para el agente legal"""
     
     def __init__(self):
-        self.agent = LegalAgent()
+        # El agente se crea después de mostrar la bienvenida: importar LangChain,
+        # LangGraph y Chroma toma varios segundos
+        self.agent = None
         self.running = False
     
     def display_welcome(self):
@@ -74,10 +75,61 @@ class LegalAgentInterface:
         print(f"Thread ID actual: {status.get('thread_id', 'N/A')}")
         print(f"Mensajes en historial: {status.get('messages_count', 0)}")
         
+        if 'conversation_store' in status:
+            store = status['conversation_store']
+            print(f"Conversaciones guardadas: {store['threads']} ({store['expired']} expiradas), "
+                  f"caché {store['cache_bytes'] / 1024:.0f}/{store['cache_max_bytes'] / 1024:.0f} KB "
+                  f"({store['cache_hits']} aciertos, {store['cache_misses']} fallos)")
+        
         rag_status = status['rag_system_status']
         print(f"Documentos de ley: {rag_status.get('law_docs_count', 'N/A')}")
         print(f"Documentos de casos: {rag_status.get('case_docs_count', 'N/A')}")
         
+        if 'query_cache' in rag_status:
+            cache = rag_status['query_cache']
+            print(f"Caché de consultas: {cache['hits']} aciertos, {cache['misses']} fallos, {cache['entries']} entradas")
+        
+        if 'query_batching' in rag_status:
+            batching = rag_status['query_batching']
+            print(f"Embeddings de consultas agrupados: {batching['queries']} consultas en "
+                  f"{batching['batches']} llamadas ({batching['avg_batch_size']} por lote)")
+        
+        if 'llm_scheduler' in rag_status:
+            scheduler = rag_status['llm_scheduler']
+            queue_wait = rag_status.get('metrics', {}).get('queue_wait', {})
+            print(f"LLM: {scheduler['in_flight']}/{scheduler['max_in_flight']} llamadas en curso")
+            for priority, queued in scheduler['queued'].items():
+                wait = queue_wait.get(priority, {})
+                print(f"  {priority}: {queued} en cola, espera p50/p95 {wait.get('p50_ms', 0):.0f} / "
+                      f"{wait.get('p95_ms', 0):.0f} ms, {scheduler['rejected'][priority]} rechazadas por "
+                      f"cola llena, {scheduler['timeouts'][priority]} por tiempo de espera")
+        
+        if 'near_duplicates' in rag_status:
+            dups = rag_status['near_duplicates']
+            print(f"Fallos casi duplicados: {dups['duplicates']} de {dups['total_chunks']} chunks "
+                  f"(compresión {dups['compression_ratio']:.2f}x)")
+        
+        if 'citation_graph' in rag_status:
+            graph = rag_status['citation_graph']
+            mode = rag_status.get('config', {}).get('case_retrieval_mode', 'vector')
+            print(f"Grafo de citas: {graph['articles']} artículos, {graph['edges']} enlaces a fallos "
+                  f"(búsqueda de fallos: {mode})")
+        
+        if 'context_packing' in rag_status:
+            packing = rag_status['context_packing']
+            print(f"Contexto: {packing['last_tokens']} tokens en la última respuesta, "
+                  f"{packing['avg_tokens']} en promedio (presupuesto {packing['budget']})")
+        
+        if rag_status.get('metrics', {}).get('stages'):
+            metrics = rag_status['metrics']
+            print("Latencia por etapa (p50 / p95):")
+            for stage, stats in metrics['stages'].items():
+                print(f"  {stage}: {stats['p50_ms']:.0f} / {stats['p95_ms']:.0f} ms ({stats['count']} mediciones)")
+            for stage, usage in metrics['llm'].items():
+                print(f"  LLM {stage}: {usage.get('avg_input_tokens', 0):.0f} tokens de entrada, "
+                      f"{usage.get('avg_output_tokens', 0):.0f} de salida, "
+                      f"{usage.get('avg_tokens_per_second', 0):.1f} tokens/s en promedio")
+        
         # Mostrar configuración si está disponible
         if 'config' in rag_status:
             config = rag_status['config']
@@ -197,6 +249,57 @@ class LegalAgentInterface:
         
         return False
     
+    def display_answer_header(self):
+        """Muestra el encabezado de la respuesta"""
+        print("\n" + "="*60)
+        print("RESPUESTA DEL AGENTE LEGAL")
+        print("="*60)
+    
+    def stream_response(self, user_input: str) -> dict:
+        """
+        Muestra la respuesta a medida que el agente la genera
+        
+        Args:
+            user_input: Consulta del usuario
+            
+        Returns:
+            dict: Respuesta completa (igual a la de chat)
+        """
+        response = {}
+        header_shown = False
+        
+        for event in self.agent.stream_chat(user_input):
+            if event["type"] == "token":
+                if not header_shown:
+                    self.display_answer_header()
+                    header_shown = True
+                print(event["content"], end="", flush=True)
+            elif event["type"] == "end":
+                response = event
+        
+        print()
+        return response
+    
+    def display_sources(self, response: dict):
+        """Muestra las fuentes consultadas de una respuesta"""
+        sources = response.get("sources") or {}
+        if not (sources.get("articulos") or sources.get("casos")):
+            return
+        
+        print("\n" + "-"*40)
+        print("FUENTES CONSULTADAS")
+        print("-"*40)
+        
+        if sources.get("articulos"):
+            print("Artículos de ley:")
+            for art in sources["articulos"]:
+                print(f"• {art}")
+        
+        if sources.get("casos"):
+            print("\nCasos judiciales:")
+            for caso in sources["casos"]:
+                print(f"• {caso}")
+    
     def run(self):
         """Ejecuta la interfaz interactiva"""
         try:
@@ -205,8 +308,13 @@ class LegalAgentInterface:
             
             # Inicializar agente
             print("\nInicializando sistema...")
+            from src.legal_agent import LegalAgent
+            self.agent = LegalAgent()
             self.agent.initialize()
             
+            # Las bases vectoriales se abren mientras el usuario escribe la primera consulta
+            threading.Thread(target=self.agent.warm_up, daemon=True).start()
+            
             print("Sistema listo. Puedes empezar a hacer consultas.")
             
             self.running = True
@@ -226,29 +334,15 @@ class LegalAgentInterface:
                     
                     # Procesar consulta normal
                     print("\nProcesando...")
-                    response = self.agent.chat(user_input)
-                    
-                    # Mostrar respuesta
-                    print("\n" + "="*60)
-                    print("RESPUESTA DEL AGENTE LEGAL")
-                    print("="*60)
-                    print(response["answer"])
+                    if self.agent.config.STREAM_RESPONSES:
+                        response = self.stream_response(user_input)
+                    else:
+                        response = self.agent.chat(user_input)
+                        self.display_answer_header()
+                        print(response["answer"])
                     
                     # Mostrar fuentes si existen (solo en fase 3)
-                    if response.get("sources") and (response.get("sources", {}).get("articulos") or response.get("sources", {}).get("casos")):
-                        print("\n" + "-"*40)
-                        print("FUENTES CONSULTADAS")
-                        print("-"*40)
-                        
-                        if response["sources"].get("articulos"):
-                            print("Artículos de ley:")
-                            for art in response["sources"]["articulos"]:
-                                print(f"• {art}")
-                        
-                        if response["sources"].get("casos"):
-                            print("\nCasos judiciales:")
-                            for caso in response["sources"]["casos"]:
-                                print(f"• {caso}")
+                    self.display_sources(response)
                 
                 except KeyboardInterrupt:
                     print("\n\nSaliendo del programa...")
@@ -0,0 +1,485 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+# (tipo, bytes) tal como los produce serde.dumps_typed
+Typed = Tuple[str, bytes]
+
+
+class _Entry:
+    """Último checkpoint de una conversación, serializado, en la caché en memoria"""
+
+    __slots__ = ("checkpoint_id", "parent_id", "checkpoint", "metadata", "writes", "size", "touched")
+
+    def __init__(self, checkpoint_id: str, parent_id: Optional[str], checkpoint: Typed, metadata: Typed,
+                 writes: List[Tuple[str, str, Typed]]):
+        self.checkpoint_id = checkpoint_id
+        self.parent_id = parent_id
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        self.writes = writes
+        self.size = len(checkpoint[1]) + len(metadata[1]) + sum(len(value[1]) for _, _, value in writes)
+        # Última vez que se registró actividad de la conversación en threads.last_access
+        self.touched = 0.0
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+    """
+    Checkpointer de LangGraph persistido en SQLite y acotado en disco y en memoria
+
+    - Compactación: al guardar un checkpoint se eliminan los anteriores de la misma
+      conversación y sus escrituras pendientes; el agente solo lee el estado más
+      reciente, por lo que cada conversación ocupa un único checkpoint.
+    - TTL: las conversaciones sin actividad (lecturas o escrituras) durante ttl
+      segundos se eliminan en el mantenimiento periódico, que además devuelve al
+      sistema el espacio liberado. Las lecturas renuevan la actividad a lo más una vez
+      por maintenance_interval, la misma resolución con la que se revisa la expiración.
+    - Caché: el último checkpoint de las conversaciones activas se mantiene
+      serializado en un LRU limitado a cache_max_bytes, de modo que leer el estado
+      de una conversación en curso no consulta la base.
+    """
+
+    def __init__(self, path: str, ttl: float, cache_max_bytes: int, maintenance_interval: float):
+        """
+        Args:
+            path: Archivo SQLite
+            ttl: Segundos de inactividad tras los que se elimina una conversación (0: nunca)
+            cache_max_bytes: Bytes máximos de checkpoints serializados en memoria
+            maintenance_interval: Segundos mínimos entre dos pasadas de mantenimiento
+        """
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.cache_max_bytes = cache_max_bytes
+        self.maintenance_interval = maintenance_interval
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # (thread_id, checkpoint_ns) -> _Entry, del menos al más recientemente usado
+        self._cache: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._cache_bytes = 0
+        self._last_maintenance = 0.0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Solo tiene efecto al crear la base: permite liberar páginas con incremental_vacuum
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT,
+                type TEXT NOT NULL,
+                checkpoint BLOB NOT NULL,
+                metadata_type TEXT NOT NULL,
+                metadata BLOB NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB NOT NULL,
+                task_path TEXT NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            CREATE TABLE IF NOT EXISTS threads (
+                thread_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_threads_last_access ON threads(last_access);
+        """)
+        self._conn.commit()
+        self._maintain()
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """
+        Obtiene un checkpoint: el indicado por checkpoint_id o el más reciente de la conversación
+
+        Args:
+            config: Configuración con thread_id (y opcionalmente checkpoint_ns y checkpoint_id)
+
+        Returns:
+            CheckpointTuple: Checkpoint con sus escrituras pendientes, o None si no existe
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        key = (thread_id, checkpoint_ns)
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and checkpoint_id in (None, entry.checkpoint_id):
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                entry = self._load(thread_id, checkpoint_ns, checkpoint_id)
+                if entry is None:
+                    return None
+                if checkpoint_id is None:
+                    self._cache_put(key, entry)
+
+            now = time.time()
+            if checkpoint_id is None and now - entry.touched >= self.maintenance_interval:
+                self._conn.execute("UPDATE threads SET last_access = ? WHERE thread_id = ?", (now, thread_id))
+                self._conn.commit()
+                entry.touched = now
+
+        return self._tuple(thread_id, checkpoint_ns, entry)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        """
+        Lista checkpoints del más reciente al más antiguo (tras compactar, uno por conversación)
+
+        Args:
+            config: Configuración con thread_id para restringir la búsqueda (None: todas)
+            filter: Pares clave-valor que deben coincidir con la metadata
+            before: Solo checkpoints anteriores al de esta configuración
+            limit: Máximo de checkpoints a retornar
+
+        Yields:
+            CheckpointTuple: Checkpoints encontrados
+        """
+        conditions, params = [], []
+        if config is not None:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before is not None and get_checkpoint_id(before):
+            conditions.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                f"metadata_type, metadata FROM checkpoints {where} ORDER BY checkpoint_id DESC",
+                params
+            ).fetchall()
+
+        for thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, blob, metadata_type, metadata in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                values = self.serde.loads_typed((metadata_type, metadata))
+                if not all(values.get(key) == value for key, value in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+
+            with self._lock:
+                writes = self._load_writes(thread_id, checkpoint_ns, checkpoint_id)
+            entry = _Entry(checkpoint_id, parent_id, (type_, blob), (metadata_type, metadata), writes)
+            yield self._tuple(thread_id, checkpoint_ns, entry)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        """
+        Guarda un checkpoint y elimina los anteriores de la misma conversación
+
+        Args:
+            config: Configuración de la conversación (su checkpoint_id es el padre)
+            checkpoint: Checkpoint a guardar
+            metadata: Metadata del checkpoint
+            new_versions: Versiones de canales nuevas (el checkpoint se guarda completo)
+
+        Returns:
+            RunnableConfig: Configuración que apunta al checkpoint guardado
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        entry = _Entry(
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),
+            self.serde.dumps_typed(checkpoint),
+            self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+            []
+        )
+        now = time.time()
+        entry.touched = now
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+                "type, checkpoint, metadata_type, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, entry.checkpoint_id, entry.parent_id, *entry.checkpoint, *entry.metadata)
+            )
+            # Compactación: solo se conserva el checkpoint recién guardado
+            for table in ("checkpoints", "writes"):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id != ?",
+                    (thread_id, checkpoint_ns, entry.checkpoint_id)
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO threads (thread_id, last_access) VALUES (?, ?)", (thread_id, now)
+            )
+            self._conn.commit()
+            self._cache_put((thread_id, checkpoint_ns), entry)
+
+        if now - self._last_maintenance >= self.maintenance_interval:
+            self._maintain()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": entry.checkpoint_id
+            }
+        }
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        """
+        Guarda las escrituras pendientes de una tarea asociadas a un checkpoint
+
+        Args:
+            config: Configuración del checkpoint
+            writes: Pares (canal, valor)
+            task_id: Identificador de la tarea
+            task_path: Ruta de la tarea
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            rows.append((
+                thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                channel, *self.serde.dumps_typed(value), task_path
+            ))
+
+        with self._lock:
+            # Las escrituras especiales (índice negativo) reemplazan a las anteriores; las normales no
+            for conflict, selected in (("REPLACE", [row for row in rows if row[4] < 0]),
+                                       ("IGNORE", [row for row in rows if row[4] >= 0])):
+                self._conn.executemany(
+                    f"INSERT OR {conflict} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, "
+                    "channel, type, value, task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    selected
+                )
+            self._conn.commit()
+            # La entrada en caché queda desactualizada; se recarga en la próxima lectura
+            self._cache_pop((thread_id, checkpoint_ns))
+
+    def delete_thread(self, thread_id: str) -> None:
+        """
+        Elimina todos los checkpoints y escrituras de una conversación
+
+        Args:
+            thread_id: Conversación a eliminar
+        """
+        with self._lock:
+            self._delete_threads([thread_id])
+            self._conn.commit()
+
+    # Las versiones asíncronas ejecutan la implementación síncrona en un hilo: la E/S
+    # de SQLite y la espera del lock no bloquean el event loop
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Versión asíncrona de get_tuple"""
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None,
+                    limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        """Versión asíncrona de list"""
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        """Versión asíncrona de put"""
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        """Versión asíncrona de put_writes"""
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """Versión asíncrona de delete_thread"""
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def prune_expired(self) -> int:
+        """
+        Elimina las conversaciones sin actividad durante más de ttl segundos
+
+        Returns:
+            int: Conversaciones eliminadas
+        """
+        if self.ttl <= 0:
+            return 0
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT thread_id FROM threads WHERE last_access < ?", (time.time() - self.ttl,)
+            ).fetchall()
+            self._delete_threads([row[0] for row in rows])
+            self.expired += len(rows)
+            self._conn.commit()
+        return len(rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene las estadísticas del checkpointer
+
+        Returns:
+            Dict: Conversaciones guardadas y expiradas, y aciertos, fallos, entradas y
+            bytes de la caché en memoria
+        """
+        with self._lock:
+            threads = self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            return {
+                "threads": threads,
+                "expired": self.expired,
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+                "cache_entries": len(self._cache),
+                "cache_bytes": self._cache_bytes,
+                "cache_max_bytes": self.cache_max_bytes
+            }
+
+    def close(self):
+        """Cierra la conexión a la base"""
+        with self._lock:
+            self._conn.close()
+
+    def _maintain(self):
+        """Expira conversaciones inactivas y libera las páginas vacías del archivo"""
+        self._last_maintenance = time.time()
+        expired = self.prune_expired()
+        with self._lock:
+            self._conn.execute("PRAGMA incremental_vacuum")
+            self._conn.commit()
+        if expired:
+            print(f"Conversaciones expiradas: {expired}")
+
+    def _delete_threads(self, thread_ids: List[str]):
+        """Elimina conversaciones de la base y de la caché (requiere el lock)"""
+        for thread_id in thread_ids:
+            for table in ("checkpoints", "writes", "threads"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            for key in [key for key in self._cache if key[0] == thread_id]:
+                self._cache_pop(key)
+
+    def _load(self, thread_id: str, checkpoint_ns: str, checkpoint_id: Optional[str]) -> Optional[_Entry]:
+        """Lee un checkpoint (el más reciente si checkpoint_id es None) con sus escrituras (requiere el lock)"""
+        query = ("SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                 "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?")
+        params: List[Any] = [thread_id, checkpoint_ns]
+        if checkpoint_id:
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        row = self._conn.execute(query + " ORDER BY checkpoint_id DESC LIMIT 1", params).fetchone()
+        if row is None:
+            return None
+
+        checkpoint_id, parent_id, type_, blob, metadata_type, metadata = row
+        writes = self._load_writes(thread_id, checkpoint_ns, checkpoint_id)
+        return _Entry(checkpoint_id, parent_id, (type_, blob), (metadata_type, metadata), writes)
+
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> List[Tuple[str, str, Typed]]:
+        """Escrituras pendientes de un checkpoint en el orden en que se aplican (requiere el lock)"""
+        rows = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+        return [(task_id, channel, (type_, value)) for task_id, channel, type_, value in rows]
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, entry: _Entry) -> CheckpointTuple:
+        """Deserializa una entrada; cada llamada retorna objetos nuevos que el llamador puede modificar"""
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": entry.checkpoint_id
+                }
+            },
+            checkpoint=self.serde.loads_typed(entry.checkpoint),
+            metadata=self.serde.loads_typed(entry.metadata),
+            parent_config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": entry.parent_id
+                }
+            } if entry.parent_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed(value)) for task_id, channel, value in entry.writes]
+        )
+
+    def _cache_put(self, key: Tuple[str, str], entry: _Entry):
+        """Guarda una entrada en la caché desalojando las menos usadas (requiere el lock)"""
+        self._cache_pop(key)
+        if entry.size > self.cache_max_bytes:
+            return
+        self._cache[key] = entry
+        self._cache_bytes += entry.size
+        while self._cache_bytes > self.cache_max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted.size
+
+    def _cache_pop(self, key: Tuple[str, str]):
+        """Quita una entrada de la caché si existe (requiere el lock)"""
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._cache_bytes -= entry.size
+
+
+def create_checkpointer(config) -> BaseCheckpointSaver:
+    """
+    Crea el checkpointer de las conversaciones según la configuración
+
+    Args:
+        config: Configuración del sistema
+
+    Returns:
+        BaseCheckpointSaver: SQLiteCheckpointer, o MemorySaver si la persistencia está deshabilitada
+    """
+    if not config.CONVERSATION_STORE_ENABLED:
+        return MemorySaver()
+
+    return SQLiteCheckpointer(
+        path=config.CONVERSATION_STORE_PATH,
+        ttl=config.CONVERSATION_TTL,
+        cache_max_bytes=config.CONVERSATION_CACHE_MAX_BYTES,
+        maintenance_interval=config.CONVERSATION_MAINTENANCE_INTERVAL
+    )
@@ -0,0 +1,137 @@
+import os
+import pickle
+from array import array
+from typing import Dict, Iterable, List, Optional
+from langchain_core.documents import Document
+from .metadata_index import parse_articles
+
+
+class CitationGraph:
+    """
+    Grafo de citas artículo → fallos construido al indexar
+
+    Cada chunk de fallo se enlaza con los artículos que su fallo menciona
+    (Articulos_mencionados). Para cada artículo se guardan las posiciones de los
+    chunks que lo citan y el número de fallos (Rol) distintos que lo citan, de modo
+    que los fallos relacionados con un artículo se obtienen con una búsqueda en la
+    lista de adyacencia en lugar de una búsqueda vectorial sobre toda la colección.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        # artículo -> posiciones de los chunks que lo citan, en arrays compactos
+        self.by_article: Dict[str, array] = {}
+        # artículo -> número de fallos distintos que lo citan
+        self.citation_counts: Dict[str, int] = {}
+        self._seen_citations = set()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, doc_id: str, document: Document):
+        """
+        Agrega un chunk de fallo y sus aristas al grafo
+
+        Args:
+            doc_id: Id del chunk en la colección
+            document: Documento de fallo
+        """
+        metadata = document.metadata
+        if "Articulos_normalizados" in metadata:
+            articles = list(filter(None, str(metadata["Articulos_normalizados"] or "").split("|")))
+        else:
+            articles = parse_articles(metadata.get("Articulos_mencionados"))
+
+        position = len(self.ids)
+        self.ids.append(doc_id)
+        rol = str(metadata.get("Rol", doc_id))
+
+        for article in articles:
+            self.by_article.setdefault(article, array("I")).append(position)
+            if (article, rol) not in self._seen_citations:
+                self._seen_citations.add((article, rol))
+                self.citation_counts[article] = self.citation_counts.get(article, 0) + 1
+
+    def neighbours(self, articles: Iterable[str], max_candidates: int) -> List[str]:
+        """
+        Obtiene los chunks de fallos que citan alguno de los artículos
+
+        Los artículos se recorren en el orden recibido (el de relevancia), por lo que
+        si se alcanza el límite se conservan los vecinos de los artículos más relevantes.
+
+        Args:
+            articles: Claves normalizadas de artículo ("12", "3 bis")
+            max_candidates: Máximo de ids a retornar
+
+        Returns:
+            List[str]: Ids de los chunks vecinos, sin repetir
+        """
+        seen, candidates = set(), []
+        for article in articles:
+            for position in self.by_article.get(article, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                candidates.append(self.ids[position])
+                if len(candidates) >= max_candidates:
+                    return candidates
+        return candidates
+
+    def get_stats(self) -> Dict[str, object]:
+        """
+        Obtiene el tamaño del grafo y los artículos más citados
+
+        Returns:
+            Dict: Artículos, aristas, chunks enlazados y los 5 artículos con más fallos
+        """
+        most_cited = sorted(self.citation_counts.items(), key=lambda item: item[1], reverse=True)[:5]
+        return {
+            "articles": len(self.by_article),
+            "edges": sum(len(positions) for positions in self.by_article.values()),
+            "documents": len(self.ids),
+            "most_cited": [{"articulo": article, "fallos": count} for article, count in most_cited]
+        }
+
+    def save(self, path: str):
+        """
+        Guarda el grafo en disco
+
+        Args:
+            path: Ruta del archivo
+        """
+        data = {
+            "ids": self.ids,
+            "by_article": self.by_article,
+            "citation_counts": self.citation_counts
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["CitationGraph"]:
+        """
+        Carga un grafo guardado con save
+
+        Args:
+            path: Ruta del archivo
+
+        Returns:
+            CitationGraph: Grafo listo para consultar, o None si no existe o no se puede leer
+        """
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"Error cargando grafo de citas {path}: {e}")
+            return None
+
+        graph = cls()
+        graph.ids = data["ids"]
+        graph.by_article = data["by_article"]
+        graph.citation_counts = data["citation_counts"]
+        return graph
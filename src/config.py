@@ -8,6 +8,22 @@ class Config:
     LLM_MODEL = "llama3:8b"
     EMBEDDING_MODEL = "nomic-embed-text"
     
+    # Cliente HTTP de Ollama, compartido por el modelo de chat y el de embeddings
+    OLLAMA_BASE_URL = "http://localhost:11434"
+    OLLAMA_KEEP_ALIVE = 1800  # Segundos que Ollama mantiene los modelos en memoria tras la última solicitud (-1: siempre)
+    OLLAMA_TIMEOUT = 300.0  # Segundos máximos de espera por respuesta (la generación de una respuesta larga)
+    OLLAMA_CONNECT_TIMEOUT = 5.0
+    OLLAMA_RETRIES = 2  # Reintentos de conexiones fallidas (no se repiten solicitudes ya enviadas)
+    OLLAMA_MAX_CONNECTIONS = 16  # Debe cubrir EMBEDDING_CONCURRENCY más las consultas simultáneas
+    OLLAMA_MAX_KEEPALIVE_CONNECTIONS = 16  # Conexiones ociosas que se conservan abiertas
+    OLLAMA_KEEPALIVE_EXPIRY = 60.0  # Segundos antes de cerrar una conexión ociosa
+    WARM_UP_MODELS = True  # warm_up carga ambos modelos en Ollama antes de la primera consulta
+    
+    # Planificador de llamadas al LLM (prioridad: contextualize > direct > draft)
+    LLM_MAX_IN_FLIGHT = 2  # Llamadas simultáneas a Ollama; conviene igualarlo a OLLAMA_NUM_PARALLEL del servidor (0: sin límite)
+    LLM_QUEUE_LIMITS = {"contextualize": 32, "direct": 16, "draft": 4}  # Solicitudes en espera por clase; las demás se rechazan (429)
+    LLM_QUEUE_TIMEOUT = 30.0  # Segundos máximos en cola antes de rechazar la solicitud (503)
+    
     # Configuración de chunking
     CHUNK_SIZE_LAW = 1000
     CHUNK_OVERLAP_LAW = 100
@@ -19,8 +35,78 @@ class Config:
     LAW_FILE = os.path.join(DATA_DIR, "Ley_consumidor_limpio.csv")
     CASES_FILE = os.path.join(DATA_DIR, "Fallos_judiciales_ley_19.496.csv")
     
+    # Corpus precompilado (generar con: python -m src.corpus_compiler)
+    COMPILED_CORPUS_DIR = os.path.join(DATA_DIR, "compiled")
+    USE_COMPILED_CORPUS = True  # Se ignora automáticamente si no existe o está desactualizado
+    
+    # Configuración de la base vectorial
+    CHROMA_DIR = "./chroma_db"
+    LAW_COLLECTION = "leyes_collection"
+    CASES_COLLECTION = "fallos_collection"
+    LAW_VECTOR_BACKEND = "numpy"  # "numpy" (matriz en memoria, ideal para pocos cientos de chunks) o "chroma"
+    CASES_VECTOR_BACKEND = "chroma"
+    INCREMENTAL_INDEXING = True  # Solo embebe chunks nuevos/modificados y elimina los que ya no existen
+    INDEX_WRITE_BATCH_SIZE = 5000  # Menor que el límite de 5461 de Chroma
+    CASE_LOAD_BATCH_SIZE = 100  # Filas del CSV de fallos leídas por lote al indexar
+
+    # Detección de chunks de fallos casi duplicados al indexar (MinHash + LSH)
+    NEAR_DUPLICATE_DETECTION = True  # Indexa un representante por grupo de chunks casi idénticos
+    NEAR_DUPLICATE_THRESHOLD = 0.85  # Similitud de Jaccard estimada mínima para considerar duplicado
+    NEAR_DUPLICATE_NUM_PERM = 64  # Permutaciones de la firma MinHash
+    NEAR_DUPLICATE_BANDS = 16  # Bandas LSH (NUM_PERM debe ser múltiplo)
+    NEAR_DUPLICATE_SHINGLE_SIZE = 5  # Palabras por shingle
+    
+    # Pipeline de embeddings para la construcción de índices
+    EMBEDDING_CONCURRENCY = max(2, min(8, os.cpu_count() or 2))  # Solicitudes de embeddings simultáneas
+    EMBEDDING_BATCH_SIZE = 64  # Tamaño de lote inicial, se ajusta según el throughput
+    EMBEDDING_BATCH_SIZE_MIN = 8
+    EMBEDDING_BATCH_SIZE_MAX = 512
+    EMBEDDING_MAX_RETRIES = 3  # Reintentos de un documento individual antes de abortar
+    INDEX_PROGRESS_INTERVAL = 10  # Segundos entre reportes de progreso
+    
+    # Caché persistente de embeddings (clave: modelo + sha256 del texto)
+    EMBEDDING_CACHE_ENABLED = True
+    EMBEDDING_CACHE_PATH = "./embedding_cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES = 200000  # ~3 KB por entrada con nomic-embed-text
+    
+    # Conversaciones persistidas (checkpoints de LangGraph en SQLite)
+    CONVERSATION_STORE_ENABLED = True  # False: solo en memoria (MemorySaver), se pierden al reiniciar
+    CONVERSATION_STORE_PATH = "./conversations/checkpoints.sqlite3"
+    CONVERSATION_TTL = 7 * 24 * 3600  # Segundos sin actividad tras los que se elimina una conversación (0: nunca)
+    CONVERSATION_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Memoria para el último estado de las conversaciones activas
+    CONVERSATION_MAINTENANCE_INTERVAL = 600  # Segundos entre pasadas de expiración y liberación de espacio
+    
     # Configuración de retrieval
     RETRIEVAL_K = 4  # Número de documentos a recuperar
+    RETRIEVAL_WORKERS = 4  # Hilos para buscar en ambas colecciones en paralelo
+    QUERY_CACHE_MAX_ENTRIES = 1024  # Consultas recientes con embedding y resultados en caché
+    QUERY_EMBEDDING_BATCH_WINDOW_MS = 5  # Espera para agrupar embeddings de consultas concurrentes (0: sin agrupar)
+    QUERY_EMBEDDING_BATCH_MAX = 16  # Consultas por lote; al completarlo se envía sin esperar la ventana
+    RETRIEVAL_MODE = "hybrid"  # "dense" (solo embeddings) o "hybrid" (embeddings + BM25)
+    HYBRID_CANDIDATES = 20  # Candidatos de cada método antes de fusionar
+    HYBRID_RRF_K = 60  # Constante de Reciprocal Rank Fusion
+    # "vector": busca fallos en toda la colección; "graph": usa los fallos que citan los artículos recuperados
+    CASE_RETRIEVAL_MODE = "vector"
+    CITATION_GRAPH_MAX_CANDIDATES = 2000  # Máximo de chunks vecinos a re-rankear en modo "graph"
+
+    # Empaquetado del contexto recuperado
+    CONTEXT_TOKEN_BUDGET = 1800  # Tokens máximos de artículos y fallos en el prompt
+    CONTEXT_CHUNK_MAX_TOKENS = 400  # Los fragmentos más largos se recortan alrededor de la zona relevante
+    CONTEXT_MIN_CHUNK_TOKENS = 60  # No se agregan extractos más cortos
+
+    # Configuración de generación
+    STREAM_RESPONSES = True  # La CLI muestra la respuesta a medida que se genera
+    # Reescritura de consultas de seguimiento antes del retrieval:
+    # "always" reescribe siempre que haya historial (una llamada extra al LLM),
+    # "auto" la omite cuando la consulta es autocontenida y
+    # "fold" nunca reescribe: el prompt de respuesta resuelve las referencias al historial
+    CONTEXTUALIZE_MODE = "auto"
+    CONTEXTUALIZE_MIN_WORDS = 6  # En modo "auto", consultas más cortas se consideran dependientes del historial
+
+    # Historial de conversación
+    HISTORY_RECENT_TURNS = 3  # Turnos (pregunta + respuesta) que se conservan textuales
+    HISTORY_TOKEN_BUDGET = 1500  # Tokens máximos del historial en cada prompt
+    HISTORY_SUMMARY_MAX_TOKENS = 300  # Tamaño máximo del resumen de los turnos antiguos
     
     # Prompts
     SYSTEM_PROMPT = """
@@ -67,6 +153,19 @@ class Config:
     **Respuesta:**
     """
     
+    SUMMARY_PROMPT = """
+    Actualiza el resumen de una conversación entre un usuario y un asistente legal
+    incorporando los mensajes nuevos. Conserva los hechos del caso del usuario, los
+    artículos y fallos mencionados y las conclusiones. Responde solo con el resumen,
+    en un máximo de {max_words} palabras.
+
+    Resumen actual:
+    {summary}
+
+    Mensajes nuevos:
+    {new_lines}
+    """
+    
     CONTEXTUALIZE_PROMPT = """  # Prompt para contextualizar preguntas
     Dada la siguiente conversación y una pregunta de seguimiento, reformula la pregunta de seguimiento 
     para que sea una pregunta independiente, en su idioma original.
@@ -85,14 +184,30 @@ class Config:
         return {
             "llm_model": cls.LLM_MODEL,
             "embedding_model": cls.EMBEDDING_MODEL,
+            "ollama_base_url": cls.OLLAMA_BASE_URL,
+            "ollama_keep_alive": cls.OLLAMA_KEEP_ALIVE,
+            "llm_max_in_flight": cls.LLM_MAX_IN_FLIGHT,
             "chunk_size_law": cls.CHUNK_SIZE_LAW,
             "chunk_overlap_law": cls.CHUNK_OVERLAP_LAW,
             "chunk_size_cases": cls.CHUNK_SIZE_CASES,
             "chunk_overlap_cases": cls.CHUNK_OVERLAP_CASES,
             "retrieval_k": cls.RETRIEVAL_K,
+            "retrieval_mode": cls.RETRIEVAL_MODE,
+            "case_retrieval_mode": cls.CASE_RETRIEVAL_MODE,
+            "contextualize_mode": cls.CONTEXTUALIZE_MODE,
+            "history_token_budget": cls.HISTORY_TOKEN_BUDGET,
+            "context_token_budget": cls.CONTEXT_TOKEN_BUDGET,
+            "chroma_dir": cls.CHROMA_DIR,
+            "law_vector_backend": cls.LAW_VECTOR_BACKEND,
+            "cases_vector_backend": cls.CASES_VECTOR_BACKEND,
+            "incremental_indexing": cls.INCREMENTAL_INDEXING,
+            "near_duplicate_detection": cls.NEAR_DUPLICATE_DETECTION,
+            "embedding_concurrency": cls.EMBEDDING_CONCURRENCY,
+            "embedding_cache_enabled": cls.EMBEDDING_CACHE_ENABLED,
             "data_dir": cls.DATA_DIR,
             "law_file": cls.LAW_FILE,
-            "cases_file": cls.CASES_FILE
+            "cases_file": cls.CASES_FILE,
+            "use_compiled_corpus": cls.USE_COMPILED_CORPUS
         }
     
     @classmethod
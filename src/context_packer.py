@@ -0,0 +1,179 @@
+import re
+import threading
+from typing import Any, Dict, List, Tuple
+from langchain_core.documents import Document
+from .lexical_index import tokenize
+from .tokens import CHARS_PER_TOKEN, estimate_tokens
+
+_SEGMENT_PATTERN = re.compile(r"(?<=[.;:])\s+|\n+")
+# Tokens reservados para los "..." que marcan los cortes al inicio y al final de un extracto
+_CUT_MARKER_TOKENS = 2 * estimate_tokens(" ...")
+
+
+class ContextPacker:
+    """
+    Selecciona y recorta los fragmentos recuperados para que el contexto quepa en un
+    presupuesto de tokens
+
+    Los fragmentos se ordenan por relevancia (posición en el ranking de su colección,
+    ya que los puntajes densos e híbridos no son comparables entre sí) y se agregan
+    hasta llenar el presupuesto. Primero se incluye un fragmento por artículo o Rol y
+    solo después fragmentos adicionales de los mismos. Los fragmentos largos se
+    reemplazan por un extracto alrededor de las oraciones que más términos comparten
+    con la consulta.
+    """
+
+    def __init__(self, token_budget: int, chunk_max_tokens: int, min_chunk_tokens: int):
+        self.token_budget = token_budget
+        self.chunk_max_tokens = chunk_max_tokens
+        self.min_chunk_tokens = min_chunk_tokens
+        self.packed_contexts = 0
+        self.total_tokens = 0
+        self.last_tokens = 0
+        self.total_dropped = 0
+        self._lock = threading.Lock()
+
+    def pack(self, query: str, law_results: List[Tuple[Document, float]],
+             case_results: List[Tuple[Document, float]]) -> Dict[str, Any]:
+        """
+        Empaqueta los documentos recuperados dentro del presupuesto
+
+        Args:
+            query: Consulta usada para elegir los extractos
+            law_results: Artículos recuperados, del más al menos relevante
+            case_results: Fallos recuperados, del más al menos relevante
+
+        Returns:
+            Dict: "documents" (documentos a incluir, posiblemente recortados),
+            "tokens" (tokens estimados empaquetados) y "dropped" (fragmentos descartados)
+        """
+        candidates = self._rank_candidates(law_results, case_results)
+        query_terms = set(tokenize(query))
+
+        seen_keys = set()
+        first_pass, second_pass = [], []
+        for document in candidates:
+            key = self._source_key(document)
+            if key in seen_keys:
+                second_pass.append(document)
+            else:
+                seen_keys.add(key)
+                first_pass.append(document)
+
+        packed = []
+        remaining = self.token_budget
+        for document in first_pass + second_pass:
+            limit = min(self.chunk_max_tokens, remaining)
+            if limit < self.min_chunk_tokens:
+                continue
+
+            content = document.page_content
+            if estimate_tokens(content) > limit:
+                content = self._excerpt(content, query_terms, limit)
+                if not content:
+                    continue
+
+            packed.append(Document(id=document.id, page_content=content, metadata=document.metadata))
+            remaining -= estimate_tokens(content)
+
+        tokens = self.token_budget - remaining
+        dropped = len(candidates) - len(packed)
+        with self._lock:
+            self.packed_contexts += 1
+            self.total_tokens += tokens
+            self.last_tokens = tokens
+            self.total_dropped += dropped
+
+        return {"documents": packed, "tokens": tokens, "dropped": dropped}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene las estadísticas de empaquetado
+
+        Returns:
+            Dict: Presupuesto, contextos empaquetados, tokens promedio y del último contexto
+            y fragmentos descartados
+        """
+        with self._lock:
+            return {
+                "budget": self.token_budget,
+                "contexts": self.packed_contexts,
+                "avg_tokens": round(self.total_tokens / self.packed_contexts, 1) if self.packed_contexts else 0.0,
+                "last_tokens": self.last_tokens,
+                "dropped_chunks": self.total_dropped
+            }
+
+    def _rank_candidates(self, law_results: List[Tuple[Document, float]],
+                         case_results: List[Tuple[Document, float]]) -> List[Document]:
+        """Intercala ambas colecciones por posición en el ranking y elimina duplicados"""
+        ranked = [(rank, 0, doc) for rank, (doc, _) in enumerate(law_results)]
+        ranked += [(rank, 1, doc) for rank, (doc, _) in enumerate(case_results)]
+        ranked.sort(key=lambda item: (item[0], item[1]))
+
+        documents, seen_contents = [], set()
+        for _, _, document in ranked:
+            if document.page_content not in seen_contents:
+                seen_contents.add(document.page_content)
+                documents.append(document)
+        return documents
+
+    @staticmethod
+    def _source_key(document: Document) -> Tuple[str, str]:
+        """Identifica la fuente de un fragmento: el artículo de ley o el Rol del fallo"""
+        metadata = document.metadata
+        if metadata.get("tipo") == "fallo":
+            return ("fallo", str(metadata.get("Rol", document.page_content[:50])))
+        return ("ley", str(metadata.get("Articulo", document.page_content[:50])))
+
+    def _excerpt(self, text: str, query_terms: set, max_tokens: int) -> str:
+        """
+        Extrae la zona del texto más relacionada con la consulta sin superar max_tokens
+
+        Se parte de la oración con más términos de la consulta y se agregan oraciones
+        vecinas mientras quepan. Los "..." de los cortes se descuentan del presupuesto
+        antes de elegir las oraciones, de modo que el extracto final no supera max_tokens.
+
+        Args:
+            text: Texto completo del fragmento
+            query_terms: Tokens normalizados de la consulta
+            max_tokens: Tokens máximos del extracto
+
+        Returns:
+            str: Extracto con "..." donde se cortó el texto, o "" si nada cabe
+        """
+        segments = [segment for segment in _SEGMENT_PATTERN.split(text) if segment.strip()]
+        max_tokens -= _CUT_MARKER_TOKENS
+        if not segments or max_tokens <= 0:
+            return ""
+
+        scores = [len(query_terms.intersection(tokenize(segment))) for segment in segments]
+        best = max(range(len(segments)), key=lambda index: scores[index])
+
+        start = end = best
+        used = estimate_tokens(segments[best])
+        if used > max_tokens:
+            # Una sola oración demasiado larga: se corta por caracteres
+            max_chars = int(max_tokens * CHARS_PER_TOKEN)
+            return self._mark_cuts(segments[best][:max_chars], best > 0, True)
+
+        while True:
+            grew = False
+            for candidate in (end + 1, start - 1):
+                if 0 <= candidate < len(segments):
+                    tokens = estimate_tokens(segments[candidate]) + 1
+                    if used + tokens <= max_tokens:
+                        used += tokens
+                        start, end = min(start, candidate), max(end, candidate)
+                        grew = True
+            if not grew:
+                break
+
+        return self._mark_cuts(" ".join(segments[start:end + 1]), start > 0, end < len(segments) - 1)
+
+    @staticmethod
+    def _mark_cuts(text: str, cut_start: bool, cut_end: bool) -> str:
+        """Agrega "..." en los extremos recortados de un extracto"""
+        text = text.strip()
+        if not text:
+            return ""
+        return f"{'... ' if cut_start else ''}{text}{' ...' if cut_end else ''}"
@@ -0,0 +1,249 @@
+import json
+import mmap
+import os
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from langchain_core.documents import Document
+from .config import Config
+from .indexing import hash_file
+
+# Versión del formato del artefacto. Cambiarla invalida los artefactos existentes
+CORPUS_FORMAT_VERSION = 2
+
+# Campos que varían dentro de un mismo fallo y se recalculan al cargar
+CHUNK_FIELDS = ("chunk_index", "total_chunks")
+
+
+class CompiledCorpus:
+    """
+    Lector de un corpus precompilado en formato columnar
+
+    El artefacto consta de tres archivos:
+    - ``<nombre>.text.bin``: textos de los chunks concatenados en UTF-8
+    - ``<nombre>.offsets.bin``: tabla de offsets (uint64) con n + 1 entradas
+    - ``<nombre>.meta.json``: metadatos por grupo (fila del CSV) en columnas
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.directory = directory
+        self.name = name
+        self.meta = {}
+        self.offsets = array("Q")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.meta.json")
+
+    @property
+    def text_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.text.bin")
+
+    @property
+    def offsets_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.offsets.bin")
+
+    @classmethod
+    def open(cls, directory: str, name: str, source_path: str, params: Dict[str, Any]) -> Optional["CompiledCorpus"]:
+        """
+        Abre un corpus compilado si existe y corresponde al archivo de origen
+
+        Args:
+            directory: Directorio de los artefactos
+            name: Nombre del corpus ("leyes" o "fallos")
+            source_path: CSV desde el que se compiló
+            params: Parámetros de chunking usados al compilar
+
+        Returns:
+            CompiledCorpus: Corpus listo para leer, o None si no existe o está desactualizado
+        """
+        corpus = cls(directory, name)
+        if not all(os.path.exists(path) for path in (corpus.meta_path, corpus.text_path, corpus.offsets_path)):
+            return None
+
+        try:
+            with open(corpus.meta_path, "r", encoding="utf-8") as f:
+                corpus.meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if (corpus.meta.get("format_version") != CORPUS_FORMAT_VERSION
+                or corpus.meta.get("params") != params
+                or corpus.meta.get("source_sha256") != hash_file(source_path)):
+            print(f"Corpus compilado de {name} desactualizado; se usará el CSV")
+            return None
+
+        with open(corpus.offsets_path, "rb") as f:
+            corpus.offsets.frombytes(f.read())
+
+        return corpus
+
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+
+    def iter_batches(self, batch_size: int) -> Iterator[List[Document]]:
+        """
+        Genera los documentos por lotes de grupos (filas del CSV original)
+
+        Args:
+            batch_size: Número de grupos por lote
+
+        Yields:
+            List[Document]: Documentos de un lote
+        """
+        columns = self.meta["columns"]
+        group_sizes = self.meta["group_sizes"]
+        chunk_fields = self.meta["chunk_fields"]
+        keys = list(columns.keys())
+
+        if not len(self):
+            return
+
+        with open(self.text_path, "rb") as f:
+            text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                position = 0
+                batch = []
+
+                for group, size in enumerate(group_sizes):
+                    base = {key: columns[key][group] for key in keys}
+                    for chunk_idx in range(size):
+                        metadata = base.copy()
+                        if chunk_fields:
+                            metadata["chunk_index"] = chunk_idx
+                            metadata["total_chunks"] = size
+                        start, end = self.offsets[position], self.offsets[position + 1]
+                        batch.append(Document(
+                            page_content=text[start:end].decode("utf-8"),
+                            metadata=metadata
+                        ))
+                        position += 1
+
+                    if (group + 1) % batch_size == 0:
+                        yield batch
+                        batch = []
+
+                if batch:
+                    yield batch
+            finally:
+                text.close()
+
+    def documents(self) -> List[Document]:
+        """Retorna todos los documentos del corpus"""
+        documents = []
+        for batch in self.iter_batches(batch_size=1000):
+            documents.extend(batch)
+        return documents
+
+
+def write_compiled_corpus(directory: str, name: str, documents: Iterable[Document],
+                          source_path: str, params: Dict[str, Any]) -> int:
+    """
+    Escribe documentos en el formato columnar de CompiledCorpus
+
+    Los documentos consecutivos con los mismos metadatos base se agrupan en una sola
+    fila de metadatos; en los fallos cada grupo comienza con un chunk_index 0.
+
+    Args:
+        directory: Directorio de los artefactos
+        name: Nombre del corpus
+        documents: Documentos producidos por el DataLoader desde el CSV
+        source_path: CSV de origen (se guarda su hash)
+        params: Parámetros de chunking que afectan al contenido
+
+    Returns:
+        int: Número de chunks escritos
+    """
+    os.makedirs(directory, exist_ok=True)
+    corpus = CompiledCorpus(directory, name)
+
+    columns = {}
+    group_sizes = []
+    offsets = array("Q", [0])
+    chunk_fields = None
+    previous_base = None
+
+    tmp_text_path = corpus.text_path + ".tmp"
+    with open(tmp_text_path, "wb") as text_file:
+        for document in documents:
+            metadata = document.metadata
+            has_chunk_fields = "chunk_index" in metadata
+            if chunk_fields is None:
+                chunk_fields = has_chunk_fields
+            elif chunk_fields != has_chunk_fields:
+                raise ValueError(f"Documentos de {name} con campos de chunk inconsistentes")
+
+            base = {key: value for key, value in metadata.items() if key not in CHUNK_FIELDS}
+            if chunk_fields:
+                starts_group = previous_base is None or metadata["chunk_index"] == 0
+            else:
+                starts_group = previous_base is None or base != previous_base
+
+            if starts_group:
+                if set(base) != set(columns) and columns:
+                    raise ValueError(f"Documentos de {name} con metadatos heterogéneos")
+                for key, value in base.items():
+                    columns.setdefault(key, []).append(value)
+                group_sizes.append(0)
+                previous_base = base
+
+            group_sizes[-1] += 1
+            encoded = document.page_content.encode("utf-8")
+            text_file.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+
+    with open(corpus.offsets_path + ".tmp", "wb") as f:
+        offsets.tofile(f)
+
+    meta = {
+        "format_version": CORPUS_FORMAT_VERSION,
+        "source_sha256": hash_file(source_path),
+        "params": params,
+        "chunk_fields": bool(chunk_fields),
+        "group_sizes": group_sizes,
+        "columns": columns
+    }
+    with open(corpus.meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, default=str)
+
+    # Reemplazo atómico: los lectores nunca ven un artefacto a medio escribir
+    for path in (corpus.text_path, corpus.offsets_path, corpus.meta_path):
+        os.replace(path + ".tmp", path)
+
+    num_chunks = len(offsets) - 1
+    print(f"Corpus de {name} compilado: {num_chunks} chunks, {len(group_sizes)} grupos")
+    return num_chunks
+
+
+def law_corpus_params(config: Config) -> Dict[str, Any]:
+    """Parámetros de chunking que determinan el contenido del corpus de leyes"""
+    return {"chunk_size": config.CHUNK_SIZE_LAW, "chunk_overlap": config.CHUNK_OVERLAP_LAW}
+
+
+def case_corpus_params(config: Config) -> Dict[str, Any]:
+    """Parámetros que determinan el contenido del corpus de fallos (ya viene dividido en chunks)"""
+    return {}
+
+
+def compile_corpus():
+    """Compila ambos CSV al formato columnar usado por DataLoader"""
+    from .data_loader import DataLoader
+
+    config = Config()
+    if not config.validate_files():
+        raise FileNotFoundError("No se encontraron los archivos de datos")
+
+    data_loader = DataLoader()
+    write_compiled_corpus(
+        config.COMPILED_CORPUS_DIR, "leyes",
+        data_loader.load_law_documents_from_csv(),
+        config.LAW_FILE, law_corpus_params(config)
+    )
+    write_compiled_corpus(
+        config.COMPILED_CORPUS_DIR, "fallos",
+        data_loader.iter_case_documents_from_csv(batch_size=config.CASE_LOAD_BATCH_SIZE),
+        config.CASES_FILE, case_corpus_params(config)
+    )
+
+
+if __name__ == "__main__":
+    compile_corpus()
@@ -1,8 +1,10 @@
 import pandas as pd
-from typing import List
+from typing import Iterator, List, Optional
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from .config import Config
+from .corpus_compiler import CompiledCorpus, case_corpus_params, law_corpus_params
+from .metadata_index import case_metadata_fields
 
 class DataLoader:
     """Cargador de datos para artículos legales y fallos judiciales"""
@@ -12,21 +14,47 @@ class DataLoader:
         
     def load_law_documents(self) -> List[Document]:
         """
-        Carga y procesa los artículos de la ley desde CSV
+        Carga y procesa los artículos de la ley, desde el corpus compilado si está disponible
         
         Returns:
             List[Document]: Lista de documentos procesados
         """
         try:
-            df = pd.read_csv(self.config.LAW_FILE)
-            return self._process_law_documents(df)
+            return self.read_law_documents()
         except Exception as e:
             print(f"Error cargando artículos de ley: {e}")
             return []
     
+    def read_law_documents(self) -> List[Document]:
+        """
+        Lee los artículos de la ley como load_law_documents, pero sin ocultar los errores
+        
+        Los errores de lectura se propagan para que el índice no se sincronice
+        contra un corpus vacío.
+        
+        Returns:
+            List[Document]: Lista de documentos procesados
+        """
+        compiled = self._open_compiled_corpus("leyes")
+        if compiled is not None:
+            documents = compiled.documents()
+            print(f"Cargados {len(documents)} documentos de artículos legales (corpus compilado)")
+            return documents
+        return self.load_law_documents_from_csv()
+    
+    def load_law_documents_from_csv(self) -> List[Document]:
+        """
+        Carga y procesa los artículos de la ley directamente desde CSV
+        
+        Returns:
+            List[Document]: Lista de documentos procesados
+        """
+        df = pd.read_csv(self.config.LAW_FILE)
+        return self._process_law_documents(df)
+    
     def load_case_documents(self, batch_size: int = 100) -> List[Document]:
         """
-        Carga y procesa los fallos judiciales desde CSV por lotes
+        Carga y procesa los fallos judiciales por lotes, desde el corpus compilado si está disponible
         
         Args:
             batch_size: Número de filas del CSV a procesar por lote
@@ -35,12 +63,40 @@ class DataLoader:
             List[Document]: Lista de documentos procesados
         """
         try:
+            compiled = self._open_compiled_corpus("fallos")
+            if compiled is not None:
+                documents = compiled.documents()
+                print(f"Total cargados: {len(documents)} documentos de fallos judiciales (corpus compilado)")
+                return documents
             df = pd.read_csv(self.config.CASES_FILE)
             return self._process_case_documents_in_batches(df, batch_size)
         except Exception as e:
             print(f"Error cargando fallos judiciales: {e}")
             return []
     
+    def _open_compiled_corpus(self, name: str) -> Optional[CompiledCorpus]:
+        """
+        Abre el corpus compilado si está habilitado y corresponde a los CSV actuales
+        
+        Args:
+            name: "leyes" o "fallos"
+            
+        Returns:
+            CompiledCorpus: Corpus compilado, o None si debe usarse el CSV
+        """
+        if not self.config.USE_COMPILED_CORPUS:
+            return None
+        
+        if name == "leyes":
+            return CompiledCorpus.open(
+                self.config.COMPILED_CORPUS_DIR, name,
+                self.config.LAW_FILE, law_corpus_params(self.config)
+            )
+        return CompiledCorpus.open(
+            self.config.COMPILED_CORPUS_DIR, name,
+            self.config.CASES_FILE, case_corpus_params(self.config)
+        )
+    
     def _process_law_documents(self, df: pd.DataFrame) -> List[Document]:
         """
         Procesa los artículos de ley en documentos con chunking
@@ -95,8 +151,6 @@ class DataLoader:
         Returns:
             List[Document]: Documentos procesados
         """
-        import ast  # Para convertir strings que representan listas
-        
         all_documents = []
         total_rows = len(df)
         
@@ -109,47 +163,7 @@ class DataLoader:
             
             print(f"Procesando lote {batch_start//batch_size + 1}: filas {batch_start} a {batch_end}")
             
-            batch_documents = []
-            
-            for index, row in batch_df.iterrows():
-                # Procesar el texto de la sentencia que viene como string de lista
-                texto_sentencia_raw = row['Texto_sentencia']
-                
-                # Convertir de string de lista a lista real
-                try:
-                    if isinstance(texto_sentencia_raw, str) and texto_sentencia_raw.startswith('['):
-                        # Es una lista en formato string, convertir a lista real
-                        chunks_lista = ast.literal_eval(texto_sentencia_raw)
-                    else:
-                        # Si no es una lista, tratarlo como un solo chunk
-                        chunks_lista = [str(texto_sentencia_raw)]
-                except (ValueError, SyntaxError):
-                    # Si falla la conversión, usar el texto tal como está
-                    chunks_lista = [str(texto_sentencia_raw)]
-                
-                # Extraer metadata base
-                metadata_base = {
-                    'Rol': row['Rol'],
-                    'Fecha_Sentencia': str(row['Fecha_Sentencia']),
-                    'Corte_origen': row['Corte de origen'],
-                    'Leyes_mencionadas': row['Leyes_mencionadas'],
-                    'Articulos_mencionados': row['Artículos_mencionados'],
-                    'tipo': 'fallo'
-                }
-                
-                # Crear un documento por cada chunk
-                for chunk_idx, chunk_text in enumerate(chunks_lista):
-                    # Agregar índice del chunk a los metadatos
-                    metadata = metadata_base.copy()
-                    metadata['chunk_index'] = chunk_idx
-                    metadata['total_chunks'] = len(chunks_lista)
-                    
-                    batch_documents.append(
-                        Document(
-                            page_content=chunk_text.strip(),
-                            metadata=metadata
-                        )
-                    )
+            batch_documents = self._rows_to_case_documents(batch_df)
             
             all_documents.extend(batch_documents)
             print(f"Lote {batch_start//batch_size + 1} procesado: {len(batch_documents)} documentos")
@@ -157,6 +171,138 @@ class DataLoader:
         print(f"Total cargados: {len(all_documents)} documentos de fallos judiciales")
         return all_documents
     
+    def iter_case_document_batches(self, batch_size: int = 100) -> Iterator[List[Document]]:
+        """
+        Genera los fallos judiciales por lotes, desde el corpus compilado si está disponible
+        
+        A diferencia de load_case_documents, nunca mantiene el corpus completo ni todos
+        los documentos en memoria. Los errores de lectura se propagan para que el
+        índice no se sincronice contra un corpus incompleto.
+        
+        Args:
+            batch_size: Número de filas (fallos) por lote
+            
+        Yields:
+            List[Document]: Documentos de un lote de filas
+        """
+        compiled = self._open_compiled_corpus("fallos")
+        if compiled is not None:
+            print(f"Leyendo {len(compiled)} documentos de fallos desde el corpus compilado")
+            yield from compiled.iter_batches(batch_size)
+            return
+        
+        yield from self.iter_case_document_batches_from_csv(batch_size)
+    
+    def iter_case_document_batches_from_csv(self, batch_size: int = 100) -> Iterator[List[Document]]:
+        """
+        Genera los fallos judiciales por lotes leyendo el CSV por partes
+        
+        Args:
+            batch_size: Número de filas del CSV a leer por lote
+            
+        Yields:
+            List[Document]: Documentos de un lote de filas
+        """
+        total_documents = 0
+        
+        for batch_df in pd.read_csv(self.config.CASES_FILE, chunksize=batch_size):
+            batch_documents = self._rows_to_case_documents(batch_df)
+            total_documents += len(batch_documents)
+            yield batch_documents
+        
+        print(f"Total generados: {total_documents} documentos de fallos judiciales")
+    
+    def iter_case_documents(self, batch_size: int = 100) -> Iterator[Document]:
+        """
+        Genera los documentos de fallos uno a uno a partir de los lotes
+        
+        Args:
+            batch_size: Número de filas (fallos) por lote
+            
+        Yields:
+            Document: Documento de un chunk de fallo
+        """
+        for batch_documents in self.iter_case_document_batches(batch_size):
+            yield from batch_documents
+    
+    def iter_case_documents_from_csv(self, batch_size: int = 100) -> Iterator[Document]:
+        """
+        Genera los documentos de fallos uno a uno leyendo siempre el CSV
+        
+        Args:
+            batch_size: Número de filas del CSV a leer por lote
+            
+        Yields:
+            Document: Documento de un chunk de fallo
+        """
+        for batch_documents in self.iter_case_document_batches_from_csv(batch_size):
+            yield from batch_documents
+    
+    def _rows_to_case_documents(self, batch_df: pd.DataFrame) -> List[Document]:
+        """
+        Convierte un lote de filas de fallos en documentos, uno por chunk
+        
+        Args:
+            batch_df: Filas del CSV de fallos
+            
+        Returns:
+            List[Document]: Documentos del lote
+        """
+        import ast  # Para convertir strings que representan listas
+        
+        batch_documents = []
+        
+        # Iterar por columnas evita construir una Series por fila como iterrows
+        rows = zip(
+            batch_df['Texto_sentencia'],
+            batch_df['Rol'],
+            batch_df['Fecha_Sentencia'],
+            batch_df['Corte de origen'],
+            batch_df['Leyes_mencionadas'],
+            batch_df['Artículos_mencionados']
+        )
+        
+        for texto_sentencia_raw, rol, fecha, corte, leyes, articulos in rows:
+            # Convertir de string de lista a lista real
+            try:
+                if isinstance(texto_sentencia_raw, str) and texto_sentencia_raw.startswith('['):
+                    # Es una lista en formato string, convertir a lista real
+                    chunks_lista = ast.literal_eval(texto_sentencia_raw)
+                else:
+                    # Si no es una lista, tratarlo como un solo chunk
+                    chunks_lista = [str(texto_sentencia_raw)]
+            except (ValueError, SyntaxError):
+                # Si falla la conversión, usar el texto tal como está
+                chunks_lista = [str(texto_sentencia_raw)]
+            
+            # Extraer metadata base
+            metadata_base = {
+                'Rol': rol,
+                'Fecha_Sentencia': str(fecha),
+                'Corte_origen': corte,
+                'Leyes_mencionadas': leyes,
+                'Articulos_mencionados': articulos,
+                'tipo': 'fallo'
+            }
+            # Campos normalizados para los filtros por corte, fecha y artículo citado
+            metadata_base.update(case_metadata_fields(corte, fecha, articulos))
+            
+            # Crear un documento por cada chunk
+            for chunk_idx, chunk_text in enumerate(chunks_lista):
+                # Agregar índice del chunk a los metadatos
+                metadata = metadata_base.copy()
+                metadata['chunk_index'] = chunk_idx
+                metadata['total_chunks'] = len(chunks_lista)
+                
+                batch_documents.append(
+                    Document(
+                        page_content=chunk_text.strip(),
+                        metadata=metadata
+                    )
+                )
+        
+        return batch_documents
+    
     def _process_case_documents(self, df: pd.DataFrame) -> List[Document]:
         """
         Método original mantenido para compatibilidad
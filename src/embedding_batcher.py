@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+from langchain_core.embeddings import Embeddings
+
+
+class QueryEmbeddingBatcher:
+    """
+    Agrupa los embeddings de consultas concurrentes en una sola llamada al modelo
+
+    Las consultas que llegan dentro de una ventana de tiempo (o hasta completar
+    max_batch) se embeben juntas con aembed_documents y cada solicitud recibe su
+    vector. Se usa en la ruta asíncrona, que es la que atiende solicitudes
+    concurrentes en la API.
+    """
+
+    def __init__(self, embeddings: Embeddings, window: float, max_batch: int):
+        """
+        Args:
+            embeddings: Modelo de embeddings (con o sin caché)
+            window: Segundos que se espera a otras consultas desde la primera del lote
+            max_batch: Consultas máximas por lote; al completarlo se envía sin esperar
+        """
+        self.embeddings = embeddings
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Referencias a los lotes en curso para que no los recolecte el GC
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats_lock = threading.Lock()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Embebe una consulta junto con las que lleguen dentro de la ventana
+
+        Args:
+            text: Consulta
+
+        Returns:
+            List[float]: Embedding de la consulta
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Un event loop nuevo (p. ej. otro asyncio.run) no hereda lotes del anterior
+            self._loop, self._pending, self._flush_handle = loop, [], None
+
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        """Envía las consultas pendientes como un lote"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = self._loop.create_task(self._embed_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _embed_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Embebe un lote y entrega a cada solicitud su vector (o el error)"""
+        with self._stats_lock:
+            self.batches += 1
+            self.queries += len(batch)
+
+        try:
+            vectors = await self.embeddings.aembed_documents([text for text, _ in batch])
+            # Sin un vector por consulta no se puede saber a quién corresponde cada uno
+            if len(vectors) != len(batch):
+                raise ValueError(f"El modelo retornó {len(vectors)} embeddings para {len(batch)} consultas")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), vector in zip(batch, vectors):
+            # Una solicitud cancelada mientras esperaba ya no recibe resultado
+            if not future.done():
+                future.set_result(vector)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene las estadísticas de agrupación
+
+        Returns:
+            Dict: Lotes enviados, consultas embebidas y tamaño promedio de lote
+        """
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "queries": self.queries,
+                "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0
+            }
@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List
+from langchain_core.embeddings import Embeddings
+
+# Máximo de parámetros por consulta SQLite (el límite por defecto es 999)
+_SQLITE_MAX_PARAMS = 500
+# Aciertos cuyo último acceso se acumula en memoria antes de escribirlo en la base
+_TOUCH_FLUSH_SIZE = 1024
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envoltorio de embeddings con caché persistente en SQLite
+
+    Las entradas se indexan por (modelo, sha256(texto)), por lo que los textos ya
+    embebidos no vuelven a enviarse al modelo aunque se reconstruya la base vectorial.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, path: str, max_entries: int):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # hash -> último acceso aún no escrito; se vuelca junto con la próxima escritura
+        self._touched: Dict[str, float] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embebe textos sirviendo desde la caché los ya conocidos
+
+        Args:
+            texts: Textos a embeber
+
+        Returns:
+            List[List[float]]: Embeddings en el mismo orden que los textos
+        """
+        hashes, cached, missing = self._partition(texts)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            self._merge(cached, missing, vectors)
+
+        return [cached[text_hash] for text_hash in hashes]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Versión asíncrona de embed_documents; solo los textos no cacheados van al modelo
+
+        Las lecturas y escrituras en SQLite (y la espera del lock que comparten con los
+        hilos de indexación) se ejecutan en un hilo para no bloquear el event loop.
+
+        Args:
+            texts: Textos a embeber
+
+        Returns:
+            List[List[float]]: Embeddings en el mismo orden que los textos
+        """
+        hashes, cached, missing = await asyncio.to_thread(self._partition, texts)
+
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            await asyncio.to_thread(self._merge, cached, missing, vectors)
+
+        return [cached[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embebe una consulta usando la caché
+
+        Args:
+            text: Consulta
+
+        Returns:
+            List[float]: Embedding de la consulta
+        """
+        hashes, cached, missing = self._partition([text])
+
+        if missing:
+            self._merge(cached, missing, [self.embeddings.embed_query(text)])
+
+        return cached[hashes[0]]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Versión asíncrona de embed_query usando el cliente asíncrono del modelo
+
+        Args:
+            text: Consulta
+
+        Returns:
+            List[float]: Embedding de la consulta
+        """
+        hashes, cached, missing = await asyncio.to_thread(self._partition, [text])
+
+        if missing:
+            vector = await self.embeddings.aembed_query(text)
+            await asyncio.to_thread(self._merge, cached, missing, [vector])
+
+        return cached[hashes[0]]
+
+    def _partition(self, texts: List[str]):
+        """
+        Separa los textos entre cacheados y pendientes de embeber
+
+        Returns:
+            tuple: (hashes en orden, embeddings cacheados por hash, textos faltantes por hash)
+        """
+        hashes = [self._hash(text) for text in texts]
+        cached = self._lookup(set(hashes))
+
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in cached and text_hash not in missing:
+                missing[text_hash] = text
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        return hashes, cached, missing
+
+    def _merge(self, cached: Dict[str, List[float]], missing: Dict[str, str], vectors: List[List[float]]):
+        """Guarda los embeddings recién calculados y los agrega a los cacheados"""
+        new_entries = dict(zip(missing.keys(), vectors))
+        self._store(new_entries)
+        cached.update(new_entries)
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Obtiene las estadísticas de la caché
+
+        Returns:
+            Dict: Aciertos, fallos y entradas almacenadas
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": self._entries}
+
+    def _hash(self, text: str) -> str:
+        """Calcula el hash SHA-256 de un texto"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: set) -> Dict[str, List[float]]:
+        """Busca hashes en la caché y registra su último acceso (en memoria, ver _flush_touched)"""
+        found = {}
+        hashes = list(hashes)
+        now = time.time()
+
+        with self._lock:
+            for i in range(0, len(hashes), _SQLITE_MAX_PARAMS):
+                chunk = hashes[i:i + _SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *chunk]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[text_hash] = vector.tolist()
+                    self._touched[text_hash] = now
+
+            if len(self._touched) >= _TOUCH_FLUSH_SIZE:
+                self._flush_touched()
+                self._conn.commit()
+
+        return found
+
+    def _store(self, entries: Dict[str, List[float]]):
+        """Guarda nuevos embeddings y aplica el límite de tamaño"""
+        now = time.time()
+        rows = [
+            (self.model_name, text_hash, array("f", vector).tobytes(), now)
+            for text_hash, vector in entries.items()
+        ]
+
+        with self._lock:
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._entries += max(cursor.rowcount, 0)
+            # Los accesos pendientes se escriben antes de desalojar por antigüedad
+            self._flush_touched()
+            self._evict_if_needed()
+            self._conn.commit()
+
+    def _flush_touched(self):
+        """
+        Escribe los últimos accesos acumulados (requiere el lock; el llamador hace commit)
+
+        Los aciertos no escriben en la base: su último acceso solo sirve para el desalojo
+        LRU, así que se agrupa en una escritura junto con el próximo _store, al acumular
+        _TOUCH_FLUSH_SIZE aciertos o al cerrar la caché.
+        """
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+            [(last_access, self.model_name, text_hash) for text_hash, last_access in self._touched.items()]
+        )
+        self._touched.clear()
+
+    def _evict_if_needed(self):
+        """Elimina las entradas menos usadas recientemente cuando se supera el máximo"""
+        if self._entries <= self.max_entries:
+            return
+
+        # Se libera un 10% extra para no desalojar en cada escritura
+        excess = self._entries - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (excess,)
+        )
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        """Cierra la conexión a la caché"""
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+
+def create_cached_embeddings(embeddings: Embeddings, config) -> Embeddings:
+    """
+    Envuelve un objeto de embeddings con la caché persistente si está habilitada
+
+    Args:
+        embeddings: Embeddings base
+        config: Configuración del sistema
+
+    Returns:
+        Embeddings: Embeddings con caché, o los originales si la caché está deshabilitada
+    """
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return embeddings
+
+    return CachedEmbeddings(
+        embeddings,
+        model_name=config.EMBEDDING_MODEL,
+        path=config.EMBEDDING_CACHE_PATH,
+        max_entries=config.EMBEDDING_CACHE_MAX_ENTRIES
+    )
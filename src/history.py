@@ -0,0 +1,166 @@
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from .config import Config
+from .llm_scheduler import LLMScheduler
+from .tokens import estimate_tokens, truncate_to_tokens
+
+
+def _message_lines(messages: List[BaseMessage]) -> Tuple[List[str], List[str]]:
+    """Separa el resumen (SystemMessage) de los mensajes de la conversación ya formateados"""
+    summary_lines, lines = [], []
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            summary_lines.append(f"Resumen de la conversación anterior: {message.content}")
+        elif isinstance(message, HumanMessage):
+            lines.append(f"Usuario: {message.content}")
+        elif isinstance(message, AIMessage):
+            lines.append(f"Asistente: {message.content}")
+    return summary_lines, lines
+
+
+def format_history(messages: List[BaseMessage], token_budget: int) -> str:
+    """
+    Formatea el historial para un prompt sin superar un presupuesto de tokens
+
+    El resumen se conserva siempre; si el resto no cabe se descartan los mensajes más
+    antiguos y, en último caso, se recorta el más reciente.
+
+    Args:
+        messages: Mensajes a formatear (opcionalmente precedidos por el resumen)
+        token_budget: Tokens máximos estimados
+
+    Returns:
+        str: Historial formateado, una línea por mensaje
+    """
+    summary_lines, lines = _message_lines(messages)
+    summary_lines = [truncate_to_tokens(line, token_budget) for line in summary_lines]
+
+    remaining = token_budget - sum(estimate_tokens(line) for line in summary_lines)
+    kept = []
+    for line in reversed(lines):
+        tokens = estimate_tokens(line)
+        if tokens > remaining:
+            if not kept and remaining > 0:
+                kept.append(truncate_to_tokens(line, remaining))
+            break
+        kept.append(line)
+        remaining -= tokens
+
+    return "".join(f"{line}\n" for line in summary_lines + kept[::-1])
+
+
+class HistoryManager:
+    """
+    Mantiene acotado el historial de cada conversación
+
+    Los últimos HISTORY_RECENT_TURNS turnos se conservan textuales. Cuando el historial
+    sin resumir deja de caber en HISTORY_TOKEN_BUDGET, los mensajes más antiguos se
+    condensan con el LLM en un resumen incremental que se guarda en el estado de la
+    conversación ("summary" y "summarized_count") junto al resto del checkpoint.
+    """
+
+    def __init__(self, llm, config: Optional[Config] = None, scheduler: Optional[LLMScheduler] = None):
+        self.llm = llm
+        self.config = config or Config()
+        # Planificador del LLM; sin cupo el resumen se omite y se reintenta en el próximo turno
+        self.scheduler = scheduler
+
+    def window(self, values: Dict[str, Any]) -> List[BaseMessage]:
+        """
+        Mensajes a usar en los prompts: el resumen (como SystemMessage) y los no resumidos
+
+        Args:
+            values: Valores del estado de la conversación
+
+        Returns:
+            List[BaseMessage]: Ventana del historial
+        """
+        messages = list(values.get("messages", []))
+        start = min(values.get("summarized_count", 0), len(messages))
+        window = messages[start:]
+        if values.get("summary"):
+            window.insert(0, SystemMessage(content=values["summary"]))
+        return window
+
+    def format(self, messages: List[BaseMessage]) -> str:
+        """
+        Formatea una ventana del historial respetando el presupuesto de tokens
+
+        Args:
+            messages: Ventana del historial
+
+        Returns:
+            str: Historial formateado
+        """
+        return format_history(messages, self.config.HISTORY_TOKEN_BUDGET)
+
+    def compact(self, values: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Resume los mensajes antiguos si el historial superó el presupuesto
+
+        Args:
+            values: Valores del estado de la conversación
+
+        Returns:
+            Dict: Actualización de estado con "summary" y "summarized_count", o None si no hace falta
+        """
+        pending = self._pending(values)
+        if pending is None:
+            return None
+
+        to_summarize, summarized_count = pending
+        try:
+            with self.scheduler.slot("contextualize") if self.scheduler else nullcontext():
+                response = self.llm.invoke(self._summary_messages(values.get("summary", ""), to_summarize))
+        except Exception as e:
+            print(f"Error resumiendo historial: {e}")
+            return None
+        return self._summary_update(response.content, summarized_count)
+
+    async def acompact(self, values: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Versión asíncrona de compact"""
+        pending = self._pending(values)
+        if pending is None:
+            return None
+
+        to_summarize, summarized_count = pending
+        try:
+            async with self.scheduler.aslot("contextualize") if self.scheduler else nullcontext():
+                response = await self.llm.ainvoke(self._summary_messages(values.get("summary", ""), to_summarize))
+        except Exception as e:
+            print(f"Error resumiendo historial: {e}")
+            return None
+        return self._summary_update(response.content, summarized_count)
+
+    def _pending(self, values: Dict[str, Any]) -> Optional[Tuple[List[BaseMessage], int]]:
+        """Mensajes antiguos a resumir y el nuevo conteo, o None si el historial aún cabe"""
+        messages = list(values.get("messages", []))
+        start = min(values.get("summarized_count", 0), len(messages))
+        recent_start = max(start, len(messages) - 2 * self.config.HISTORY_RECENT_TURNS)
+        if recent_start == start:
+            return None
+
+        tokens = estimate_tokens(values.get("summary", ""))
+        tokens += sum(estimate_tokens(message.content) for message in messages[start:])
+        if tokens <= self.config.HISTORY_TOKEN_BUDGET:
+            return None
+
+        return messages[start:recent_start], recent_start
+
+    def _summary_messages(self, summary: str, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """Construye el prompt que actualiza el resumen con mensajes nuevos"""
+        _, lines = _message_lines(messages)
+        prompt = self.config.SUMMARY_PROMPT.format(
+            summary=summary or "(sin resumen previo)",
+            new_lines="\n".join(lines),
+            max_words=int(self.config.HISTORY_SUMMARY_MAX_TOKENS * 0.75)
+        )
+        return [HumanMessage(content=prompt)]
+
+    def _summary_update(self, summary: str, summarized_count: int) -> Dict[str, Any]:
+        """Actualización de estado con el resumen recortado a su tamaño máximo"""
+        return {
+            "summary": truncate_to_tokens(summary.strip(), self.config.HISTORY_SUMMARY_MAX_TOKENS),
+            "summarized_count": summarized_count
+        }
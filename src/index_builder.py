@@ -0,0 +1,212 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+from langchain_core.documents import Document
+from .config import Config
+from .vector_backends import NumpyVectorStore
+
+
+class AdaptiveBatchSizer:
+    """Ajusta el tamaño de lote de embeddings según el throughput observado y los errores"""
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.size = max(minimum, min(initial, maximum))
+        self.best_throughput = 0.0
+        self._lock = threading.Lock()
+
+    def next_size(self) -> int:
+        """Retorna el tamaño de lote a usar en la próxima solicitud"""
+        with self._lock:
+            return self.size
+
+    def record_success(self, batch_size: int, elapsed: float):
+        """
+        Registra un lote exitoso y ajusta el tamaño
+
+        Crece mientras el throughput se mantenga cerca del mejor observado y
+        retrocede cuando lotes más grandes dejan de rendir.
+
+        Args:
+            batch_size: Documentos del lote
+            elapsed: Segundos que tomó embeber el lote
+        """
+        throughput = batch_size / max(elapsed, 1e-6)
+        with self._lock:
+            if throughput >= self.best_throughput * 0.9:
+                self.size = min(self.maximum, int(self.size * 1.5) + 1)
+            else:
+                self.size = max(self.minimum, int(self.size * 0.75))
+            self.best_throughput = max(self.best_throughput, throughput)
+
+    def record_failure(self):
+        """Registra un error y reduce el tamaño de lote a la mitad"""
+        with self._lock:
+            self.size = max(self.minimum, self.size // 2)
+
+
+class PipelinedIndexBuilder:
+    """
+    Constructor de índices que solapa la producción de chunks, las solicitudes de
+    embeddings (concurrentes y con lote adaptativo) y las escrituras en el vector store
+    """
+
+    def __init__(self, embeddings, max_concurrency: Optional[int] = None):
+        self.config = Config()
+        self.embeddings = embeddings
+        self.max_concurrency = max_concurrency or self.config.EMBEDDING_CONCURRENCY
+
+    def build(self, vector_store, items: Iterable[Tuple[str, Document]], label: str) -> int:
+        """
+        Embebe y escribe documentos en un vector store
+
+        Args:
+            vector_store: Colección Chroma de destino
+            items: Pares (id, documento) a indexar (puede ser un generador)
+            label: Nombre de la colección para los mensajes
+
+        Returns:
+            int: Número de documentos escritos
+        """
+        sizer = AdaptiveBatchSizer(
+            self.config.EMBEDDING_BATCH_SIZE,
+            self.config.EMBEDDING_BATCH_SIZE_MIN,
+            self.config.EMBEDDING_BATCH_SIZE_MAX
+        )
+        slots = threading.BoundedSemaphore(self.max_concurrency)
+        write_queue = queue.Queue(maxsize=self.max_concurrency * 2)
+        errors = []
+        stats = {"written": 0}
+        start_time = time.perf_counter()
+
+        writer = threading.Thread(
+            target=self._writer_loop,
+            args=(vector_store, write_queue, errors, stats, start_time, label),
+            daemon=True
+        )
+        writer.start()
+
+        def embed_task(batch: List[Tuple[str, Document]]):
+            try:
+                for ids, vectors, documents in self._embed_batch(batch, sizer):
+                    write_queue.put((ids, vectors, documents))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                slots.release()
+
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        try:
+            batch = []
+            for item in items:
+                if errors:
+                    break
+                batch.append(item)
+                if len(batch) >= sizer.next_size():
+                    slots.acquire()
+                    executor.submit(embed_task, batch)
+                    batch = []
+
+            if batch and not errors:
+                slots.acquire()
+                executor.submit(embed_task, batch)
+        finally:
+            executor.shutdown(wait=True)
+            write_queue.put(None)
+            writer.join()
+
+        if errors:
+            raise errors[0]
+
+        elapsed = time.perf_counter() - start_time
+        if stats["written"]:
+            print(f"Colección de {label}: {stats['written']} documentos indexados en {elapsed:.1f}s "
+                  f"({stats['written'] / max(elapsed, 1e-6):.1f} docs/s)")
+        return stats["written"]
+
+    def _embed_batch(self, batch: List[Tuple[str, Document]], sizer: AdaptiveBatchSizer):
+        """
+        Embebe un lote, dividiéndolo a la mitad cuando el backend falla
+
+        Args:
+            batch: Pares (id, documento)
+            sizer: Controlador del tamaño de lote
+
+        Yields:
+            tuple: (ids, vectores, documentos) listos para escribir
+        """
+        texts = [document.page_content for _, document in batch]
+        attempts = 0
+
+        while True:
+            started = time.perf_counter()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                break
+            except Exception as e:
+                sizer.record_failure()
+                if len(batch) > 1:
+                    print(f"Error embebiendo lote de {len(batch)} documentos, dividiendo: {e}")
+                    middle = len(batch) // 2
+                    yield from self._embed_batch(batch[:middle], sizer)
+                    yield from self._embed_batch(batch[middle:], sizer)
+                    return
+                attempts += 1
+                if attempts > self.config.EMBEDDING_MAX_RETRIES:
+                    raise
+                time.sleep(min(2 ** attempts, 30))
+
+        sizer.record_success(len(batch), time.perf_counter() - started)
+        yield [doc_id for doc_id, _ in batch], vectors, [document for _, document in batch]
+
+    def _writer_loop(self, vector_store, write_queue: queue.Queue, errors: list,
+                     stats: dict, start_time: float, label: str):
+        """Consume lotes embebidos y los escribe en el vector store en un hilo dedicado"""
+        last_report = start_time
+
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            if errors:
+                # Se sigue drenando la cola para no bloquear a los productores
+                continue
+
+            ids, vectors, documents = item
+            try:
+                write_embeddings(vector_store, ids, vectors, documents)
+            except Exception as e:
+                errors.append(e)
+                continue
+
+            stats["written"] += len(ids)
+            now = time.perf_counter()
+            if now - last_report >= self.config.INDEX_PROGRESS_INTERVAL:
+                last_report = now
+                print(f"Colección de {label}: {stats['written']} documentos escritos "
+                      f"({stats['written'] / (now - start_time):.1f} docs/s)")
+
+
+def write_embeddings(vector_store, ids: List[str], vectors: List[List[float]], documents: List[Document]):
+    """
+    Escribe embeddings ya calculados en una colección sin volver a embeber
+
+    Args:
+        vector_store: Colección Chroma o NumpyVectorStore
+        ids: Ids de los documentos
+        vectors: Embeddings de cada documento
+        documents: Documentos originales
+    """
+    if isinstance(vector_store, NumpyVectorStore):
+        vector_store.upsert_embeddings(ids, vectors, documents)
+        return
+
+    vector_store._collection.upsert(
+        ids=ids,
+        embeddings=vectors,
+        documents=[document.page_content for document in documents],
+        metadatas=[document.metadata for document in documents]
+    )
@@ -0,0 +1,218 @@
+import functools
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Sequence, Set
+from langchain_core.documents import Document
+from .config import Config
+from .index_builder import PipelinedIndexBuilder
+
+# Versión del esquema de ids/manifiesto. Cambiarla fuerza una resincronización completa
+INDEX_SCHEMA_VERSION = 2
+MANIFEST_FILENAME = "index_manifest.json"
+
+
+def compute_document_id(document: Document, embedding_model: str) -> str:
+    """
+    Calcula un identificador determinista para un chunk
+
+    El id es el hash SHA-256 del contenido, los metadatos y el modelo de embeddings,
+    de modo que cualquier cambio en alguno de ellos produce un id distinto.
+
+    Args:
+        document: Documento producido por el DataLoader
+        embedding_model: Nombre del modelo de embeddings
+
+    Returns:
+        str: Hash hexadecimal del chunk
+    """
+    payload = json.dumps(
+        {
+            "model": embedding_model,
+            "content": document.page_content,
+            "metadata": document.metadata
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """
+    Calcula el SHA-256 de un archivo leyéndolo por bloques
+
+    El resultado se memoiza por tamaño y fecha de modificación para no volver a
+    leer archivos grandes que no han cambiado.
+
+    Args:
+        path: Ruta del archivo
+
+    Returns:
+        str: Hash hexadecimal del contenido
+    """
+    stat = os.stat(path)
+    return _hash_file_cached(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=32)
+def _hash_file_cached(path: str, size: int, mtime_ns: int) -> str:
+    """Calcula el SHA-256 de un archivo (memoizado por tamaño y mtime)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IncrementalIndexer:
+    """Sincroniza las colecciones vectoriales con los documentos del DataLoader mediante hashes de contenido"""
+
+    def __init__(self, embeddings):
+        self.config = Config()
+        self.builder = PipelinedIndexBuilder(embeddings)
+
+    def compute_fingerprint(self) -> Dict[str, Any]:
+        """
+        Calcula la huella de los datos de origen y de la configuración que afecta al índice
+
+        Returns:
+            Dict: Huella serializable a JSON
+        """
+        return {
+            "schema_version": INDEX_SCHEMA_VERSION,
+            "embedding_model": self.config.EMBEDDING_MODEL,
+            "chunk_size_law": self.config.CHUNK_SIZE_LAW,
+            "chunk_overlap_law": self.config.CHUNK_OVERLAP_LAW,
+            "chunk_size_cases": self.config.CHUNK_SIZE_CASES,
+            "chunk_overlap_cases": self.config.CHUNK_OVERLAP_CASES,
+            "law_vector_backend": self.config.LAW_VECTOR_BACKEND,
+            "cases_vector_backend": self.config.CASES_VECTOR_BACKEND,
+            "near_duplicates": {
+                "enabled": self.config.NEAR_DUPLICATE_DETECTION,
+                "threshold": self.config.NEAR_DUPLICATE_THRESHOLD,
+                "num_perm": self.config.NEAR_DUPLICATE_NUM_PERM,
+                "bands": self.config.NEAR_DUPLICATE_BANDS,
+                "shingle_size": self.config.NEAR_DUPLICATE_SHINGLE_SIZE
+            },
+            "law_file": hash_file(self.config.LAW_FILE),
+            "cases_file": hash_file(self.config.CASES_FILE)
+        }
+
+    def is_up_to_date(self, persist_dir: str) -> bool:
+        """
+        Indica si el índice persistido corresponde a los datos y configuración actuales
+
+        Args:
+            persist_dir: Directorio de la base vectorial
+
+        Returns:
+            bool: True si el manifiesto coincide con la huella actual
+        """
+        manifest_path = os.path.join(persist_dir, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path) or not self.config.validate_files():
+            return False
+
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        return manifest == self.compute_fingerprint()
+
+    def write_manifest(self, persist_dir: str):
+        """
+        Guarda la huella actual junto a la base vectorial
+
+        Args:
+            persist_dir: Directorio de la base vectorial
+        """
+        manifest_path = os.path.join(persist_dir, MANIFEST_FILENAME)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(self.compute_fingerprint(), f, indent=2)
+
+    def get_existing_ids(self, vector_store) -> Set[str]:
+        """
+        Obtiene los ids ya almacenados en una colección, paginando para no cargar todo de una vez
+
+        Args:
+            vector_store: Colección Chroma
+
+        Returns:
+            Set[str]: Ids existentes
+        """
+        existing_ids = set()
+        page_size = self.config.INDEX_WRITE_BATCH_SIZE
+        offset = 0
+
+        while True:
+            result = vector_store.get(include=[], limit=page_size, offset=offset)
+            ids = result.get("ids", [])
+            existing_ids.update(ids)
+            if len(ids) < page_size:
+                break
+            offset += page_size
+
+        return existing_ids
+
+    def sync(self, vector_store, documents: Iterable[Document], label: str,
+             observers: Sequence[Any] = ()) -> Dict[str, int]:
+        """
+        Sincroniza una colección con los documentos actuales
+
+        Solo se embeben los chunks cuyo id no existe en la colección; los ids que ya
+        no aparecen en los documentos se eliminan. Los observadores (índices auxiliares
+        como BM25) reciben cada documento vigente mediante add(doc_id, documento).
+
+        Args:
+            vector_store: Colección a sincronizar
+            documents: Documentos actuales (puede ser un generador)
+            label: Nombre de la colección para los mensajes
+            observers: Índices auxiliares que se construyen en la misma pasada
+
+        Returns:
+            Dict: Conteo de chunks agregados, eliminados y sin cambios
+        """
+        existing_ids = self.get_existing_ids(vector_store)
+        seen_ids = set()
+
+        print(f"Sincronizando colección de {label} ({len(existing_ids)} chunks existentes)")
+
+        def pending_items():
+            for document in documents:
+                doc_id = compute_document_id(document, self.config.EMBEDDING_MODEL)
+                if doc_id in seen_ids:
+                    continue
+                seen_ids.add(doc_id)
+                for observer in observers:
+                    observer.add(doc_id, document)
+
+                if doc_id not in existing_ids:
+                    yield doc_id, document
+
+        added = self.builder.build(vector_store, pending_items(), label)
+
+        if not seen_ids and existing_ids:
+            # Un corpus vacío casi siempre es un error de carga: no se vacía la colección
+            print(f"Advertencia: no se generaron documentos de {label}; se conserva la colección existente")
+            removed_ids = []
+        else:
+            removed_ids = list(existing_ids - seen_ids)
+        self._delete_ids(vector_store, removed_ids)
+
+        stats = {
+            "added": added,
+            "removed": len(removed_ids),
+            "unchanged": len(seen_ids) - added
+        }
+        print(f"Colección de {label}: {stats['added']} agregados, "
+              f"{stats['removed']} eliminados, {stats['unchanged']} sin cambios")
+        return stats
+
+    def _delete_ids(self, vector_store, ids: List[str]):
+        """Elimina ids de una colección por lotes"""
+        batch_size = self.config.INDEX_WRITE_BATCH_SIZE
+        for i in range(0, len(ids), batch_size):
+            vector_store.delete(ids=ids[i:i + batch_size])
@@ -1,31 +1,69 @@
-from typing import List, Dict, Any, Sequence
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Iterator, AsyncIterator
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, RemoveMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph.message import add_messages
 from langgraph.graph import START, StateGraph
 from typing_extensions import Annotated, TypedDict
 from .config import Config
 from .rag_system import RAGSystem
+from .history import HistoryManager
+from .checkpointer import SQLiteCheckpointer, create_checkpointer
+from .llm_scheduler import LLMBusyError
+from .metadata_index import normalize_filters
+import re
+import threading
+import time
+import unicodedata
 import uuid
 
+INTAKE_ANSWER = "Gracias por la información. Sigue contándome o escribe '/finalizar' para que prepare la respuesta."
+BUSY_ANSWER = "Todavía estoy preparando la respuesta anterior de esta conversación. Espera un momento e intenta nuevamente."
+
+# Expresiones (normalizadas) que indican que una consulta depende del historial
+REFERENCE_MARKERS = (
+    "eso", "esto", "esa", "ese", "esas", "esos", "aquello", "ello", "ahi",
+    "lo anterior", "anterior", "mencionado", "mencionada", "mencionaste",
+    "dicho", "dicha", "dijiste", "mismo", "misma", "en ese caso"
+)
+# Palabras iniciales típicas de una pregunta de seguimiento ("¿y si...?")
+FOLLOW_UP_STARTS = ("y", "e", "pero", "entonces", "tambien")
+
+
+def normalize_text(text: str) -> str:
+    """Quita acentos y convierte a minúsculas"""
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(char for char in text if unicodedata.category(char) != 'Mn')
+    return text.lower().strip()
+
 class ConversationState(TypedDict):
     """Estado de la conversación para LangGraph"""
     messages: Annotated[Sequence[BaseMessage], add_messages]
     contextualized_query: str
+    retrieval_query: str  # Texto de búsqueda ya resuelto por quien invocó el grafo ("" para usar la consulta)
     original_query: str
     sources: Dict[str, List[str]]
+    phase: int  # 1: recolectar datos, 3: ejecutando RAG
+    summary: str  # Resumen de los mensajes antiguos
+    summarized_count: int  # Mensajes iniciales ya incluidos en el resumen
+    filters: Dict[str, Any]  # Filtros de fallos de la consulta en curso
 
 class LegalAgent:
     def __init__(self):
         self.config = Config()
         self.rag_system = RAGSystem()
+        # Registro de métricas compartido con el sistema RAG
+        self.metrics = self.rag_system.metrics
+        self.history = HistoryManager(self.rag_system.llm, self.config, self.rag_system.llm_scheduler)
         self.app = None
-        self.memory = MemorySaver()
+        # Checkpoints de las conversaciones (SQLite con TTL y caché acotada)
+        self.memory = create_checkpointer(self.config)
         self.current_thread_id = None
         self.session_initialized = False
-
-        self.phase = 1  # 1: recolectar datos, 3: ejecutar RAG
+        # Conversaciones con un /finalizar en curso en este proceso
+        self._phase_3_threads = set()
+        self._phase_3_lock = threading.Lock()
 
     def initialize(self):
         print("Inicializando agente legal...")
@@ -35,17 +73,59 @@ class LegalAgent:
         self.current_thread_id = str(uuid.uuid4())
         print("Agente legal listo para usar")
 
+    def warm_up(self):
+        """Precarga lo que initialize difiere al primer uso (ver RAGSystem.warm_up)"""
+        self.rag_system.warm_up()
+
     def _build_graph(self):
         workflow = StateGraph(state_schema=ConversationState)
 
         def process_query(state: ConversationState) -> ConversationState:
-            messages = state["messages"]
+            # Resumen + mensajes recientes; el último es la consulta actual
+            messages = self.history.window(state)
             current_query = messages[-1].content if messages else ""
 
-            contextualized_query = self._contextualize_question(current_query, messages[:-1])
+            if state.get("contextualized_query") == current_query:
+                # Quien invocó el grafo ya resolvió la consulta: no se reescribe dos veces
+                contextualized_query, retrieval_query = current_query, state.get("retrieval_query") or None
+            else:
+                contextualized_query, retrieval_query = self._resolve_query(current_query, messages[:-1])
             rag_response = self.rag_system.generate_response(
                 contextualized_query,
-                self._format_message_history(messages)
+                self._format_message_history(messages),
+                retrieval_query=retrieval_query,
+                filters=state.get("filters") or None,
+                priority="draft"
+            )
+            formatted_answer = self._format_answer_with_sources(
+                rag_response["answer"],
+                rag_response["sources"]
+            )
+            ai_message = AIMessage(content=formatted_answer)
+
+            return {
+                "messages": [ai_message],
+                "contextualized_query": contextualized_query,
+                "original_query": current_query,
+                "sources": rag_response["sources"]
+            }
+
+        async def aprocess_query(state: ConversationState) -> ConversationState:
+            # Resumen + mensajes recientes; el último es la consulta actual
+            messages = self.history.window(state)
+            current_query = messages[-1].content if messages else ""
+
+            if state.get("contextualized_query") == current_query:
+                # Quien invocó el grafo ya resolvió la consulta: no se reescribe dos veces
+                contextualized_query, retrieval_query = current_query, state.get("retrieval_query") or None
+            else:
+                contextualized_query, retrieval_query = await self._aresolve_query(current_query, messages[:-1])
+            rag_response = await self.rag_system.agenerate_response(
+                contextualized_query,
+                self._format_message_history(messages),
+                retrieval_query=retrieval_query,
+                filters=state.get("filters") or None,
+                priority="draft"
             )
             formatted_answer = self._format_answer_with_sources(
                 rag_response["answer"],
@@ -61,72 +141,286 @@ class LegalAgent:
             }
 
         workflow.add_edge(START, "process_query")
-        workflow.add_node("process_query", process_query)
+        # El nodo tiene versión síncrona (invoke) y asíncrona (ainvoke)
+        workflow.add_node("process_query", RunnableLambda(process_query, afunc=aprocess_query))
 
         self.app = workflow.compile(checkpointer=self.memory)
 
-    def chat(self, query: str) -> Dict[str, Any]:
+    def chat(self, query: str, thread_id: Optional[str] = None,
+             filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Procesa una consulta del usuario
+        
+        El estado de cada conversación (mensajes y fase) vive en el checkpointer bajo
+        su thread_id, por lo que varias sesiones pueden atenderse en paralelo.
+        
+        Args:
+            query: Consulta del usuario
+            thread_id: Conversación a usar (por defecto, la actual)
+            filters: Filtros de fallos ("corte", "fecha_desde", "fecha_hasta", "articulo")
+            
+        Returns:
+            Dict: Respuesta del agente
+        """
         if not self.session_initialized:
             raise RuntimeError("Agente no inicializado. Llama a initialize() primero")
 
-        # Comando para ejecutar RAG
-        if query.lower().strip() == "/finalizar":
-            self.phase = 3
-            return self._execute_phase_3()
+        with self.metrics.stage("chat"):
+            config = self._thread_config(thread_id)
+            filters = normalize_filters(filters)
+
+            # Comando para ejecutar RAG
+            if query.lower().strip() == "/finalizar":
+                return self._execute_phase_3(config, filters)
+            
+            # Detectar automáticamente el tipo de consulta
+            with self.metrics.stage("classify"):
+                query_type = self._classify_query(query)
+            
+            if query_type == "direct":
+                print(f"\nProcesando consulta directa: {query}")
+                return self._process_direct_query(query, config, filters)
+
+            state = self.app.get_state(config)
+            phase = self._get_phase(config, state)
+            print(f"\nProcesando consulta compleja (fase {phase}): {query}")
+            
+            if phase == 1:
+                return self._store_intake_message(query, config, state)
+            return {"answer": BUSY_ANSWER}
+
+    async def achat(self, query: str, thread_id: Optional[str] = None,
+                    filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Versión asíncrona de chat: no bloquea el event loop mientras espera al modelo
         
-        # Detectar automáticamente el tipo de consulta
-        query_type = self._classify_query(query)
+        Args:
+            query: Consulta del usuario
+            thread_id: Conversación a usar (por defecto, la actual)
+            filters: Filtros de fallos ("corte", "fecha_desde", "fecha_hasta", "articulo")
+            
+        Returns:
+            Dict: Respuesta del agente
+        """
+        if not self.session_initialized:
+            raise RuntimeError("Agente no inicializado. Llama a initialize() primero")
+
+        with self.metrics.stage("chat"):
+            config = self._thread_config(thread_id)
+            filters = normalize_filters(filters)
+
+            if query.lower().strip() == "/finalizar":
+                return await self._aexecute_phase_3(config, filters)
+
+            with self.metrics.stage("classify"):
+                query_type = self._classify_query(query)
+
+            if query_type == "direct":
+                print(f"\nProcesando consulta directa: {query}")
+                return await self._aprocess_direct_query(query, config, filters)
+
+            state = await self.app.aget_state(config)
+            phase = self._get_phase(config, state)
+            print(f"\nProcesando consulta compleja (fase {phase}): {query}")
+
+            if phase == 1:
+                return await self._astore_intake_message(query, config, state)
+            return {"answer": BUSY_ANSWER}
+
+    def stream_chat(self, query: str, thread_id: Optional[str] = None,
+                    filters: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Versión en streaming de chat
         
-        if query_type == "direct":
-            print(f"\nProcesando consulta directa: {query}")
-            return self._process_direct_query(query)
-        else:
-            print(f"\nProcesando consulta compleja (fase {self.phase}): {query}")
+        Emite un evento "sources" con las fuentes recuperadas, eventos "token" con el
+        texto a medida que se genera y un evento "end" con el mismo diccionario que
+        retornaría chat. Los mensajes de la fase de recolección se emiten como un único token.
         
-        if self.phase == 1:
-            # Guardar directamente el mensaje en el historial del grafo
-            # Obtener estado actual
-            config = {"configurable": {"thread_id": self.current_thread_id}}
+        Args:
+            query: Consulta del usuario
+            thread_id: Conversación a usar (por defecto, la actual)
+            filters: Filtros de fallos ("corte", "fecha_desde", "fecha_hasta", "articulo")
+            
+        Yields:
+            Dict: Eventos con la clave "type" ("sources", "token" o "end")
+        """
+        if not self.session_initialized:
+            raise RuntimeError("Agente no inicializado. Llama a initialize() primero")
+
+        with self.metrics.stage("chat"):
+            config = self._thread_config(thread_id)
+            filters = normalize_filters(filters)
+
+            if query.lower().strip() == "/finalizar":
+                yield from self._stream_phase_3(config, filters)
+                return
+
+            with self.metrics.stage("classify"):
+                query_type = self._classify_query(query)
+
+            if query_type == "direct":
+                print(f"\nProcesando consulta directa: {query}")
+                yield from self._stream_direct_query(query, config, filters)
+                return
+
             state = self.app.get_state(config)
+            phase = self._get_phase(config, state)
+            print(f"\nProcesando consulta compleja (fase {phase}): {query}")
+            if phase == 1:
+                yield from self._answer_events(self._store_intake_message(query, config, state))
+            else:
+                yield from self._answer_events({"answer": BUSY_ANSWER})
 
-            # Agregar el nuevo mensaje humano al historial actual
-            current_messages = list(state.values.get("messages", []))
-            current_messages.append(HumanMessage(content=query))
+    async def astream_chat(self, query: str, thread_id: Optional[str] = None,
+                           filters: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Versión asíncrona de stream_chat
+        
+        Args:
+            query: Consulta del usuario
+            thread_id: Conversación a usar (por defecto, la actual)
+            filters: Filtros de fallos ("corte", "fecha_desde", "fecha_hasta", "articulo")
+            
+        Yields:
+            Dict: Eventos con la clave "type" ("sources", "token" o "end")
+        """
+        if not self.session_initialized:
+            raise RuntimeError("Agente no inicializado. Llama a initialize() primero")
 
-            # Actualizar estado con los mensajes nuevos
-            new_state = {
-                "messages": current_messages,
-                "contextualized_query": "",
-                "original_query": "",
-                "sources": {"articulos": [], "casos": []}
-            }
-            self.app.update_state(config, new_state)
+        with self.metrics.stage("chat"):
+            config = self._thread_config(thread_id)
+            filters = normalize_filters(filters)
 
-            return {
-                "answer": "Gracias por la información. Sigue contándome o escribe '/finalizar' para que prepare la respuesta."
-            }
+            if query.lower().strip() == "/finalizar":
+                # aclosing: si el cliente cierra este stream se cierra también el interno
+                async with aclosing(self._astream_phase_3(config, filters)) as events:
+                    async for event in events:
+                        yield event
+                return
 
-    def _execute_phase_3(self):
-        config = {"configurable": {"thread_id": self.current_thread_id}}
-        state = self.app.get_state(config)
-        messages = state.values.get("messages", [])
+            with self.metrics.stage("classify"):
+                query_type = self._classify_query(query)
 
-        human_messages = [m for m in messages if isinstance(m, HumanMessage)]
-        concatenated_text = " ".join(m.content for m in human_messages)
+            if query_type == "direct":
+                print(f"\nProcesando consulta directa: {query}")
+                # aclosing: si el cliente cierra este stream se cierra también el interno
+                async with aclosing(self._astream_direct_query(query, config, filters)) as events:
+                    async for event in events:
+                        yield event
+                return
 
-        contextualized = self._contextualize_question(concatenated_text, human_messages)
-        human_message = HumanMessage(content=contextualized)
+            state = await self.app.aget_state(config)
+            phase = self._get_phase(config, state)
+            print(f"\nProcesando consulta compleja (fase {phase}): {query}")
+            if phase == 1:
+                result = await self._astore_intake_message(query, config, state)
+            else:
+                result = {"answer": BUSY_ANSWER}
+            for event in self._answer_events(result):
+                yield event
 
-        response = self.app.invoke({"messages": [human_message]}, config=config)
+    def _thread_config(self, thread_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Configuración de LangGraph para una conversación
+        
+        Args:
+            thread_id: Conversación a usar (por defecto, la actual)
+            
+        Returns:
+            Dict: Configuración con el thread_id
+        """
+        return {"configurable": {"thread_id": thread_id or self.current_thread_id}}
+
+    def _get_phase(self, config: Dict[str, Any], state) -> int:
+        """
+        Fase de una conversación según su estado en el checkpointer
+
+        Una fase 3 guardada sin un /finalizar en curso (p. ej. el proceso se detuvo a
+        mitad de la generación) se considera terminada para no bloquear la conversación.
+        """
+        phase = state.values.get("phase", 1)
+        if phase == 3:
+            with self._phase_3_lock:
+                if config["configurable"]["thread_id"] not in self._phase_3_threads:
+                    return 1
+        return phase
+
+    def _answer_events(self, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Convierte una respuesta completa en eventos de streaming"""
+        return [
+            {"type": "token", "content": result["answer"]},
+            {"type": "end", **result}
+        ]
 
-        self.app.update_state(config, {
-            "messages": [],
+    def _intake_state(self, messages: List[BaseMessage], query: str) -> ConversationState:
+        """Estado tras registrar un mensaje de la fase de recolección"""
+        return {
+            "messages": list(messages) + [HumanMessage(content=query)],
             "contextualized_query": "",
             "original_query": "",
-            "sources": {"articulos": [], "casos": []}
-        })
+            "sources": {"articulos": [], "casos": []},
+            "phase": 1
+        }
+
+    def _store_intake_message(self, query: str, config: Dict[str, Any], state) -> Dict[str, Any]:
+        """
+        Guarda un mensaje de la fase 1 en el historial del grafo sin invocar al LLM
+        
+        Args:
+            query: Mensaje del usuario
+            config: Configuración de la conversación
+            state: Estado actual de la conversación
+            
+        Returns:
+            Dict: Respuesta de confirmación
+        """
+        self.app.update_state(config, self._intake_state(state.values.get("messages", []), query))
+        return {"answer": INTAKE_ANSWER}
 
-        self.phase = 1
+    async def _astore_intake_message(self, query: str, config: Dict[str, Any], state) -> Dict[str, Any]:
+        """Versión asíncrona de _store_intake_message"""
+        await self.app.aupdate_state(config, self._intake_state(state.values.get("messages", []), query))
+        return {"answer": INTAKE_ANSWER}
+
+    def _execute_phase_3(self, config: Dict[str, Any], filters: Optional[Dict[str, Any]] = None):
+        if not self._claim_phase_3(config):
+            return {"answer": BUSY_ANSWER}
+
+        human_message, completed = None, False
+        try:
+            messages, _ = self._load_history(config)
+            # Marca la conversación como ocupada mientras se genera la respuesta
+            self.app.update_state(config, {"phase": 3})
+
+            # Los hechos se leen del historial completo: los ya resumidos no están en la ventana
+            human_messages = self._intake_messages(messages)
+            concatenated_text = " ".join(m.content for m in human_messages)
+
+            contextualized, retrieval_query = self._resolve_query(concatenated_text, human_messages)
+            human_message = self._phase_3_message(contextualized)
+
+            # La consulta de retrieval viaja en el estado para buscar igual que en streaming
+            response = self.app.invoke(
+                {
+                    "messages": [human_message],
+                    "contextualized_query": contextualized,
+                    "retrieval_query": retrieval_query or "",
+                    "filters": filters or {}
+                },
+                config=config
+            )
+
+            self.app.update_state(config, {
+                "messages": [],
+                "contextualized_query": "",
+                "retrieval_query": "",
+                "original_query": "",
+                "sources": {"articulos": [], "casos": []},
+                "phase": 1
+            })
+            completed = True
+        finally:
+            self._finish_phase_3(config, human_message, completed)
 
         return {
             "answer": response["messages"][-1].content,
@@ -135,9 +429,368 @@ class LegalAgent:
             "original_query": response["original_query"],
         }
 
+    async def _aexecute_phase_3(self, config: Dict[str, Any], filters: Optional[Dict[str, Any]] = None):
+        if not self._claim_phase_3(config):
+            return {"answer": BUSY_ANSWER}
+
+        human_message, completed = None, False
+        try:
+            messages, _ = await self._aload_history(config)
+            # Marca la conversación como ocupada mientras se genera la respuesta
+            await self.app.aupdate_state(config, {"phase": 3})
+
+            # Los hechos se leen del historial completo: los ya resumidos no están en la ventana
+            human_messages = self._intake_messages(messages)
+            concatenated_text = " ".join(m.content for m in human_messages)
+
+            contextualized, retrieval_query = await self._aresolve_query(concatenated_text, human_messages)
+            human_message = self._phase_3_message(contextualized)
+
+            # La consulta de retrieval viaja en el estado para buscar igual que en streaming
+            response = await self.app.ainvoke(
+                {
+                    "messages": [human_message],
+                    "contextualized_query": contextualized,
+                    "retrieval_query": retrieval_query or "",
+                    "filters": filters or {}
+                },
+                config=config
+            )
+
+            await self.app.aupdate_state(config, {
+                "messages": [],
+                "contextualized_query": "",
+                "retrieval_query": "",
+                "original_query": "",
+                "sources": {"articulos": [], "casos": []},
+                "phase": 1
+            })
+            completed = True
+        finally:
+            await self._afinish_phase_3(config, human_message, completed)
+
+        return {
+            "answer": response["messages"][-1].content,
+            "sources": response["sources"],
+            "contextualized_query": response["contextualized_query"],
+            "original_query": response["original_query"],
+        }
+
+    def _stream_phase_3(self, config: Dict[str, Any],
+                        filters: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Versión en streaming de _execute_phase_3"""
+        if not self._claim_phase_3(config):
+            yield from self._answer_events({"answer": BUSY_ANSWER})
+            return
+
+        completed = False
+        try:
+            messages, window = self._load_history(config)
+            self.app.update_state(config, {"phase": 3})
+
+            human_messages = self._intake_messages(messages)
+            concatenated_text = " ".join(m.content for m in human_messages)
+            contextualized, retrieval_query = self._resolve_query(concatenated_text, human_messages)
+            human_message = self._phase_3_message(contextualized)
+
+            for event in self.rag_system.stream_response(
+                contextualized, self._format_message_history(window + [human_message]),
+                retrieval_query=retrieval_query, filters=filters, priority="draft"
+            ):
+                if event["type"] == "end":
+                    event = self._phase_3_end_event(event, contextualized)
+                    self.app.update_state(config, self._phase_3_state(human_message, event))
+                    completed = True
+                yield event
+        finally:
+            # También se ejecuta si el cliente abandona el stream (GeneratorExit)
+            self._finish_phase_3(config, None, completed)
+
+    async def _astream_phase_3(self, config: Dict[str, Any],
+                               filters: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Versión asíncrona de _stream_phase_3"""
+        if not self._claim_phase_3(config):
+            for event in self._answer_events({"answer": BUSY_ANSWER}):
+                yield event
+            return
+
+        completed = False
+        try:
+            messages, window = await self._aload_history(config)
+            await self.app.aupdate_state(config, {"phase": 3})
+
+            human_messages = self._intake_messages(messages)
+            concatenated_text = " ".join(m.content for m in human_messages)
+            contextualized, retrieval_query = await self._aresolve_query(concatenated_text, human_messages)
+            human_message = self._phase_3_message(contextualized)
+
+            # Cerrar el stream del RAG con este devuelve el cupo del LLM sin esperar al GC
+            async with aclosing(self.rag_system.astream_response(
+                contextualized, self._format_message_history(window + [human_message]),
+                retrieval_query=retrieval_query, filters=filters, priority="draft"
+            )) as events:
+                async for event in events:
+                    if event["type"] == "end":
+                        event = self._phase_3_end_event(event, contextualized)
+                        await self.app.aupdate_state(config, self._phase_3_state(human_message, event))
+                        completed = True
+                    yield event
+        finally:
+            # También se ejecuta si el cliente se desconecta o la tarea se cancela
+            await self._afinish_phase_3(config, None, completed)
+
+    def _claim_phase_3(self, config: Dict[str, Any]) -> bool:
+        """
+        Registra que la conversación está generando la respuesta de la fase 3
+
+        Args:
+            config: Configuración de la conversación
+
+        Returns:
+            bool: False si ya hay un /finalizar en curso para la misma conversación
+        """
+        thread_id = config["configurable"]["thread_id"]
+        with self._phase_3_lock:
+            if thread_id in self._phase_3_threads:
+                return False
+            self._phase_3_threads.add(thread_id)
+            return True
+
+    def _phase_3_reset(self, human_message: Optional[HumanMessage], values: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Actualización que devuelve a la fase 1 una conversación cuya fase 3 no terminó
+
+        Los mensajes recolectados se conservan para reintentar /finalizar; si el grafo
+        alcanzó a guardar la consulta contextualizada se elimina para no duplicarla.
+        """
+        update: Dict[str, Any] = {"phase": 1}
+        if human_message is not None and any(m.id == human_message.id for m in values.get("messages", [])):
+            update["messages"] = [RemoveMessage(id=human_message.id)]
+        return update
+
+    def _finish_phase_3(self, config: Dict[str, Any], human_message: Optional[HumanMessage], completed: bool):
+        """Libera la fase 3 y, si falló o se interrumpió, vuelve la conversación a la fase 1"""
+        try:
+            if not completed:
+                values = self.app.get_state(config).values
+                self.app.update_state(config, self._phase_3_reset(human_message, values))
+        finally:
+            with self._phase_3_lock:
+                self._phase_3_threads.discard(config["configurable"]["thread_id"])
+
+    async def _afinish_phase_3(self, config: Dict[str, Any], human_message: Optional[HumanMessage],
+                               completed: bool):
+        """Versión asíncrona de _finish_phase_3"""
+        try:
+            if not completed:
+                values = (await self.app.aget_state(config)).values
+                await self.app.aupdate_state(config, self._phase_3_reset(human_message, values))
+        finally:
+            with self._phase_3_lock:
+                self._phase_3_threads.discard(config["configurable"]["thread_id"])
+
+    def _phase_3_end_event(self, event: Dict[str, Any], contextualized: str) -> Dict[str, Any]:
+        """Evento final de la fase 3, con la respuesta formateada igual que en el grafo"""
+        return {
+            "type": "end",
+            "answer": self._format_answer_with_sources(event["answer"], event["sources"]),
+            "sources": event["sources"],
+            "contextualized_query": contextualized,
+            "original_query": contextualized
+        }
+
+    def _intake_messages(self, messages: List[BaseMessage]) -> List[HumanMessage]:
+        """
+        Mensajes del usuario recolectados desde el último /finalizar
+
+        Args:
+            messages: Historial completo de la conversación (sin recortar por el resumen)
+
+        Returns:
+            List[HumanMessage]: Mensajes humanos posteriores a la última consulta de la fase 3
+        """
+        intake = []
+        for message in messages:
+            if not isinstance(message, HumanMessage):
+                continue
+            if message.additional_kwargs.get("phase") == 3:
+                intake = []
+            else:
+                intake.append(message)
+        return intake
+
+    def _phase_3_message(self, contextualized: str) -> HumanMessage:
+        """Mensaje con la consulta de la fase 3, marcado para separar la recolección siguiente"""
+        return HumanMessage(content=contextualized, id=str(uuid.uuid4()), additional_kwargs={"phase": 3})
+
+    def _phase_3_state(self, human_message: HumanMessage, event: Dict[str, Any]) -> ConversationState:
+        """Estado tras responder la fase 3: se agrega el intercambio y se limpia el resto"""
+        return {
+            "messages": [human_message, AIMessage(content=event["answer"])],
+            "contextualized_query": "",
+            "original_query": "",
+            "sources": {"articulos": [], "casos": []},
+            "phase": 1
+        }
+
+    def _stream_direct_query(self, query: str, config: Dict[str, Any],
+                             filters: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Versión en streaming de _process_direct_query"""
+        try:
+            messages, window = self._load_history(config)
+            messages.append(HumanMessage(content=query))
+
+            contextualized_query, retrieval_query = self._resolve_query(query, window)
+
+            for event in self.rag_system.stream_response(
+                contextualized_query, self._format_message_history(window),
+                retrieval_query=retrieval_query, filters=filters
+            ):
+                if event["type"] == "end":
+                    event = self._direct_end_event(event, contextualized_query, query)
+                    self.app.update_state(config, self._direct_query_state(messages, event))
+                yield event
+
+        except LLMBusyError:
+            raise
+        except Exception as e:
+            print(f"Error procesando consulta directa: {e}")
+            yield from self._answer_events(self._direct_query_error(query))
+
+    async def _astream_direct_query(self, query: str, config: Dict[str, Any],
+                                    filters: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Versión asíncrona de _stream_direct_query"""
+        try:
+            messages, window = await self._aload_history(config)
+            messages.append(HumanMessage(content=query))
+
+            contextualized_query, retrieval_query = await self._aresolve_query(query, window)
+
+            async with aclosing(self.rag_system.astream_response(
+                contextualized_query, self._format_message_history(window),
+                retrieval_query=retrieval_query, filters=filters
+            )) as events:
+                async for event in events:
+                    if event["type"] == "end":
+                        event = self._direct_end_event(event, contextualized_query, query)
+                        await self.app.aupdate_state(config, self._direct_query_state(messages, event))
+                    yield event
+
+        except LLMBusyError:
+            raise
+        except Exception as e:
+            print(f"Error procesando consulta directa: {e}")
+            for event in self._answer_events(self._direct_query_error(query)):
+                yield event
+
+    def _direct_end_event(self, event: Dict[str, Any], contextualized_query: str, query: str) -> Dict[str, Any]:
+        """Evento final de una consulta directa"""
+        return {
+            "type": "end",
+            "answer": event["answer"],
+            "sources": event["sources"],
+            "contextualized_query": contextualized_query,
+            "original_query": query
+        }
+
+    def _direct_query_state(self, messages: List[BaseMessage], event: Dict[str, Any]) -> ConversationState:
+        """Estado tras responder una consulta directa"""
+        return {
+            "messages": list(messages) + [AIMessage(content=event["answer"])],
+            "contextualized_query": event["contextualized_query"],
+            "original_query": event["original_query"],
+            "sources": event["sources"]
+        }
+
+    def _direct_query_error(self, query: str) -> Dict[str, Any]:
+        """Respuesta cuando una consulta directa falla"""
+        return {
+            "answer": "Lo siento, ocurrió un error al procesar tu consulta. Por favor, intenta nuevamente.",
+            "sources": {"articulos": [], "casos": []},
+            "contextualized_query": query,
+            "original_query": query
+        }
+
+    def _resolve_query(self, query: str, chat_history: List[BaseMessage]) -> Tuple[str, Optional[str]]:
+        """
+        Obtiene la pregunta a responder y, si corresponde, un texto distinto para el retrieval
+        
+        En modo "fold" no se llama al LLM: la pregunta se responde tal cual (el prompt de
+        respuesta ya incluye el historial) y el retrieval se amplía con el mensaje anterior.
+
+        Args:
+            query: Pregunta actual
+            chat_history: Historial de mensajes
+
+        Returns:
+            Tuple[str, Optional[str]]: Pregunta y consulta de retrieval (None para usar la pregunta)
+        """
+        if self.config.CONTEXTUALIZE_MODE == "fold":
+            return query, self._fold_retrieval_query(query, chat_history)
+        return self._contextualize_question(query, chat_history), None
+
+    async def _aresolve_query(self, query: str, chat_history: List[BaseMessage]) -> Tuple[str, Optional[str]]:
+        """Versión asíncrona de _resolve_query"""
+        if self.config.CONTEXTUALIZE_MODE == "fold":
+            return query, self._fold_retrieval_query(query, chat_history)
+        return await self._acontextualize_question(query, chat_history), None
+
+    def _needs_contextualization(self, query: str, chat_history: List[BaseMessage]) -> bool:
+        """
+        Decide si vale la pena una llamada extra al LLM para reescribir la consulta
+
+        Args:
+            query: Pregunta actual
+            chat_history: Historial de mensajes
+
+        Returns:
+            bool: True si la consulta debe reescribirse
+        """
+        if not chat_history or self.config.CONTEXTUALIZE_MODE == "fold":
+            return False
+        if self.config.CONTEXTUALIZE_MODE == "always":
+            return True
+        return not self._is_self_contained(query)
+
+    def _is_self_contained(self, query: str) -> bool:
+        """
+        Estima si una consulta se entiende sin el historial
+
+        Las consultas cortas, las que empiezan como seguimiento ("y si...") y las que
+        usan referencias como "eso" o "ese artículo" se consideran dependientes.
+
+        Args:
+            query: Pregunta actual
+
+        Returns:
+            bool: True si la consulta es autocontenida
+        """
+        words = re.findall(r"\w+", normalize_text(query))
+        if len(words) < self.config.CONTEXTUALIZE_MIN_WORDS or words[0] in FOLLOW_UP_STARTS:
+            return False
+
+        padded = f" {' '.join(words)} "
+        return not any(f" {marker} " in padded for marker in REFERENCE_MARKERS)
+
+    def _fold_retrieval_query(self, query: str, chat_history: List[BaseMessage]) -> Optional[str]:
+        """
+        Consulta de retrieval para el modo "fold": agrega el mensaje anterior del usuario
+        a las consultas de seguimiento
 
+        Args:
+            query: Pregunta actual
+            chat_history: Historial de mensajes
 
+        Returns:
+            Optional[str]: Consulta ampliada, o None si la pregunta basta por sí sola
+        """
+        if not chat_history or self._is_self_contained(query):
+            return None
 
+        previous = [message.content for message in chat_history if isinstance(message, HumanMessage)]
+        if not previous:
+            return None
+        return f"{previous[-1]} {query}"
 
     def _contextualize_question(self, query: str, chat_history: List[BaseMessage]) -> str:
         """
@@ -151,41 +804,92 @@ class LegalAgent:
             str: Pregunta contextualizada
        """
         
-        if not chat_history:
+        if not self._needs_contextualization(query, chat_history):
             return query
 
         try:
-            from langchain_core.prompts import ChatPromptTemplate
+            messages = self._build_contextualize_messages(query, chat_history)
+            with self.rag_system.llm_scheduler.slot("contextualize"):
+                start = time.perf_counter()
+                with self.metrics.stage("contextualize"):
+                    response = self.rag_system.llm.invoke(messages)
+            self.metrics.record_generation(
+                "contextualize", response, messages, response.content, time.perf_counter() - start
+            )
+            return response.content.strip()
 
-            formatted_history = self._format_message_history(chat_history)
+        except LLMBusyError:
+            # La sobrecarga se informa al cliente en vez de seguir con la consulta sin reescribir
+            raise
+        except Exception as e:
+            print(f"Error contextualizando pregunta: {e}")
+            return query
 
-            contextualize_prompt = ChatPromptTemplate.from_messages([
-                ("system", """Dado el historial de conversación y la pregunta más reciente del usuario, 
-                reformula la pregunta para que sea independiente y pueda entenderse sin el historial.
+    async def _acontextualize_question(self, query: str, chat_history: List[BaseMessage]) -> str:
+        """
+        Versión asíncrona de _contextualize_question
 
-                REGLAS:
-                1. NO respondas la pregunta, solo reformúlala
-                2. Incluye el contexto necesario del historial en la nueva pregunta
-                3. Mantén la intención original del usuario
-                4. Si la pregunta ya es independiente, devuélvela tal como está
+        Args:
+            query: Pregunta actual
+            chat_history: Historial de mensajes
 
-                HISTORIAL:
-                {chat_history}"""),
-                ("human", "Pregunta actual: {question}")
-            ])
+        Returns:
+            str: Pregunta contextualizada
+        """
+        if not self._needs_contextualization(query, chat_history):
+            return query
 
-            messages = contextualize_prompt.format_messages(
-                chat_history=formatted_history,
-                question=query
+        try:
+            messages = self._build_contextualize_messages(query, chat_history)
+            async with self.rag_system.llm_scheduler.aslot("contextualize"):
+                start = time.perf_counter()
+                with self.metrics.stage("contextualize"):
+                    response = await self.rag_system.llm.ainvoke(messages)
+            self.metrics.record_generation(
+                "contextualize", response, messages, response.content, time.perf_counter() - start
             )
-
-            response = self.rag_system.llm.invoke(messages)
             return response.content.strip()
 
+        except LLMBusyError:
+            # La sobrecarga se informa al cliente en vez de seguir con la consulta sin reescribir
+            raise
         except Exception as e:
             print(f"Error contextualizando pregunta: {e}")
             return query
 
+    def _build_contextualize_messages(self, query: str, chat_history: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Construye los mensajes del prompt de contextualización
+
+        Args:
+            query: Pregunta actual
+            chat_history: Historial de mensajes
+
+        Returns:
+            List[BaseMessage]: Mensajes listos para el LLM
+        """
+        formatted_history = self._format_message_history(chat_history)
+
+        contextualize_prompt = ChatPromptTemplate.from_messages([
+            ("system", """Dado el historial de conversación y la pregunta más reciente del usuario, 
+            reformula la pregunta para que sea independiente y pueda entenderse sin el historial.
+
+            REGLAS:
+            1. NO respondas la pregunta, solo reformúlala
+            2. Incluye el contexto necesario del historial en la nueva pregunta
+            3. Mantén la intención original del usuario
+            4. Si la pregunta ya es independiente, devuélvela tal como está
+
+            HISTORIAL:
+            {chat_history}"""),
+            ("human", "Pregunta actual: {question}")
+        ])
+
+        return contextualize_prompt.format_messages(
+            chat_history=formatted_history,
+            question=query
+        )
+
     
     def _format_message_history(self, messages: List[BaseMessage]) -> str:
         """
@@ -197,13 +901,33 @@ class LegalAgent:
         Returns:
             str: Historial formateado
         """
-        formatted_history = ""
-        for message in messages:
-            if isinstance(message, HumanMessage):
-                formatted_history += f"Usuario: {message.content}\n"
-            elif isinstance(message, AIMessage):
-                formatted_history += f"Asistente: {message.content}\n"
-        return formatted_history
+        return self.history.format(messages)
+
+    def _load_history(self, config: Dict[str, Any]) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+        """
+        Lee una conversación y resume sus mensajes antiguos si superó el presupuesto de tokens
+        
+        Args:
+            config: Configuración de la conversación
+            
+        Returns:
+            Tuple: Todos los mensajes y la ventana para los prompts (resumen + mensajes recientes)
+        """
+        values = dict(self.app.get_state(config).values)
+        update = self.history.compact(values)
+        if update:
+            self.app.update_state(config, update)
+            values.update(update)
+        return list(values.get("messages", [])), self.history.window(values)
+
+    async def _aload_history(self, config: Dict[str, Any]) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+        """Versión asíncrona de _load_history"""
+        values = dict((await self.app.aget_state(config)).values)
+        update = await self.history.acompact(values)
+        if update:
+            await self.app.aupdate_state(config, update)
+            values.update(update)
+        return list(values.get("messages", [])), self.history.window(values)
     
     def _format_answer_with_sources(self, answer: str, sources: Dict[str, List[str]]) -> str:
         """
@@ -232,10 +956,13 @@ class LegalAgent:
         
         return formatted_answer
     
-    def get_history(self) -> List[Dict[str, str]]:
+    def get_history(self, thread_id: Optional[str] = None) -> List[Dict[str, str]]:
         """
         Obtiene el historial de conversación
         
+        Args:
+            thread_id: Conversación a leer (por defecto, la actual)
+        
         Returns:
             List[Dict]: Historial de mensajes
         """
@@ -243,7 +970,7 @@ class LegalAgent:
             return []
         
         try:
-            config = {"configurable": {"thread_id": self.current_thread_id}}
+            config = self._thread_config(thread_id)
             # Obtener el estado actual del grafo
             state = self.app.get_state(config)
             
@@ -262,7 +989,8 @@ class LegalAgent:
     def clear_history(self):
         """Limpia el historial de conversación"""
         if self.session_initialized:
-            # Crear un nuevo thread_id para empezar de cero
+            # Descartar la conversación guardada y crear un nuevo thread_id para empezar de cero
+            self.memory.delete_thread(self.current_thread_id)
             self.current_thread_id = str(uuid.uuid4())
             print("Historial limpiado")
     
@@ -273,12 +1001,15 @@ class LegalAgent:
         Returns:
             Dict: Estado del agente
         """
-        return {
+        status = {
             "initialized": self.session_initialized,
             "thread_id": self.current_thread_id,
             "rag_system_status": self.rag_system.get_status(),
             "messages_count": len(self.get_history())
         }
+        if isinstance(self.memory, SQLiteCheckpointer):
+            status["conversation_store"] = self.memory.get_stats()
+        return status
     
     def save_conversation(self, filename: str):
         """
@@ -338,7 +1069,8 @@ class LegalAgent:
                     "messages": messages,
                     "contextualized_query": "",
                     "original_query": "",
-                    "sources": {"articulos": [], "casos": []}
+                    "sources": {"articulos": [], "casos": []},
+                    "phase": 1
                 }
                 
                 # Actualizar el estado del grafo
@@ -379,15 +1111,6 @@ class LegalAgent:
         Returns:
             str: "direct" para consultas directas, "complex" para consultas complejas
         """
-        import unicodedata
-        
-        # Normalizar texto: quitar acentos y convertir a minúsculas
-        def normalize_text(text):
-            # Remover acentos
-            text = unicodedata.normalize('NFD', text)
-            text = ''.join(char for char in text if unicodedata.category(char) != 'Mn')
-            return text.lower().strip()
-        
         query_normalized = normalize_text(query)
         
         # Patrones para consultas directas (preguntas específicas sobre la ley)
@@ -455,33 +1178,36 @@ class LegalAgent:
         # Por defecto, tratar como compleja para mantener el flujo actual
         return "complex"
     
-    def _process_direct_query(self, query: str) -> Dict[str, Any]:
+    def _process_direct_query(self, query: str, config: Dict[str, Any],
+                              filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Procesa directamente una consulta sin usar el sistema de fases
         
         Args:
             query: Consulta del usuario
+            config: Configuración de la conversación
+            filters: Filtros de fallos normalizados
             
         Returns:
             Dict: Respuesta directa del RAG
         """
         try:
-            # Obtener historial actual para contexto
-            config = {"configurable": {"thread_id": self.current_thread_id}}
-            state = self.app.get_state(config)
-            messages = list(state.values.get("messages", []))
+            # Obtener historial actual para contexto (resumido si superó el presupuesto)
+            messages, window = self._load_history(config)
             
             # Agregar la nueva consulta al historial
             human_message = HumanMessage(content=query)
             messages.append(human_message)
             
-            # Contextualizar la consulta
-            contextualized_query = self._contextualize_question(query, messages[:-1])
+            # Contextualizar la consulta (solo si depende del historial)
+            contextualized_query, retrieval_query = self._resolve_query(query, window)
             
             # Generar respuesta usando RAG
             rag_response = self.rag_system.generate_response(
                 contextualized_query,
-                self._format_message_history(messages[:-1])
+                self._format_message_history(window),
+                retrieval_query=retrieval_query,
+                filters=filters
             )
             
             # Crear respuesta AI y actualizarla en el estado
@@ -504,6 +1230,8 @@ class LegalAgent:
                 "original_query": query
             }
             
+        except LLMBusyError:
+            raise
         except Exception as e:
             print(f"Error procesando consulta directa: {e}")
             return {
@@ -511,4 +1239,60 @@ class LegalAgent:
                 "sources": {"articulos": [], "casos": []},
                 "contextualized_query": query,
                 "original_query": query
-            }
\ No newline at end of file
+            }
+    async def _aprocess_direct_query(self, query: str, config: Dict[str, Any],
+                                     filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Versión asíncrona de _process_direct_query
+        
+        Args:
+            query: Consulta del usuario
+            config: Configuración de la conversación
+            filters: Filtros de fallos normalizados
+            
+        Returns:
+            Dict: Respuesta directa del RAG
+        """
+        try:
+            messages, window = await self._aload_history(config)
+
+            human_message = HumanMessage(content=query)
+            messages.append(human_message)
+
+            contextualized_query, retrieval_query = await self._aresolve_query(query, window)
+
+            rag_response = await self.rag_system.agenerate_response(
+                contextualized_query,
+                self._format_message_history(window),
+                retrieval_query=retrieval_query,
+                filters=filters
+            )
+
+            ai_message = AIMessage(content=rag_response["answer"])
+            messages.append(ai_message)
+
+            updated_state = {
+                "messages": messages,
+                "contextualized_query": contextualized_query,
+                "original_query": query,
+                "sources": rag_response["sources"]
+            }
+            await self.app.aupdate_state(config, updated_state)
+
+            return {
+                "answer": rag_response["answer"],
+                "sources": rag_response["sources"],
+                "contextualized_query": contextualized_query,
+                "original_query": query
+            }
+
+        except LLMBusyError:
+            raise
+        except Exception as e:
+            print(f"Error procesando consulta directa: {e}")
+            return {
+                "answer": "Lo siento, ocurrió un error al procesar tu consulta. Por favor, intenta nuevamente.",
+                "sources": {"articulos": [], "casos": []},
+                "contextualized_query": query,
+                "original_query": query
+            }
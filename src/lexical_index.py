@@ -0,0 +1,187 @@
+import math
+import os
+import pickle
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+from langchain_core.documents import Document
+
+# Palabras vacías frecuentes en consultas y textos legales en español (sin acentos)
+SPANISH_STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes como con contra cual cuales
+cuando de del desde donde durante e el ella ellas ellos en entre era es esa esas ese
+eso esos esta estas este esto estos fue fueron ha han hasta hay la las le les lo los
+mas me mi mis muy ni no nos o os otra otras otro otros para pero por porque que quien
+se sea segun ser si sin sino sobre son su sus tambien tan te tiene tienen todo todos
+tu tus un una unas uno unos y ya yo
+""".split())
+
+_TOKEN_PATTERN = re.compile(r"\d+(?:\.\d+)*|[a-z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokeniza texto en español para búsqueda léxica
+
+    Normaliza a minúsculas sin acentos, conserva números con puntos (p. ej. "19.496")
+    y descarta palabras vacías.
+
+    Args:
+        text: Texto a tokenizar
+
+    Returns:
+        List[str]: Tokens normalizados
+    """
+    text = unicodedata.normalize("NFD", text.lower())
+    text = "".join(char for char in text if unicodedata.category(char) != "Mn")
+    return [token for token in _TOKEN_PATTERN.findall(text) if token not in SPANISH_STOPWORDS]
+
+
+class BM25Index:
+    """Índice invertido en memoria con ranking BM25 sobre tokens normalizados en español"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_df_ratio: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.ids = []
+        self.doc_lengths = array("I")
+        self.total_length = 0
+        # término -> (índices de documento, frecuencias), en arrays compactos
+        self.postings = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, doc_id: str, document: Document):
+        """
+        Agrega un documento al índice
+
+        Args:
+            doc_id: Id del documento en la colección vectorial
+            document: Documento a indexar
+        """
+        doc_index = len(self.ids)
+        tokens = tokenize(document.page_content)
+        self.ids.append(doc_id)
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+
+        for term, frequency in Counter(tokens).items():
+            term_postings = self.postings.get(term)
+            if term_postings is None:
+                term_postings = self.postings[term] = (array("I"), array("I"))
+            term_postings[0].append(doc_index)
+            term_postings[1].append(frequency)
+
+    def search(self, query: str, k: int, allowed_ids: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Busca los documentos con mayor puntaje BM25
+
+        Los términos presentes en más de max_df_ratio de los documentos se omiten:
+        aportan poco al ranking y son los más costosos de recorrer.
+
+        Args:
+            query: Consulta del usuario
+            k: Número de resultados
+            allowed_ids: Si se indica, solo se puntúan estos documentos
+
+        Returns:
+            List[Tuple[str, float]]: Ids y puntajes, de mayor a menor
+        """
+        total_docs = len(self.ids)
+        if not total_docs:
+            return []
+
+        average_length = max(self.total_length / total_docs, 1.0)
+        scores = {}
+
+        for term in set(tokenize(query)):
+            term_postings = self.postings.get(term)
+            if not term_postings:
+                continue
+
+            doc_indexes, frequencies = term_postings
+            document_frequency = len(doc_indexes)
+            if total_docs > 1 and document_frequency > total_docs * self.max_df_ratio:
+                continue
+
+            idf = math.log(1 + (total_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+            for doc_index, frequency in zip(doc_indexes, frequencies):
+                if allowed_ids is not None and self.ids[doc_index] not in allowed_ids:
+                    continue
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_index] / average_length
+                score = idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                scores[doc_index] = scores.get(doc_index, 0.0) + score
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[doc_index], score) for doc_index, score in best]
+
+    def save(self, path: str):
+        """
+        Guarda el índice en disco
+
+        Args:
+            path: Ruta del archivo
+        """
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "max_df_ratio": self.max_df_ratio,
+            "ids": self.ids,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """
+        Carga un índice guardado con save
+
+        Args:
+            path: Ruta del archivo
+
+        Returns:
+            BM25Index: Índice listo para buscar, o None si no existe o no se puede leer
+        """
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"Error cargando índice léxico {path}: {e}")
+            return None
+
+        index = cls(k1=data["k1"], b=data["b"], max_df_ratio=data["max_df_ratio"])
+        index.ids = data["ids"]
+        index.doc_lengths = data["doc_lengths"]
+        index.total_length = sum(index.doc_lengths)
+        index.postings = data["postings"]
+        return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], rrf_k: int) -> List[Tuple[str, float]]:
+    """
+    Fusiona rankings con Reciprocal Rank Fusion
+
+    Args:
+        rankings: Listas de ids ordenadas de más a menos relevante
+        rrf_k: Constante de suavizado (60 es el valor habitual)
+
+    Returns:
+        List[Tuple[str, float]]: Ids con su puntaje fusionado, de mayor a menor
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
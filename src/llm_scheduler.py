@@ -0,0 +1,190 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+# Clases de prioridad, de mayor a menor: reescritura de la consulta y resumen del
+# historial (llamadas cortas que bloquean el inicio de una respuesta), respuestas a
+# consultas directas y redacción de documentos de la fase 3
+PRIORITIES = ("contextualize", "direct", "draft")
+
+
+class LLMBusyError(RuntimeError):
+    """El LLM no puede atender la solicitud por sobrecarga"""
+
+
+class LLMQueueFullError(LLMBusyError):
+    """La cola de la clase de prioridad está llena"""
+
+
+class LLMQueueTimeoutError(LLMBusyError):
+    """La solicitud esperó en cola más que el máximo permitido"""
+
+
+class _Waiter:
+    """Solicitud en cola: un Event (ruta síncrona) o un Future de asyncio"""
+
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class LLMScheduler:
+    """
+    Limita las llamadas simultáneas al LLM y las atiende por prioridad
+
+    A lo más max_in_flight llamadas se ejecutan a la vez; las demás esperan en una
+    cola FIFO por clase de prioridad y, al liberarse un cupo, se atiende primero la
+    clase más prioritaria. Si la cola de una clase está llena la solicitud se rechaza
+    de inmediato (LLMQueueFullError) y si espera más de queue_timeout se rechaza con
+    LLMQueueTimeoutError. Sirve tanto a hilos como a corrutinas: un mismo cupo se
+    comparte entre la ruta síncrona y la asíncrona.
+    """
+
+    def __init__(self, max_in_flight: int, queue_limits: Dict[str, int], queue_timeout: float,
+                 metrics=None):
+        """
+        Args:
+            max_in_flight: Llamadas simultáneas permitidas (0 o menos: sin límite)
+            queue_limits: Solicitudes en espera permitidas por clase de prioridad
+            queue_timeout: Segundos máximos de espera en cola
+            metrics: Registro de métricas donde informar el tiempo en cola (opcional)
+        """
+        self.max_in_flight = max_in_flight
+        self.queue_limits = queue_limits
+        self.queue_timeout = queue_timeout
+        self.metrics = metrics
+        self.in_flight = 0
+        self.rejected = {priority: 0 for priority in PRIORITIES}
+        self.timeouts = {priority: 0 for priority in PRIORITIES}
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, priority: str) -> Iterator[None]:
+        """
+        Ocupa un cupo durante el bloque, esperando en cola si no hay cupos libres
+
+        Args:
+            priority: Clase de prioridad ("contextualize", "direct" o "draft")
+
+        Raises:
+            LLMQueueFullError: Si la cola de la clase está llena
+            LLMQueueTimeoutError: Si no se obtuvo un cupo dentro de queue_timeout
+        """
+        start = time.perf_counter()
+        waiter = self._enqueue(priority, None)
+        if waiter is not None and not waiter.event.wait(self.queue_timeout):
+            self._abandon(priority, waiter)
+        self._observe_wait(priority, start)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: str) -> AsyncIterator[None]:
+        """Versión asíncrona de slot: espera el cupo sin bloquear el event loop"""
+        start = time.perf_counter()
+        waiter = self._enqueue(priority, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._abandon(priority, waiter)
+            except asyncio.CancelledError:
+                # Si el cupo ya se había asignado se devuelve antes de propagar la cancelación
+                if self._withdraw(priority, waiter):
+                    self._release()
+                raise
+        self._observe_wait(priority, start)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _enqueue(self, priority: str, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """Toma un cupo libre (retorna None) o encola la solicitud (retorna su _Waiter)"""
+        if priority not in self._queues:
+            raise ValueError(f"Prioridad desconocida: {priority}")
+
+        with self._lock:
+            if self.max_in_flight <= 0 or self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                return None
+
+            queue = self._queues[priority]
+            if len(queue) >= self.queue_limits.get(priority, 0):
+                self.rejected[priority] += 1
+                raise LLMQueueFullError(f"Cola de solicitudes '{priority}' llena ({len(queue)} en espera)")
+
+            waiter = _Waiter(loop)
+            queue.append(waiter)
+            return waiter
+
+    def _withdraw(self, priority: str, waiter: _Waiter) -> bool:
+        """Saca una solicitud de la cola; retorna True si ya se le había asignado un cupo"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._queues[priority].remove(waiter)
+            return False
+
+    def _abandon(self, priority: str, waiter: _Waiter):
+        """Tras agotar la espera: rechaza la solicitud salvo que el cupo llegara justo a tiempo"""
+        if self._withdraw(priority, waiter):
+            return
+        with self._lock:
+            self.timeouts[priority] += 1
+        raise LLMQueueTimeoutError(
+            f"Sin cupo para una solicitud '{priority}' tras {self.queue_timeout:g}s en cola"
+        )
+
+    def _release(self):
+        """Libera un cupo entregándolo directamente a la solicitud en espera más prioritaria"""
+        with self._lock:
+            for priority in PRIORITIES:
+                queue = self._queues[priority]
+                if queue:
+                    waiter = queue.popleft()
+                    waiter.granted = True
+                    waiter.wake()
+                    return
+            self.in_flight -= 1
+
+    def _observe_wait(self, priority: str, start: float):
+        if self.metrics is not None:
+            self.metrics.observe("queue_wait", priority, time.perf_counter() - start)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene el estado del planificador
+
+        Returns:
+            Dict: Llamadas en curso, límite, y por clase: en cola, rechazadas por cola
+            llena y rechazadas por tiempo de espera
+        """
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queued": {priority: len(queue) for priority, queue in self._queues.items()},
+                "rejected": dict(self.rejected),
+                "timeouts": dict(self.timeouts)
+            }
@@ -0,0 +1,339 @@
+import os
+import pickle
+import re
+import unicodedata
+from array import array
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+import numpy as np
+from langchain_core.documents import Document
+
+_SPACES = re.compile(r"\s+")
+# Números de artículo, sin tomar números de ley con puntos como "19.496"
+_ARTICLE_PATTERN = re.compile(r"(?<![\d.])(\d+)(?![\d.])(?:\s*(bis|ter|quater|quinquies))?")
+_DATE_FORMATS = ("%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y", "%Y/%m/%d", "%d.%m.%Y")
+_MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12
+}
+_SPANISH_DATE = re.compile(r"(\d{1,2})\s+de\s+([a-z]+)\s+(?:de|del)\s+(\d{4})")
+
+FILTER_KEYS = ("corte", "fecha_desde", "fecha_hasta", "articulo")
+
+
+def normalize_label(value: Any) -> str:
+    """
+    Normaliza un texto para compararlo: minúsculas, sin acentos y espacios simples
+
+    Args:
+        value: Texto (o valor) a normalizar
+
+    Returns:
+        str: Texto normalizado, "" si el valor está vacío
+    """
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    text = unicodedata.normalize("NFD", str(value).lower())
+    text = "".join(char for char in text if unicodedata.category(char) != "Mn")
+    return _SPACES.sub(" ", text).strip()
+
+
+def parse_date(value: Any) -> int:
+    """
+    Convierte una fecha de sentencia a un entero AAAAMMDD comparable
+
+    Acepta los formatos numéricos habituales (dd-mm-aaaa, aaaa-mm-dd, con guiones,
+    barras o puntos) y fechas escritas como "5 de marzo de 2021".
+
+    Args:
+        value: Fecha en texto, date o entero AAAAMMDD
+
+    Returns:
+        int: Fecha como AAAAMMDD, o 0 si no se puede interpretar
+    """
+    if isinstance(value, (date, datetime)):
+        return value.year * 10000 + value.month * 100 + value.day
+    if isinstance(value, int):
+        return value if 10000101 <= value <= 99991231 else 0
+
+    text = normalize_label(value)
+    if not text:
+        return 0
+
+    # Las fechas con hora ("2021-03-05 00:00:00") se comparan por el día
+    candidate = text.split(" ")[0]
+    for date_format in _DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(candidate, date_format)
+            return parsed.year * 10000 + parsed.month * 100 + parsed.day
+        except ValueError:
+            continue
+
+    match = _SPANISH_DATE.search(text)
+    if match and match.group(2) in _MONTHS:
+        try:
+            parsed = date(int(match.group(3)), _MONTHS[match.group(2)], int(match.group(1)))
+            return parsed.year * 10000 + parsed.month * 100 + parsed.day
+        except ValueError:
+            return 0
+    return 0
+
+
+def parse_articles(value: Any) -> List[str]:
+    """
+    Extrae los números de artículo citados en un campo de metadatos
+
+    Args:
+        value: Texto como "['Art. 12', 'Artículo 3 bis']" o una lista
+
+    Returns:
+        List[str]: Claves normalizadas sin repetir ("12", "3 bis"), en orden de aparición
+    """
+    if isinstance(value, (list, tuple)):
+        value = " ".join(str(item) for item in value)
+
+    keys = []
+    for number, suffix in _ARTICLE_PATTERN.findall(normalize_label(value)):
+        key = f"{int(number)} {suffix}" if suffix else str(int(number))
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+def article_key(value: Any) -> Optional[str]:
+    """
+    Clave normalizada de un único artículo ("Artículo 3 bis" -> "3 bis")
+
+    Args:
+        value: Nombre o número del artículo
+
+    Returns:
+        str: Clave del artículo, o None si no contiene un número
+    """
+    keys = parse_articles(value)
+    return keys[0] if keys else None
+
+
+def case_metadata_fields(corte: Any, fecha: Any, articulos: Any) -> Dict[str, Any]:
+    """
+    Campos normalizados que se agregan a los metadatos de cada chunk de fallo
+
+    Los valores son escalares para que cualquier backend vectorial pueda guardarlos.
+
+    Args:
+        corte: Corte de origen
+        fecha: Fecha de la sentencia
+        articulos: Artículos mencionados
+
+    Returns:
+        Dict: "Corte_normalizada", "Fecha_ordinal" (AAAAMMDD o 0) y
+        "Articulos_normalizados" (claves separadas por "|")
+    """
+    return {
+        "Corte_normalizada": normalize_label(corte),
+        "Fecha_ordinal": parse_date(fecha),
+        "Articulos_normalizados": "|".join(parse_articles(articulos))
+    }
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Valida y normaliza los filtros de fallos
+
+    Args:
+        filters: Diccionario con "corte", "fecha_desde", "fecha_hasta" y/o "articulo";
+            las claves con valor vacío se ignoran
+
+    Returns:
+        Dict: Filtros normalizados (vacío si no hay ninguno)
+
+    Raises:
+        ValueError: Si hay claves desconocidas o una fecha o artículo no se puede interpretar
+    """
+    if not filters:
+        return {}
+
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Filtros desconocidos: {', '.join(sorted(unknown))}")
+
+    normalized = {}
+    if filters.get("corte"):
+        normalized["corte"] = normalize_label(filters["corte"])
+    for key in ("fecha_desde", "fecha_hasta"):
+        if filters.get(key):
+            value = parse_date(filters[key])
+            if not value:
+                raise ValueError(f"Fecha no válida en {key}: {filters[key]}")
+            normalized[key] = value
+    if filters.get("articulo"):
+        key = article_key(filters["articulo"])
+        if key is None:
+            raise ValueError(f"Artículo no válido: {filters['articulo']}")
+        normalized["articulo"] = key
+    return normalized
+
+
+def _as_positions(values: array) -> np.ndarray:
+    """Vista NumPy (sin copia) de un array("I") de posiciones o fechas"""
+    if not len(values):
+        return np.zeros(0, dtype=np.uint32)
+    return np.frombuffer(values, dtype=np.uint32)
+
+
+class MetadataIndex:
+    """
+    Índices invertidos sobre los metadatos normalizados de los fallos
+
+    Mantiene las posiciones de los chunks por corte y por artículo citado, y las
+    fechas en un arreglo compacto, de modo que un filtro se resuelve en el conjunto
+    de ids candidatos antes de la búsqueda vectorial.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.dates = array("I")
+        # valor normalizado -> posiciones de los chunks, en arrays compactos
+        self.by_court: Dict[str, array] = {}
+        self.by_article: Dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, doc_id: str, document: Document):
+        """
+        Agrega un chunk al índice
+
+        Un mismo id puede agregarse varias veces: los chunks casi duplicados que no se
+        indexan se registran con el id de su representante.
+
+        Args:
+            doc_id: Id del chunk en la colección
+            document: Documento con los metadatos normalizados de case_metadata_fields
+        """
+        metadata = document.metadata
+        if "Corte_normalizada" in metadata:
+            fields = metadata
+        else:
+            fields = case_metadata_fields(
+                metadata.get("Corte_origen"), metadata.get("Fecha_Sentencia"),
+                metadata.get("Articulos_mencionados")
+            )
+
+        position = len(self.ids)
+        self.ids.append(doc_id)
+        self.dates.append(int(fields.get("Fecha_ordinal") or 0))
+
+        court = fields.get("Corte_normalizada")
+        if court:
+            self.by_court.setdefault(court, array("I")).append(position)
+        for key in filter(None, str(fields.get("Articulos_normalizados") or "").split("|")):
+            self.by_article.setdefault(key, array("I")).append(position)
+
+    def candidates(self, filters: Dict[str, Any]) -> Optional[List[str]]:
+        """
+        Resuelve filtros normalizados en los ids de los chunks que los cumplen
+
+        La corte se compara exacta y, si no hay coincidencia exacta, por contención
+        (p. ej. "santiago" coincide con "corte de apelaciones de santiago").
+
+        Args:
+            filters: Filtros retornados por normalize_filters
+
+        Returns:
+            List[str]: Ids candidatos (posiblemente vacía), o None si no hay filtros
+        """
+        if not filters:
+            return None
+
+        positions = None
+        if "corte" in filters:
+            positions = self._court_positions(filters["corte"])
+        if "articulo" in filters:
+            article_positions = _as_positions(self.by_article.get(filters["articulo"], array("I")))
+            positions = article_positions if positions is None else np.intersect1d(positions, article_positions)
+
+        if "fecha_desde" in filters or "fecha_hasta" in filters:
+            dates = _as_positions(self.dates)
+            if positions is None:
+                positions = np.arange(len(self.ids), dtype=np.uint32)
+            selected = dates[positions]
+            # Los fallos sin fecha reconocible quedan fuera de cualquier rango
+            mask = selected > 0
+            if "fecha_desde" in filters:
+                mask &= selected >= filters["fecha_desde"]
+            if "fecha_hasta" in filters:
+                mask &= selected <= filters["fecha_hasta"]
+            positions = positions[mask]
+
+        # Un representante aparece una vez por cada duplicado que cumple el filtro
+        return list(dict.fromkeys(self.ids[position] for position in positions))
+
+    def _court_positions(self, court: str) -> np.ndarray:
+        """Posiciones de los chunks de una corte (coincidencia exacta o por contención)"""
+        if court in self.by_court:
+            return _as_positions(self.by_court[court])
+
+        matches = [positions for name, positions in self.by_court.items() if court in name]
+        if not matches:
+            return np.zeros(0, dtype=np.uint32)
+        return np.unique(np.concatenate([_as_positions(positions) for positions in matches]))
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Obtiene el tamaño del índice
+
+        Returns:
+            Dict: Chunks, cortes y artículos distintos indexados
+        """
+        return {
+            "documents": len(self.ids),
+            "courts": len(self.by_court),
+            "articles": len(self.by_article)
+        }
+
+    def save(self, path: str):
+        """
+        Guarda el índice en disco
+
+        Args:
+            path: Ruta del archivo
+        """
+        data = {
+            "ids": self.ids,
+            "dates": self.dates,
+            "by_court": self.by_court,
+            "by_article": self.by_article
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["MetadataIndex"]:
+        """
+        Carga un índice guardado con save
+
+        Args:
+            path: Ruta del archivo
+
+        Returns:
+            MetadataIndex: Índice listo para filtrar, o None si no existe o no se puede leer
+        """
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"Error cargando índice de metadatos {path}: {e}")
+            return None
+
+        index = cls()
+        index.ids = data["ids"]
+        index.dates = data["dates"]
+        index.by_court = data["by_court"]
+        index.by_article = data["by_article"]
+        return index
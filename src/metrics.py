@@ -0,0 +1,204 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+from langchain_core.messages import BaseMessage
+from .tokens import estimate_tokens
+
+# Límites superiores de los buckets de cada histograma
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160, 320)
+
+# Nombre, ayuda y buckets de los histogramas exportados
+HISTOGRAMS = {
+    "stage": ("legal_rag_stage_duration_seconds", "Duración de cada etapa de una consulta", LATENCY_BUCKETS),
+    "input_tokens": ("legal_rag_llm_input_tokens", "Tokens del prompt por llamada al LLM", TOKEN_BUCKETS),
+    "output_tokens": ("legal_rag_llm_output_tokens", "Tokens generados por llamada al LLM", TOKEN_BUCKETS),
+    "tokens_per_second": ("legal_rag_llm_tokens_per_second", "Velocidad de generación del LLM",
+                          TOKENS_PER_SECOND_BUCKETS),
+    "queue_wait": ("legal_rag_llm_queue_wait_seconds", "Espera en la cola del LLM por clase de prioridad",
+                   LATENCY_BUCKETS)
+}
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos, como los de Prometheus"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # El último contador corresponde al bucket +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estima un cuantil interpolando dentro del bucket que lo contiene
+
+        Args:
+            q: Cuantil entre 0 y 1
+
+        Returns:
+            float: Valor estimado (el último límite finito si cae en +Inf, 0 sin observaciones)
+        """
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+def generation_usage(response: Optional[BaseMessage], prompt: Sequence[BaseMessage],
+                     answer: str) -> Tuple[int, int, Optional[float]]:
+    """
+    Obtiene los tokens de entrada y salida de una respuesta del LLM
+
+    Ollama informa los tokens reales (prompt_eval_count / eval_count) y el tiempo de
+    generación; si la respuesta no los trae se estiman a partir del texto.
+
+    Args:
+        response: Mensaje (o suma de chunks de streaming) retornado por el modelo
+        prompt: Mensajes enviados al modelo
+        answer: Texto generado
+
+    Returns:
+        Tuple: (tokens_entrada, tokens_salida, segundos_de_generación o None)
+    """
+    usage = getattr(response, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens") or sum(estimate_tokens(str(message.content)) for message in prompt)
+    output_tokens = usage.get("output_tokens") or estimate_tokens(answer)
+
+    eval_duration = (getattr(response, "response_metadata", None) or {}).get("eval_duration")
+    seconds = eval_duration / 1e9 if eval_duration else None
+    return input_tokens, output_tokens, seconds
+
+
+class Metrics:
+    """
+    Histogramas de latencia por etapa y de uso de tokens del LLM
+
+    Las etapas se miden con el context manager stage(); las llamadas al LLM se
+    registran con record_generation. Todo se agrega en memoria y se exporta en el
+    formato de texto de Prometheus o como resumen para la CLI.
+    """
+
+    def __init__(self):
+        # (histograma, etapa) -> Histogram
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, histogram: str, stage: str, value: float):
+        """
+        Registra una observación
+
+        Args:
+            histogram: Clave en HISTOGRAMS ("stage", "input_tokens", ...)
+            stage: Etiqueta de la etapa
+            value: Valor observado
+        """
+        key = (histogram, stage)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(HISTOGRAMS[histogram][2])
+            self._histograms[key].observe(value)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Mide la duración de una etapa, incluso si termina con una excepción
+
+        Args:
+            name: Nombre de la etapa ("classify", "embed_query", "llm", ...)
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage", name, time.perf_counter() - start)
+
+    def record_generation(self, stage: str, response: Optional[BaseMessage],
+                          prompt: Sequence[BaseMessage], answer: str, elapsed: float):
+        """
+        Registra los tokens de entrada/salida y la velocidad de una llamada al LLM
+
+        Args:
+            stage: Nombre de la llamada ("llm", "contextualize")
+            response: Mensaje retornado por el modelo (None si no se obtuvo)
+            prompt: Mensajes enviados al modelo
+            answer: Texto generado
+            elapsed: Segundos de la llamada, usados si el modelo no informa su tiempo de generación
+        """
+        input_tokens, output_tokens, seconds = generation_usage(response, prompt, answer)
+        self.observe("input_tokens", stage, input_tokens)
+        self.observe("output_tokens", stage, output_tokens)
+        seconds = seconds or elapsed
+        if output_tokens and seconds > 0:
+            self.observe("tokens_per_second", stage, output_tokens / seconds)
+
+    def render_prometheus(self) -> str:
+        """
+        Exporta los histogramas en el formato de texto de Prometheus
+
+        Returns:
+            str: Métricas listas para servir en /metrics
+        """
+        with self._lock:
+            snapshot = {
+                key: (list(hist.counts), hist.sum, hist.count, hist.buckets)
+                for key, hist in self._histograms.items()
+            }
+
+        lines = []
+        for histogram, (name, help_text, _) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (key, stage), (counts, total, count, buckets) in sorted(snapshot.items()):
+                if key != histogram:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def get_summary(self) -> Dict[str, Any]:
+        """
+        Resume los histogramas para mostrarlos en la CLI
+
+        Returns:
+            Dict: "stages" y "queue_wait" con count, mean_ms, p50_ms y p95_ms por etapa o
+            clase de prioridad, y "llm" con tokens de entrada/salida promedio y tokens
+            por segundo por llamada
+        """
+        summary: Dict[str, Dict[str, Dict[str, float]]] = {"stages": {}, "queue_wait": {}, "llm": {}}
+        with self._lock:
+            for (histogram, stage), hist in sorted(self._histograms.items()):
+                if histogram in ("stage", "queue_wait"):
+                    summary["stages" if histogram == "stage" else "queue_wait"][stage] = {
+                        "count": hist.count,
+                        "mean_ms": round(hist.sum / hist.count * 1000, 1),
+                        "p50_ms": round(hist.quantile(0.5) * 1000, 1),
+                        "p95_ms": round(hist.quantile(0.95) * 1000, 1)
+                    }
+                else:
+                    summary["llm"].setdefault(stage, {})[f"avg_{histogram}"] = round(hist.sum / hist.count, 1)
+        return summary
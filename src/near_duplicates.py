@@ -0,0 +1,175 @@
+import json
+import os
+import re
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+import numpy as np
+from langchain_core.documents import Document
+
+# Primo de Mersenne 2^31 - 1: los productos a * x caben en uint64 sin desbordar
+_PRIME = (1 << 31) - 1
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class MinHasher:
+    """Calcula firmas MinHash de un texto a partir de shingles de palabras"""
+
+    def __init__(self, num_perm: int, shingle_size: int, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Calcula la firma MinHash de un texto
+
+        Args:
+            text: Texto a firmar
+
+        Returns:
+            np.ndarray: Firma de num_perm valores uint32
+        """
+        words = _WORD_PATTERN.findall(text.lower())
+        size = self.shingle_size
+        if len(words) <= size:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) % _PRIME for shingle in shingles),
+            dtype=np.uint64, count=len(shingles)
+        )
+        values = (np.outer(hashes, self.a) + self.b) % _PRIME
+        return values.min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateFilter:
+    """
+    Filtra en streaming los chunks casi duplicados usando MinHash y LSH por bandas
+
+    El primer chunk de cada grupo se conserva como representante y se indexa; los
+    siguientes cuya similitud de Jaccard estimada con él supere el umbral no se
+    indexan y quedan enlazados al representante en un archivo aparte.
+    """
+
+    def __init__(self, threshold: float, num_perm: int, bands: int, shingle_size: int,
+                 key_fn: Callable[[Document], str]):
+        if num_perm % bands:
+            raise ValueError("El número de permutaciones debe ser múltiplo del número de bandas")
+
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.key_fn = key_fn
+
+        self.total = 0
+        self.links: Dict[str, List[Dict[str, Any]]] = {}
+        self._keys: List[str] = []
+        self._signatures: List[np.ndarray] = []
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+
+    def filter(self, documents: Iterable[Document],
+               duplicate_observers: Sequence[Any] = ()) -> Iterator[Document]:
+        """
+        Entrega solo los documentos que no son casi duplicados de uno anterior
+
+        Args:
+            documents: Documentos en orden de indexación (puede ser un generador)
+            duplicate_observers: Índices que también registran los duplicados, bajo el
+                id de su representante (p. ej. el índice de metadatos)
+
+        Yields:
+            Document: Representantes a indexar
+        """
+        for document in documents:
+            self.total += 1
+            signature = self.hasher.signature(document.page_content)
+            band_keys = self._band_keys(signature)
+            key = self.key_fn(document)
+
+            representative = self._find_representative(signature, band_keys)
+            if representative is not None:
+                self.links.setdefault(self._keys[representative], []).append({
+                    "id": key,
+                    "Rol": document.metadata.get("Rol"),
+                    "chunk_index": document.metadata.get("chunk_index")
+                })
+                for observer in duplicate_observers:
+                    observer.add(self._keys[representative], document)
+                continue
+
+            position = len(self._keys)
+            self._keys.append(key)
+            self._signatures.append(signature)
+            for band, band_key in enumerate(band_keys):
+                self._buckets[band].setdefault(band_key, []).append(position)
+            yield document
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        """Divide la firma en bandas; dos textos son candidatos si coinciden en alguna"""
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _find_representative(self, signature: np.ndarray, band_keys: List[bytes]) -> Optional[int]:
+        """Busca el representante más similar por encima del umbral entre los candidatos LSH"""
+        best, best_similarity = None, self.threshold
+        checked = set()
+
+        for band, band_key in enumerate(band_keys):
+            for candidate in self._buckets[band].get(band_key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                similarity = np.count_nonzero(self._signatures[candidate] == signature) / len(signature)
+                if similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+
+        return best
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene las estadísticas de la deduplicación
+
+        Returns:
+            Dict: Chunks totales, indexados, enlazados como duplicados y razón de compresión
+        """
+        indexed = len(self._keys)
+        return {
+            "total_chunks": self.total,
+            "indexed_chunks": indexed,
+            "duplicates": self.total - indexed,
+            "compression_ratio": round(self.total / indexed, 3) if indexed else 1.0
+        }
+
+    def save(self, path: str):
+        """
+        Guarda las estadísticas y los enlaces representante → duplicados
+
+        Args:
+            path: Ruta del archivo JSON
+        """
+        data = {"stats": self.get_stats(), "links": self.links}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load_stats(path: str) -> Optional[Dict[str, Any]]:
+        """
+        Lee las estadísticas guardadas por save
+
+        Args:
+            path: Ruta del archivo JSON
+
+        Returns:
+            Dict: Estadísticas, o None si el archivo no existe o no se puede leer
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get("stats")
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,37 @@
+from typing import Any, Dict
+import httpx
+
+
+def create_ollama_client_kwargs(config) -> Dict[str, Any]:
+    """
+    Parámetros comunes de ChatOllama y OllamaEmbeddings
+
+    Ambos modelos reciben los mismos transportes HTTP, por lo que comparten un único
+    pool de conexiones persistentes (uno síncrono y uno asíncrono) con los límites,
+    timeouts y reintentos configurados, y piden a Ollama mantener los modelos cargados.
+
+    Args:
+        config: Configuración del sistema
+
+    Returns:
+        Dict: Argumentos para el constructor de ChatOllama u OllamaEmbeddings
+    """
+    limits = httpx.Limits(
+        max_connections=config.OLLAMA_MAX_CONNECTIONS,
+        max_keepalive_connections=config.OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.OLLAMA_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(config.OLLAMA_TIMEOUT, connect=config.OLLAMA_CONNECT_TIMEOUT)
+
+    return {
+        "base_url": config.OLLAMA_BASE_URL,
+        "keep_alive": config.OLLAMA_KEEP_ALIVE,
+        "client_kwargs": {"timeout": timeout},
+        # Los reintentos de httpx solo repiten conexiones fallidas, nunca una solicitud ya enviada
+        "sync_client_kwargs": {
+            "transport": httpx.HTTPTransport(limits=limits, retries=config.OLLAMA_RETRIES)
+        },
+        "async_client_kwargs": {
+            "transport": httpx.AsyncHTTPTransport(limits=limits, retries=config.OLLAMA_RETRIES)
+        }
+    }
@@ -0,0 +1,100 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class QueryCache:
+    """
+    Caché LRU en proceso de embeddings de consulta y resultados de retrieval
+
+    Cada entrada guarda el embedding de la consulta normalizada y los ids recuperados
+    por colección junto a su distancia. La caché se invalida por completo cuando el
+    índice se reconstruye, lo que incrementa su versión.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """
+        Normaliza una consulta para usarla como clave
+
+        Args:
+            query: Consulta del usuario
+
+        Returns:
+            str: Consulta en minúsculas, sin espacios repetidos ni signos de apertura/cierre
+        """
+        text = unicodedata.normalize("NFKC", query).lower()
+        text = re.sub(r"\s+", " ", text)
+        return text.strip(" ¿?¡!.")
+
+    def get(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca una consulta en la caché
+
+        Args:
+            query: Consulta del usuario
+
+        Returns:
+            Dict: Entrada con "embedding" y "results", o None si no está en caché
+        """
+        key = self.normalize(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, query: str, embedding: List[float],
+            results: Dict[str, List[Tuple[str, float]]], version: int):
+        """
+        Guarda el embedding y los resultados de una consulta
+
+        Args:
+            query: Consulta del usuario
+            embedding: Embedding de la consulta
+            results: Ids y distancias recuperados por colección
+            version: Versión del índice con la que se calcularon los resultados
+        """
+        key = self.normalize(query)
+        with self._lock:
+            # Resultados calculados antes de una reconstrucción ya no son válidos
+            if version != self.version:
+                return
+            self._entries[key] = {"embedding": embedding, "results": results}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Vacía la caché e incrementa la versión del índice"""
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Obtiene las estadísticas de la caché
+
+        Returns:
+            Dict: Aciertos, fallos, entradas y versión del índice
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "index_version": self.version
+            }
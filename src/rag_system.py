@@ -1,12 +1,30 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Iterator, AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 from langchain_core.documents import Document
-from langchain_chroma import Chroma
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.prompts import SystemMessagePromptTemplate
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage
 from .config import Config
 from .data_loader import DataLoader
+from .indexing import IncrementalIndexer, compute_document_id
+from .embedding_cache import CachedEmbeddings, create_cached_embeddings
+from .query_cache import QueryCache
+from .lexical_index import BM25Index, reciprocal_rank_fusion
+from .vector_backends import NumpyVectorStore, count_documents, search_by_vector
+from .history import format_history
+from .context_packer import ContextPacker
+from .near_duplicates import NearDuplicateFilter
+from .metadata_index import MetadataIndex, article_key, normalize_filters
+from .citation_graph import CitationGraph
+from .metrics import Metrics
+from .embedding_batcher import QueryEmbeddingBatcher
+from .llm_scheduler import LLMBusyError, LLMScheduler
+from .ollama_client import create_ollama_client_kwargs
+import json
 import os
 
 class RAGSystem:
@@ -16,13 +34,58 @@ class RAGSystem:
         self.config = Config()
         self.data_loader = DataLoader()
         
-        # Inicializar modelos
-        self.llm = ChatOllama(model=self.config.LLM_MODEL)
-        self.embeddings = OllamaEmbeddings(model=self.config.EMBEDDING_MODEL)
+        # Inicializar modelos (con un pool HTTP compartido hacia Ollama)
+        client_kwargs = create_ollama_client_kwargs(self.config)
+        self.llm = ChatOllama(model=self.config.LLM_MODEL, **client_kwargs)
+        self.embedding_model = OllamaEmbeddings(model=self.config.EMBEDDING_MODEL, **client_kwargs)
+        self.embeddings = create_cached_embeddings(self.embedding_model, self.config)
+        self.indexer = IncrementalIndexer(self.embeddings)
         
-        # Vector stores
-        self.vector_store_law = None
-        self.vector_store_cases = None
+        # Agrupa los embeddings de consultas concurrentes (ruta asíncrona) en una sola llamada
+        self.query_batcher = None
+        if self.config.QUERY_EMBEDDING_BATCH_WINDOW_MS > 0:
+            self.query_batcher = QueryEmbeddingBatcher(
+                self.embeddings,
+                self.config.QUERY_EMBEDDING_BATCH_WINDOW_MS / 1000,
+                self.config.QUERY_EMBEDDING_BATCH_MAX
+            )
+        
+        # Vector stores por nombre de colección; se abren en el primer uso
+        # (ver las propiedades vector_store_law y vector_store_cases)
+        self._vector_stores = {}
+        self._vector_store_lock = threading.Lock()
+        
+        # Índices BM25 por colección ("leyes", "fallos") para el modo híbrido
+        self.lexical_indexes = {}
+        
+        # Índices invertidos de metadatos de fallos (corte, fecha, artículo) para los filtros
+        self.metadata_index = None
+        
+        # Grafo artículo → fallos que lo citan, para CASE_RETRIEVAL_MODE = "graph"
+        self.citation_graph = None
+        
+        # Caché LRU de embeddings de consulta y resultados, invalidada al reindexar
+        self.query_cache = QueryCache(self.config.QUERY_CACHE_MAX_ENTRIES)
+        self.duplicate_stats = None
+        
+        # Histogramas de latencia por etapa y de tokens del LLM (ver /metrics y /estado)
+        self.metrics = Metrics()
+        
+        # Cupos y colas por prioridad para todas las llamadas al LLM
+        self.llm_scheduler = LLMScheduler(
+            self.config.LLM_MAX_IN_FLIGHT,
+            self.config.LLM_QUEUE_LIMITS,
+            self.config.LLM_QUEUE_TIMEOUT,
+            self.metrics
+        )
+        self.context_packer = ContextPacker(
+            self.config.CONTEXT_TOKEN_BUDGET,
+            self.config.CONTEXT_CHUNK_MAX_TOKENS,
+            self.config.CONTEXT_MIN_CHUNK_TOKENS
+        )
+        
+        # Pool compartido para ejecutar las búsquedas de ambas colecciones en paralelo
+        self.retrieval_executor = ThreadPoolExecutor(max_workers=self.config.RETRIEVAL_WORKERS)
         
         # Estado de inicialización
         self.initialized = False
@@ -42,6 +105,7 @@ class RAGSystem:
             3. Mantén coherencia con las respuestas anteriores
             4. Si la consulta actual se relaciona con temas anteriores, hazlo explícito
             5. Cita las fuentes específicas cuando sea relevante
+            6. Si la pregunta hace referencia a mensajes anteriores ("eso", "ese artículo"), interprétala usando el historial
             
             CONTEXTO LEGAL:
             {context}
@@ -55,79 +119,276 @@ class RAGSystem:
         """Inicializa el sistema cargando datos y creando vector stores"""
         print("Inicializando sistema RAG...")
 
-        law_path = "./chroma_db"
-        cases_path = "./chroma_db"
-
-        os.makedirs(law_path, exist_ok=True)
+        persist_dir = self.config.CHROMA_DIR
+        os.makedirs(persist_dir, exist_ok=True)
 
-        db_exists = os.path.exists(os.path.join(law_path, "chroma.sqlite3"))
+        db_exists = os.path.exists(os.path.join(persist_dir, "chroma.sqlite3"))
 
-        if db_exists:
+        # Con el índice al día las colecciones no se abren aquí sino en el primer uso
+        # (o en warm_up), por lo que el arranque solo lee el manifiesto y los índices auxiliares
+        if db_exists and not self.config.INCREMENTAL_INDEXING:
             print("Bases vectoriales existentes detectadas. Cargando desde disco...")
-
-            self.vector_store_law = Chroma(
-                collection_name="leyes_collection",
-                embedding_function=self.embeddings,
-                persist_directory=law_path
-            )
-            self.vector_store_cases = Chroma(
-                collection_name="fallos_collection",
-                embedding_function=self.embeddings,
-                persist_directory=cases_path
-            )
+            if not self._load_lexical_indexes():
+                print("Índices léxicos no encontrados; se usará solo búsqueda densa")
+            if not self._load_metadata_index():
+                print("Índice de metadatos no encontrado; los filtros de fallos no estarán disponibles")
+            if not self._load_citation_graph():
+                print("Grafo de citas no encontrado; los fallos se buscarán por similitud")
+            self.duplicate_stats = NearDuplicateFilter.load_stats(self._duplicates_path())
+        elif (db_exists and self.indexer.is_up_to_date(persist_dir)
+              and self._load_lexical_indexes() and self._load_metadata_index()
+              and self._load_citation_graph()):
+            print("Bases vectoriales al día con los datos. Cargando desde disco...")
+            self.duplicate_stats = NearDuplicateFilter.load_stats(self._duplicates_path())
         else:
-            print("Bases vectoriales no encontradas. Procesando documentos y creando nuevas...")
-            law_docs, case_docs = self.data_loader.load_all_documents(case_batch_size=100)
+            print("Sincronizando bases vectoriales con los documentos...")
+            if not self.config.validate_files():
+                raise FileNotFoundError("No se encontraron los archivos de datos")
 
-            self.vector_store_law = Chroma(
-                collection_name="leyes_collection",
-                embedding_function=self.embeddings,
-                persist_directory=law_path
-            )
-            if law_docs:
-                self.vector_store_law.add_documents(law_docs)
-                print(f"Vector store de leyes: {len(law_docs)} documentos")
+            self._create_lexical_indexes()
+            self.metadata_index = MetadataIndex()
+            self.citation_graph = CitationGraph()
 
-            self.vector_store_cases = Chroma(
-                collection_name="fallos_collection",
-                embedding_function=self.embeddings,
-                persist_directory=cases_path
-            )
-            if case_docs:
-                # Agregar documentos por lotes
-                batch_size = 5000  # Menor que el límite de 5461
-                total_docs = len(case_docs)
-    
-                print(f"Agregando {total_docs} documentos al vector store en lotes de {batch_size}")
-    
-                for i in range(0, total_docs, batch_size):
-                    batch_end = min(i + batch_size, total_docs)
-                    batch = case_docs[i:batch_end]
-        
-                    batch_num = (i // batch_size) + 1
-                    total_batches = (total_docs + batch_size - 1) // batch_size
-        
-                    print(f"Procesando lote {batch_num}/{total_batches}: documentos {i} a {batch_end}")
-        
-                    try:
-                        self.vector_store_cases.add_documents(batch)
-                        print(f"Lote {batch_num} agregado exitosamente")
-                    except Exception as e:
-                        print(f"Error agregando lote {batch_num}: {e}")
-                        # Si falla, intenta con un batch más pequeño
-                        if batch_size > 1000:
-                            smaller_batch_size = 1000
-                            for j in range(0, len(batch), smaller_batch_size):
-                                smaller_batch = batch[j:j+smaller_batch_size]
-                                self.vector_store_cases.add_documents(smaller_batch)
-                        else:
-                            raise e
-    
-                print(f"Vector store de casos: {len(case_docs)} documentos")
+            # Un error de lectura detiene la sincronización antes de escribir el manifiesto
+            law_docs = self.data_loader.read_law_documents()
+            self.indexer.sync(self.vector_store_law, law_docs, "leyes",
+                              observers=self._index_observers("leyes"))
+
+            # Los fallos se consumen en streaming para mantener acotada la memoria
+            case_docs = self.data_loader.iter_case_documents(batch_size=self.config.CASE_LOAD_BATCH_SIZE)
+            duplicate_filter = self._create_duplicate_filter()
+            if duplicate_filter:
+                # Los filtros por metadatos también encuentran los fallos de los duplicados
+                case_docs = duplicate_filter.filter(
+                    case_docs, duplicate_observers=[self.metadata_index]
+                )
+            self.indexer.sync(self.vector_store_cases, case_docs, "fallos",
+                              observers=self._index_observers("fallos"))
+            if duplicate_filter:
+                self._save_duplicate_links(duplicate_filter)
+
+            self._save_lexical_indexes()
+            self._save_metadata_index()
+            self._save_citation_graph()
+            self.indexer.write_manifest(persist_dir)
+            self.query_cache.invalidate()
 
         self.initialized = True
         print("Sistema RAG inicializado correctamente")
     
+    def warm_up(self):
+        """
+        Abre las colecciones y carga los modelos para que la primera consulta no pague ese costo
+        
+        Pensado para ejecutarse en segundo plano después de initialize, mientras el
+        servidor ya acepta conexiones. Los modelos se cargan en paralelo con la apertura
+        de las colecciones.
+        """
+        if not self.initialized:
+            raise RuntimeError("Sistema no inicializado. Llama a initialize() primero")
+        
+        models_future = None
+        if self.config.WARM_UP_MODELS:
+            models_future = self.retrieval_executor.submit(self._warm_up_models)
+        
+        start = time.perf_counter()
+        law_count = count_documents(self.vector_store_law)
+        case_count = count_documents(self.vector_store_cases)
+        print(f"Bases vectoriales abiertas en {time.perf_counter() - start:.1f}s "
+              f"({law_count} artículos, {case_count} fallos)")
+        
+        if models_future is not None:
+            models_future.result()
+    
+    def _warm_up_models(self):
+        """
+        Carga el modelo de embeddings y el de chat en Ollama con una solicitud mínima
+        
+        El embedding se pide al modelo sin caché para que la solicitud llegue a Ollama, y
+        la generación se limita a un token. Un error solo se informa: las consultas
+        cargarán el modelo cuando lleguen.
+        """
+        start = time.perf_counter()
+        try:
+            self.embedding_model.embed_query("consumidor")
+            self.llm.invoke([HumanMessage(content="Hola")], options={"num_predict": 1})
+        except Exception as e:
+            print(f"No se pudieron precargar los modelos: {e}")
+            return
+        print(f"Modelos precargados en {time.perf_counter() - start:.1f}s "
+              f"(keep_alive {self.config.OLLAMA_KEEP_ALIVE}s)")
+    
+    @property
+    def vector_store_law(self):
+        """Colección de leyes, abierta en el primer acceso"""
+        return self._get_vector_store(self.config.LAW_COLLECTION, self.config.LAW_VECTOR_BACKEND)
+    
+    @property
+    def vector_store_cases(self):
+        """Colección de fallos, abierta en el primer acceso"""
+        return self._get_vector_store(self.config.CASES_COLLECTION, self.config.CASES_VECTOR_BACKEND)
+    
+    def _get_vector_store(self, collection_name: str, backend: str):
+        """
+        Obtiene una colección abriéndola una sola vez aunque varios hilos la pidan a la vez
+        
+        Args:
+            collection_name: Nombre de la colección
+            backend: "chroma" o "numpy"
+            
+        Returns:
+            Vector store de la colección
+        """
+        vector_store = self._vector_stores.get(collection_name)
+        if vector_store is None:
+            with self._vector_store_lock:
+                vector_store = self._vector_stores.get(collection_name)
+                if vector_store is None:
+                    vector_store = self._open_vector_store(collection_name, backend)
+                    self._vector_stores[collection_name] = vector_store
+        return vector_store
+    
+    def _lexical_index_path(self, name: str) -> str:
+        """Ruta del índice BM25 de una colección, junto a la base vectorial"""
+        return os.path.join(self.config.CHROMA_DIR, f"bm25_{name}.pkl")
+    
+    def _create_lexical_indexes(self):
+        """Crea índices BM25 vacíos para construirlos durante la sincronización"""
+        self.lexical_indexes = {}
+        if self.config.RETRIEVAL_MODE == "hybrid":
+            self.lexical_indexes = {name: BM25Index() for name in ("leyes", "fallos")}
+    
+    def _load_lexical_indexes(self) -> bool:
+        """
+        Carga los índices BM25 persistidos si el modo híbrido está activo
+        
+        Returns:
+            bool: False si falta algún índice necesario y hay que reconstruirlo
+        """
+        self.lexical_indexes = {}
+        if self.config.RETRIEVAL_MODE != "hybrid":
+            return True
+        
+        for name in ("leyes", "fallos"):
+            index = BM25Index.load(self._lexical_index_path(name))
+            if index is None:
+                self.lexical_indexes = {}
+                return False
+            self.lexical_indexes[name] = index
+        
+        return True
+    
+    def _save_lexical_indexes(self):
+        """Guarda los índices BM25 construidos junto a la base vectorial"""
+        for name, index in self.lexical_indexes.items():
+            index.save(self._lexical_index_path(name))
+            print(f"Índice léxico de {name}: {len(index)} documentos")
+    
+    def _metadata_index_path(self) -> str:
+        """Ruta del índice de metadatos de fallos, junto a la base vectorial"""
+        return os.path.join(self.config.CHROMA_DIR, "fallos_metadata.pkl")
+    
+    def _load_metadata_index(self) -> bool:
+        """
+        Carga el índice de metadatos de fallos persistido
+        
+        Returns:
+            bool: False si no existe y hay que reconstruirlo
+        """
+        self.metadata_index = MetadataIndex.load(self._metadata_index_path())
+        return self.metadata_index is not None
+    
+    def _save_metadata_index(self):
+        """Guarda el índice de metadatos construido junto a la base vectorial"""
+        self.metadata_index.save(self._metadata_index_path())
+        stats = self.metadata_index.get_stats()
+        print(f"Índice de metadatos de fallos: {stats['documents']} documentos, "
+              f"{stats['courts']} cortes, {stats['articles']} artículos citados")
+    
+    def _citation_graph_path(self) -> str:
+        """Ruta del grafo de citas artículo → fallos, junto a la base vectorial"""
+        return os.path.join(self.config.CHROMA_DIR, "fallos_citations.pkl")
+    
+    def _load_citation_graph(self) -> bool:
+        """
+        Carga el grafo de citas persistido
+        
+        Returns:
+            bool: False si no existe y hay que reconstruirlo
+        """
+        self.citation_graph = CitationGraph.load(self._citation_graph_path())
+        return self.citation_graph is not None
+    
+    def _save_citation_graph(self):
+        """Guarda el grafo de citas construido junto a la base vectorial"""
+        self.citation_graph.save(self._citation_graph_path())
+        stats = self.citation_graph.get_stats()
+        print(f"Grafo de citas: {stats['articles']} artículos enlazados con {stats['edges']} chunks de fallos")
+    
+    def _duplicates_path(self) -> str:
+        """Ruta del archivo de enlaces entre fallos casi duplicados"""
+        return os.path.join(self.config.CHROMA_DIR, "fallos_duplicates.json")
+    
+    def _create_duplicate_filter(self) -> Optional[NearDuplicateFilter]:
+        """Crea el filtro de chunks de fallos casi duplicados si está activado"""
+        if not self.config.NEAR_DUPLICATE_DETECTION:
+            return None
+        return NearDuplicateFilter(
+            self.config.NEAR_DUPLICATE_THRESHOLD,
+            self.config.NEAR_DUPLICATE_NUM_PERM,
+            self.config.NEAR_DUPLICATE_BANDS,
+            self.config.NEAR_DUPLICATE_SHINGLE_SIZE,
+            key_fn=lambda document: compute_document_id(document, self.config.EMBEDDING_MODEL)
+        )
+    
+    def _save_duplicate_links(self, duplicate_filter: NearDuplicateFilter):
+        """Guarda los enlaces representante → duplicados e informa la compresión lograda"""
+        duplicate_filter.save(self._duplicates_path())
+        self.duplicate_stats = duplicate_filter.get_stats()
+        print(f"Fallos casi duplicados: {self.duplicate_stats['duplicates']} de "
+              f"{self.duplicate_stats['total_chunks']} chunks enlazados a un representante "
+              f"(compresión {self.duplicate_stats['compression_ratio']:.2f}x)")
+    
+    def _index_observers(self, name: str) -> List[Any]:
+        """Índices auxiliares que se construyen al sincronizar una colección"""
+        observers = []
+        if name in self.lexical_indexes:
+            observers.append(self.lexical_indexes[name])
+        if name == "fallos" and self.metadata_index is not None:
+            observers.append(self.metadata_index)
+        if name == "fallos" and self.citation_graph is not None:
+            observers.append(self.citation_graph)
+        return observers
+    
+    def _open_vector_store(self, collection_name: str, backend: str = "chroma"):
+        """
+        Abre (o crea) una colección persistente con el backend indicado
+        
+        Args:
+            collection_name: Nombre de la colección
+            backend: "chroma" o "numpy" (matriz en memoria para colecciones pequeñas)
+            
+        Returns:
+            Vector store de la colección
+        """
+        if backend == "numpy":
+            return NumpyVectorStore(
+                collection_name=collection_name,
+                embedding_function=self.embeddings,
+                persist_directory=self.config.CHROMA_DIR
+            )
+        if backend != "chroma":
+            raise ValueError(f"Backend vectorial desconocido: {backend}")
+        
+        # Importar Chroma toma más de un segundo: solo se paga si se usa este backend
+        from langchain_chroma import Chroma
+        
+        return Chroma(
+            collection_name=collection_name,
+            embedding_function=self.embeddings,
+            persist_directory=self.config.CHROMA_DIR
+        )
+    
     def retrieve_law_documents(self, query: str) -> List[Document]:
         """
         Recupera documentos legales relevantes
@@ -141,20 +402,18 @@ class RAGSystem:
         if not self.initialized:
             raise RuntimeError("Sistema no inicializado. Llama a initialize() primero")
         
-        if not self.vector_store_law:
-            return []
-        
-        return self.vector_store_law.similarity_search(
-            query, 
-            k=self.config.RETRIEVAL_K
-        )
+        with self.metrics.stage("embed_query"):
+            query_vector = self.embeddings.embed_query(query)
+        law_results = self._search_collection("leyes", self.vector_store_law, query_vector, query)
+        return [doc for doc, _ in law_results]
     
-    def retrieve_case_documents(self, query: str) -> List[Document]:
+    def retrieve_case_documents(self, query: str, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
         """
         Recupera fallos judiciales relevantes
         
         Args:
             query: Consulta del usuario
+            filters: Filtros de fallos (ver retrieve_documents)
             
         Returns:
             List[Document]: Fallos relevantes
@@ -162,21 +421,334 @@ class RAGSystem:
         if not self.initialized:
             raise RuntimeError("Sistema no inicializado. Llama a initialize() primero")
         
-        if not self.vector_store_cases:
-            return []
+        case_ids = self._filter_case_ids(normalize_filters(filters))
+        with self.metrics.stage("embed_query"):
+            query_vector = self.embeddings.embed_query(query)
+        case_results = self._search_collection("fallos", self.vector_store_cases, query_vector, query, case_ids)
+        return [doc for doc, _ in case_results]
+    
+    def retrieve_documents(self, query: str, filters: Optional[Dict[str, Any]] = None
+                           ) -> Tuple[List[Tuple[Document, float]], List[Tuple[Document, float]]]:
+        """
+        Recupera artículos y fallos relevantes embebiendo la consulta una sola vez
+        
+        Ambas búsquedas se ejecutan en paralelo sobre el mismo vector de consulta. Las
+        consultas repetidas se sirven desde la caché LRU sin embeber ni buscar de nuevo.
+        Los filtros se resuelven con el índice de metadatos en el conjunto de fallos
+        candidatos antes de la búsqueda, que solo puntúa esos fallos.
+        
+        Args:
+            query: Consulta del usuario
+            filters: Filtros de fallos: "corte", "fecha_desde", "fecha_hasta" y/o "articulo"
+            
+        Returns:
+            tuple: (resultados_ley, resultados_fallos), cada uno una lista de
+                (documento, puntaje) ordenada por relevancia. En modo denso el puntaje
+                es la distancia (menor es más similar); en modo híbrido es el puntaje RRF
+        """
+        if not self.initialized:
+            raise RuntimeError("Sistema no inicializado. Llama a initialize() primero")
+        
+        filters = normalize_filters(filters)
+        case_ids = self._filter_case_ids(filters)
+        cache_key = self._query_cache_key(query, filters)
+        
+        cached_results, query_vector = self._lookup_query_cache(cache_key)
+        if cached_results is not None:
+            return cached_results
+        if query_vector is None:
+            with self.metrics.stage("embed_query"):
+                query_vector = self.embeddings.embed_query(query)
+        
+        version = self.query_cache.version
+        if self._uses_citation_graph():
+            law_results, case_results = self._search_by_citations(query_vector, query, case_ids)
+        else:
+            law_future = self.retrieval_executor.submit(
+                self._search_collection, "leyes", self.vector_store_law, query_vector, query
+            )
+            case_future = self.retrieval_executor.submit(
+                self._search_collection, "fallos", self.vector_store_cases, query_vector, query, case_ids
+            )
+            law_results, case_results = law_future.result(), case_future.result()
+        
+        self._store_query_cache(cache_key, query_vector, law_results, case_results, version)
+        return law_results, case_results
+    
+    async def aretrieve_documents(self, query: str, filters: Optional[Dict[str, Any]] = None
+                                  ) -> Tuple[List[Tuple[Document, float]], List[Tuple[Document, float]]]:
+        """
+        Versión asíncrona de retrieve_documents
+        
+        El embedding de la consulta usa el cliente asíncrono de Ollama y se agrupa con
+        los de otras consultas concurrentes; las búsquedas (bloqueantes en Chroma) se
+        ejecutan en el pool de retrieval sin bloquear el event loop.
+        
+        Args:
+            query: Consulta del usuario
+            filters: Filtros de fallos (ver retrieve_documents)
+            
+        Returns:
+            tuple: (resultados_ley, resultados_fallos)
+        """
+        if not self.initialized:
+            raise RuntimeError("Sistema no inicializado. Llama a initialize() primero")
+        
+        filters = normalize_filters(filters)
+        case_ids = self._filter_case_ids(filters)
+        cache_key = self._query_cache_key(query, filters)
+        
+        loop = asyncio.get_running_loop()
+        cached_results, query_vector = await loop.run_in_executor(
+            self.retrieval_executor, self._lookup_query_cache, cache_key
+        )
+        if cached_results is not None:
+            return cached_results
+        if query_vector is None:
+            with self.metrics.stage("embed_query"):
+                query_vector = await (self.query_batcher or self.embeddings).aembed_query(query)
+        
+        version = self.query_cache.version
+        if self._uses_citation_graph():
+            law_results, case_results = await loop.run_in_executor(
+                self.retrieval_executor, self._search_by_citations, query_vector, query, case_ids
+            )
+        else:
+            law_results, case_results = await asyncio.gather(
+                loop.run_in_executor(
+                    self.retrieval_executor, self._search_collection,
+                    "leyes", self.vector_store_law, query_vector, query
+                ),
+                loop.run_in_executor(
+                    self.retrieval_executor, self._search_collection,
+                    "fallos", self.vector_store_cases, query_vector, query, case_ids
+                )
+            )
+        
+        self._store_query_cache(cache_key, query_vector, law_results, case_results, version)
+        return law_results, case_results
+    
+    def _uses_citation_graph(self) -> bool:
+        """Indica si los fallos se obtienen del grafo de citas de los artículos recuperados"""
+        return self.config.CASE_RETRIEVAL_MODE == "graph" and self.citation_graph is not None
+    
+    def _search_by_citations(self, query_vector: List[float], query: str,
+                             case_ids: Optional[List[str]] = None
+                             ) -> Tuple[List[Tuple[Document, float]], List[Tuple[Document, float]]]:
+        """
+        Busca artículos y toma como candidatos los fallos que los citan
+        
+        Los fallos vecinos de los artículos recuperados en el grafo de citas se
+        re-rankean por similitud con la consulta usando sus vectores almacenados, en
+        lugar de buscar en toda la colección. Si ningún fallo cita esos artículos (o
+        ninguno cumple los filtros) se busca en toda la colección.
+        
+        Args:
+            query_vector: Embedding de la consulta
+            query: Texto de la consulta (para la búsqueda léxica)
+            case_ids: Fallos permitidos por los filtros (None si no hay filtros)
+            
+        Returns:
+            tuple: (resultados_ley, resultados_fallos)
+        """
+        law_results = self._search_collection("leyes", self.vector_store_law, query_vector, query)
+        
+        articles = []
+        for document, _ in law_results:
+            key = article_key(document.metadata.get("Articulo"))
+            if key and key not in articles:
+                articles.append(key)
         
-        return self.vector_store_cases.similarity_search(
-            query,
-            k=self.config.RETRIEVAL_K
+        candidates = self.citation_graph.neighbours(articles, self.config.CITATION_GRAPH_MAX_CANDIDATES)
+        if case_ids is not None:
+            allowed = set(case_ids)
+            candidates = [doc_id for doc_id in candidates if doc_id in allowed]
+        if not candidates:
+            candidates = case_ids
+        
+        case_results = self._search_collection(
+            "fallos", self.vector_store_cases, query_vector, query, candidates
         )
+        return law_results, case_results
+    
+    def _filter_case_ids(self, filters: Dict[str, Any]) -> Optional[List[str]]:
+        """
+        Resuelve los filtros normalizados en los ids de fallos candidatos
+        
+        Args:
+            filters: Filtros retornados por normalize_filters
+            
+        Returns:
+            List[str]: Ids candidatos, o None si no hay filtros
+        """
+        if not filters:
+            return None
+        if self.metadata_index is None:
+            raise ValueError("Los filtros de fallos requieren el índice de metadatos; reindexa la base vectorial")
+        return self.metadata_index.candidates(filters)
+    
+    @staticmethod
+    def _query_cache_key(query: str, filters: Dict[str, Any]) -> str:
+        """Clave de caché de una consulta: los mismos filtros comparten resultados"""
+        if not filters:
+            return query
+        return f"{query}\n{json.dumps(filters, sort_keys=True)}"
+    
+    def _lookup_query_cache(self, query: str):
+        """
+        Busca una consulta en la caché LRU
+        
+        Args:
+            query: Consulta del usuario
+            
+        Returns:
+            tuple: (resultados, embedding). resultados no es None si la entrada completa
+                se pudo reconstruir; embedding no es None si al menos se conoce el vector
+        """
+        cached = self.query_cache.get(query)
+        if cached is None:
+            return None, None
+        
+        law_results = self._fetch_by_ids(self.vector_store_law, cached["results"].get("leyes"))
+        case_results = self._fetch_by_ids(self.vector_store_cases, cached["results"].get("fallos"))
+        if law_results is not None and case_results is not None:
+            return (law_results, case_results), cached["embedding"]
+        return None, cached["embedding"]
+    
+    def _store_query_cache(self, query: str, query_vector: List[float],
+                           law_results: List[Tuple[Document, float]],
+                           case_results: List[Tuple[Document, float]], version: int):
+        """Guarda el embedding y los ids recuperados de una consulta en la caché"""
+        self.query_cache.put(query, query_vector, {
+            "leyes": self._result_ids(law_results),
+            "fallos": self._result_ids(case_results)
+        }, version)
+    
+    def _result_ids(self, results: List[Tuple[Document, float]]) -> Optional[List[Tuple[str, float]]]:
+        """Extrae (id, distancia) de los resultados, o None si algún documento no trae id"""
+        if any(doc.id is None for doc, _ in results):
+            return None
+        return [(doc.id, score) for doc, score in results]
+    
+    def _fetch_by_ids(self, vector_store, id_scores: Optional[List[Tuple[str, float]]]) -> Optional[List[Tuple[Document, float]]]:
+        """
+        Reconstruye resultados cacheados leyendo los documentos por id
+        
+        Args:
+            vector_store: Colección de origen
+            id_scores: Ids y distancias guardados en caché
+            
+        Returns:
+            List[Tuple[Document, float]]: Resultados en el orden original, o None si
+                la entrada no se puede reconstruir y hay que volver a buscar
+        """
+        if id_scores is None:
+            return None
+        if not vector_store or not id_scores:
+            return []
+        
+        ids = [doc_id for doc_id, _ in id_scores]
+        by_id = self._get_documents_by_ids(vector_store, ids)
+        if len(by_id) != len(ids):
+            return None
+        
+        return [(by_id[doc_id], score) for doc_id, score in id_scores]
+    
+    def _get_documents_by_ids(self, vector_store, ids: List[str]) -> Dict[str, Document]:
+        """
+        Lee documentos de una colección por id
+        
+        Args:
+            vector_store: Colección de origen
+            ids: Ids a leer
+            
+        Returns:
+            Dict[str, Document]: Documentos encontrados indexados por id
+        """
+        if not ids:
+            return {}
+        
+        stored = vector_store.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            doc_id: Document(id=doc_id, page_content=content, metadata=metadata or {})
+            for doc_id, content, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        }
+    
+    def _search_collection(self, name: str, vector_store, query_vector: List[float],
+                           query: str, candidate_ids: Optional[List[str]] = None) -> List[Tuple[Document, float]]:
+        """
+        Busca en una colección según el modo de retrieval configurado
+        
+        En modo híbrido se fusionan con RRF los candidatos densos y los de BM25; si la
+        colección no tiene índice léxico o los documentos no traen id, se usa solo la
+        búsqueda densa.
+        
+        Args:
+            name: Nombre de la colección ("leyes" o "fallos")
+            vector_store: Colección en la que buscar
+            query_vector: Embedding de la consulta
+            query: Texto de la consulta (para la búsqueda léxica)
+            candidate_ids: Si se indica, solo se buscan estos documentos (pre-filtro)
+            
+        Returns:
+            List[Tuple[Document, float]]: Documentos con su puntaje
+        """
+        with self.metrics.stage(f"search_{name}"):
+            lexical_index = self.lexical_indexes.get(name)
+            if lexical_index is None or not vector_store:
+                return self._search_by_vector(vector_store, query_vector, ids=candidate_ids)
+            
+            candidates = self.config.HYBRID_CANDIDATES
+            dense_results = self._search_by_vector(vector_store, query_vector, k=candidates, ids=candidate_ids)
+            if any(doc.id is None for doc, _ in dense_results):
+                return dense_results[:self.config.RETRIEVAL_K]
+            
+            allowed_ids = set(candidate_ids) if candidate_ids is not None else None
+            lexical_results = lexical_index.search(query, candidates, allowed_ids=allowed_ids)
+            fused = reciprocal_rank_fusion(
+                [[doc.id for doc, _ in dense_results], [doc_id for doc_id, _ in lexical_results]],
+                self.config.HYBRID_RRF_K
+            )[:self.config.RETRIEVAL_K]
+            
+            documents = {doc.id: doc for doc, _ in dense_results}
+            documents.update(self._get_documents_by_ids(
+                vector_store, [doc_id for doc_id, _ in fused if doc_id not in documents]
+            ))
+            
+            return [(documents[doc_id], score) for doc_id, score in fused if doc_id in documents]
     
-    def generate_response(self, query: str, chat_history: str = "") -> Dict[str, Any]:
+    def _search_by_vector(self, vector_store, query_vector: List[float], k: Optional[int] = None,
+                          ids: Optional[List[str]] = None) -> List[Tuple[Document, float]]:
+        """
+        Busca en una colección usando un embedding ya calculado
+        
+        Args:
+            vector_store: Colección en la que buscar
+            query_vector: Embedding de la consulta
+            k: Número de resultados (por defecto RETRIEVAL_K)
+            ids: Si se indica, solo se puntúan estos documentos
+            
+        Returns:
+            List[Tuple[Document, float]]: Documentos con su distancia
+        """
+        if not vector_store:
+            return []
+        
+        return search_by_vector(vector_store, query_vector, k or self.config.RETRIEVAL_K, ids=ids)
+    
+    def generate_response(self, query: str, chat_history: str = "",
+                          retrieval_query: Optional[str] = None,
+                          filters: Optional[Dict[str, Any]] = None,
+                          priority: str = "direct") -> Dict[str, Any]:
         """
         Genera una respuesta basada en RAG considerando el historial
         
         Args:
             query: Consulta actual del usuario
             chat_history: Historial de conversación formateado
+            retrieval_query: Texto a usar para la búsqueda si difiere de la consulta
+            filters: Filtros de fallos (corte, rango de fechas, artículo citado)
+            priority: Clase de prioridad en el planificador del LLM ("direct" o "draft")
             
         Returns:
             Dict: Respuesta con contexto y fuentes
@@ -184,46 +756,237 @@ class RAGSystem:
         if not self.initialized:
             raise RuntimeError("Sistema no inicializado. Llama a initialize() primero")
         
-        # Recuperar documentos relevantes
-        law_docs = self.retrieve_law_documents(query)
-        case_docs = self.retrieve_case_documents(query)
+        # Recuperar documentos relevantes (un solo embedding, búsquedas en paralelo)
+        with self.metrics.stage("retrieval"):
+            law_results, case_results = self.retrieve_documents(retrieval_query or query, filters)
+        generation = self._prepare_generation(query, chat_history, law_results, case_results)
         
-        # Combinar documentos
-        all_docs = law_docs + case_docs
+        # Generar respuesta usando el LLM (la espera por un cupo no cuenta como error)
+        with self.llm_scheduler.slot(priority):
+            start = time.perf_counter()
+            try:
+                response = self.llm.invoke(generation["messages"])
+                self._record_llm(generation, response, response.content, start)
+                return self._build_response(generation, response.content)
+            except Exception as e:
+                print(f"Error generando respuesta: {e}")
+                self._record_llm(generation, None, "", start)
+                return self._build_response(generation, "Lo siento, ocurrió un error al procesar tu consulta.")
+    
+    async def agenerate_response(self, query: str, chat_history: str = "",
+                                 retrieval_query: Optional[str] = None,
+                                 filters: Optional[Dict[str, Any]] = None,
+                                 priority: str = "direct") -> Dict[str, Any]:
+        """
+        Versión asíncrona de generate_response usando los clientes asíncronos de Ollama
         
-        # Formatear contexto
-        context = self._format_context(all_docs)
+        Args:
+            query: Consulta actual del usuario
+            chat_history: Historial de conversación formateado
+            retrieval_query: Texto a usar para la búsqueda si difiere de la consulta
+            filters: Filtros de fallos (corte, rango de fechas, artículo citado)
+            priority: Clase de prioridad en el planificador del LLM ("direct" o "draft")
+            
+        Returns:
+            Dict: Respuesta con contexto y fuentes
+        """
+        if not self.initialized:
+            raise RuntimeError("Sistema no inicializado. Llama a initialize() primero")
         
-        # Extraer fuentes
-        sources = self._extract_sources(all_docs)
+        with self.metrics.stage("retrieval"):
+            law_results, case_results = await self.aretrieve_documents(retrieval_query or query, filters)
+        generation = self._prepare_generation(query, chat_history, law_results, case_results)
         
-        # Generar respuesta usando el LLM
-        try:
+        async with self.llm_scheduler.aslot(priority):
+            start = time.perf_counter()
+            try:
+                response = await self.llm.ainvoke(generation["messages"])
+                self._record_llm(generation, response, response.content, start)
+                return self._build_response(generation, response.content)
+            except Exception as e:
+                print(f"Error generando respuesta: {e}")
+                self._record_llm(generation, None, "", start)
+                return self._build_response(generation, "Lo siento, ocurrió un error al procesar tu consulta.")
+    
+    def stream_response(self, query: str, chat_history: str = "",
+                        retrieval_query: Optional[str] = None,
+                        filters: Optional[Dict[str, Any]] = None,
+                        priority: str = "direct") -> Iterator[Dict[str, Any]]:
+        """
+        Genera una respuesta basada en RAG entregando el texto a medida que el LLM lo produce
+        
+        Primero se emite un evento "sources" con las fuentes recuperadas, luego un evento
+        "token" por cada fragmento generado y por último un evento "end" con la misma
+        respuesta completa que retornaría generate_response.
+        
+        Args:
+            query: Consulta actual del usuario
+            chat_history: Historial de conversación formateado
+            retrieval_query: Texto a usar para la búsqueda si difiere de la consulta
+            filters: Filtros de fallos (corte, rango de fechas, artículo citado)
+            priority: Clase de prioridad en el planificador del LLM ("direct" o "draft")
+            
+        Yields:
+            Dict: Eventos con la clave "type" ("sources", "token" o "end")
+        """
+        if not self.initialized:
+            raise RuntimeError("Sistema no inicializado. Llama a initialize() primero")
+        
+        with self.metrics.stage("retrieval"):
+            law_results, case_results = self.retrieve_documents(retrieval_query or query, filters)
+        generation = self._prepare_generation(query, chat_history, law_results, case_results)
+        parts = []
+        # Las fuentes se emiten al obtener cupo, de modo que un rechazo del planificador
+        # ocurre antes del primer evento
+        with self.llm_scheduler.slot(priority):
+            yield self._sources_event(generation)
+            
+            # Los chunks sumados conservan el uso de tokens que Ollama envía en el último
+            response = None
+            start = time.perf_counter()
+            try:
+                for chunk in self.llm.stream(generation["messages"]):
+                    response = chunk if response is None else response + chunk
+                    if chunk.content:
+                        if not parts:
+                            self.metrics.observe("stage", "llm_first_token", time.perf_counter() - start)
+                        parts.append(chunk.content)
+                        yield {"type": "token", "content": chunk.content}
+                self._record_llm(generation, response, "".join(parts), start)
+            except Exception as e:
+                print(f"Error generando respuesta: {e}")
+                self._record_llm(generation, None, "", start)
+                parts.append(self._stream_error_text(parts))
+                yield {"type": "token", "content": parts[-1]}
+        
+        yield {"type": "end", **self._build_response(generation, "".join(parts))}
+    
+    async def astream_response(self, query: str, chat_history: str = "",
+                               retrieval_query: Optional[str] = None,
+                               filters: Optional[Dict[str, Any]] = None,
+                               priority: str = "direct") -> AsyncIterator[Dict[str, Any]]:
+        """
+        Versión asíncrona de stream_response
+        
+        Args:
+            query: Consulta actual del usuario
+            chat_history: Historial de conversación formateado
+            retrieval_query: Texto a usar para la búsqueda si difiere de la consulta
+            filters: Filtros de fallos (corte, rango de fechas, artículo citado)
+            priority: Clase de prioridad en el planificador del LLM ("direct" o "draft")
+            
+        Yields:
+            Dict: Eventos con la clave "type" ("sources", "token" o "end")
+        """
+        if not self.initialized:
+            raise RuntimeError("Sistema no inicializado. Llama a initialize() primero")
+        
+        with self.metrics.stage("retrieval"):
+            law_results, case_results = await self.aretrieve_documents(retrieval_query or query, filters)
+        generation = self._prepare_generation(query, chat_history, law_results, case_results)
+        parts = []
+        # Las fuentes se emiten al obtener cupo, de modo que un rechazo del planificador
+        # ocurre antes del primer evento
+        async with self.llm_scheduler.aslot(priority):
+            yield self._sources_event(generation)
+            
+            # Los chunks sumados conservan el uso de tokens que Ollama envía en el último
+            response = None
+            start = time.perf_counter()
+            try:
+                async for chunk in self.llm.astream(generation["messages"]):
+                    response = chunk if response is None else response + chunk
+                    if chunk.content:
+                        if not parts:
+                            self.metrics.observe("stage", "llm_first_token", time.perf_counter() - start)
+                        parts.append(chunk.content)
+                        yield {"type": "token", "content": chunk.content}
+                self._record_llm(generation, response, "".join(parts), start)
+            except Exception as e:
+                print(f"Error generando respuesta: {e}")
+                self._record_llm(generation, None, "", start)
+                parts.append(self._stream_error_text(parts))
+                yield {"type": "token", "content": parts[-1]}
+        
+        yield {"type": "end", **self._build_response(generation, "".join(parts))}
+    
+    def _sources_event(self, generation: Dict[str, Any]) -> Dict[str, Any]:
+        """Evento inicial del streaming con las fuentes recuperadas"""
+        return {
+            "type": "sources",
+            "sources": generation["sources"],
+            "retrieved_docs": generation["retrieved_docs"],
+            "context_tokens": generation["context_tokens"]
+        }
+    
+    def _record_llm(self, generation: Dict[str, Any], response: Optional[BaseMessage],
+                    answer: str, start: float):
+        """
+        Registra la duración de la llamada al LLM y, si hubo respuesta, sus tokens
+        
+        Args:
+            generation: Generación preparada (con los mensajes enviados)
+            response: Mensaje retornado por el modelo, o None si la llamada falló
+            answer: Texto generado
+            start: Instante (time.perf_counter) en que empezó la llamada
+        """
+        elapsed = time.perf_counter() - start
+        self.metrics.observe("stage", "llm", elapsed)
+        if response is not None:
+            self.metrics.record_generation("llm", response, generation["messages"], answer, elapsed)
+    
+    def _stream_error_text(self, parts: List[str]) -> str:
+        """Mensaje de error a emitir cuando el streaming se interrumpe"""
+        message = "Lo siento, ocurrió un error al procesar tu consulta."
+        return f"\n\n{message}" if parts else message
+    
+    def _prepare_generation(self, query: str, chat_history: str,
+                            law_results: List[Tuple[Document, float]],
+                            case_results: List[Tuple[Document, float]]) -> Dict[str, Any]:
+        """
+        Arma el contexto, las fuentes y el prompt a partir de los documentos recuperados
+        
+        Args:
+            query: Consulta actual del usuario
+            chat_history: Historial de conversación formateado
+            law_results: Artículos recuperados con su puntaje
+            case_results: Fallos recuperados con su puntaje
+            
+        Returns:
+            Dict: Mensajes para el LLM, contexto, fuentes, número de documentos y tokens de contexto
+        """
+        with self.metrics.stage("prompt"):
+            # Seleccionar y recortar los documentos dentro del presupuesto de tokens
+            packed = self.context_packer.pack(query, law_results, case_results)
+            packed_docs = packed["documents"]
+            
+            # Formatear contexto
+            context = self._format_context(packed_docs)
+            
             # Crear el prompt completo
             messages = self.prompt_template.format_messages(
                 context=context,
                 chat_history=chat_history,
                 question=query
             )
-            
-            # Invocar el modelo
-            response = self.llm.invoke(messages)
-            
-            return {
-                "answer": response.content,
-                "sources": sources,
-                "context": context,
-                "retrieved_docs": len(all_docs)
-            }
-            
-        except Exception as e:
-            print(f"Error generando respuesta: {e}")
-            return {
-                "answer": "Lo siento, ocurrió un error al procesar tu consulta.",
-                "sources": sources,
-                "context": context,
-                "retrieved_docs": len(all_docs)
-            }
+        
+        return {
+            "messages": messages,
+            "context": context,
+            "sources": self._extract_sources(packed_docs),
+            "retrieved_docs": len(law_results) + len(case_results),
+            "context_tokens": packed["tokens"]
+        }
+    
+    def _build_response(self, generation: Dict[str, Any], answer: str) -> Dict[str, Any]:
+        """Arma el diccionario de respuesta a partir de la generación preparada"""
+        return {
+            "answer": answer,
+            "sources": generation["sources"],
+            "context": generation["context"],
+            "retrieved_docs": generation["retrieved_docs"],
+            "context_tokens": generation["context_tokens"]
+        }
     
     def generate_response_with_messages(self, query: str, message_history: List[BaseMessage]) -> Dict[str, Any]:
         """
@@ -255,14 +1018,7 @@ class RAGSystem:
         if not messages:
             return "No hay historial de conversación anterior."
         
-        formatted_history = ""
-        for message in messages:
-            if isinstance(message, HumanMessage):
-                formatted_history += f"Usuario: {message.content}\n"
-            elif isinstance(message, AIMessage):
-                formatted_history += f"Asistente: {message.content}\n"
-        
-        return formatted_history
+        return format_history(messages, self.config.HISTORY_TOKEN_BUDGET)
     
     def contextualize_query(self, current_query: str, chat_history: str) -> str:
         """
@@ -300,9 +1056,12 @@ class RAGSystem:
                 question=current_query
             )
             
-            response = self.llm.invoke(messages)
+            with self.llm_scheduler.slot("contextualize"):
+                response = self.llm.invoke(messages)
             return response.content.strip()
             
+        except LLMBusyError:
+            raise
         except Exception as e:
             print(f"Error contextualizando consulta: {e}")
             return current_query
@@ -404,9 +1163,30 @@ class RAGSystem:
         Returns:
             Dict: Estado del sistema
         """
-        return {
+        status = {
             "initialized": self.initialized,
-            "law_docs_count": self.vector_store_law._collection.count() if self.vector_store_law else 0,
-            "case_docs_count": self.vector_store_cases._collection.count() if self.vector_store_cases else 0,
-            "config": self.config.get_config()
-        }
\ No newline at end of file
+            "law_docs_count": count_documents(self.vector_store_law) if self.initialized else 0,
+            "case_docs_count": count_documents(self.vector_store_cases) if self.initialized else 0,
+            "config": self.config.get_config(),
+            "query_cache": self.query_cache.get_stats(),
+            "context_packing": self.context_packer.get_stats(),
+            "metrics": self.metrics.get_summary(),
+            "llm_scheduler": self.llm_scheduler.get_stats()
+        }
+        
+        if self.metadata_index is not None:
+            status["metadata_index"] = self.metadata_index.get_stats()
+        
+        if self.citation_graph is not None:
+            status["citation_graph"] = self.citation_graph.get_stats()
+        
+        if self.duplicate_stats:
+            status["near_duplicates"] = self.duplicate_stats
+        
+        if self.query_batcher is not None:
+            status["query_batching"] = self.query_batcher.get_stats()
+        
+        if isinstance(self.embeddings, CachedEmbeddings):
+            status["embedding_cache"] = self.embeddings.get_stats()
+        
+        return status
\ No newline at end of file
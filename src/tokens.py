@@ -0,0 +1,36 @@
+import math
+
+# Caracteres promedio por token de llama3 en texto legal en español
+CHARS_PER_TOKEN = 4.0
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estima el número de tokens de un texto sin cargar el tokenizador del modelo
+
+    Args:
+        text: Texto a medir
+
+    Returns:
+        int: Tokens estimados
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Recorta un texto para que no supere un número de tokens estimado
+
+    Args:
+        text: Texto a recortar
+        max_tokens: Tokens máximos
+
+    Returns:
+        str: Texto recortado (con "..." al final si se cortó)
+    """
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return text
+    return text[:max(max_chars - 3, 0)].rstrip() + "..."
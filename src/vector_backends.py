@@ -0,0 +1,303 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.documents import Document
+
+
+class NumpyVectorStore:
+    """
+    Vector store en memoria para colecciones pequeñas
+
+    Guarda los embeddings como una matriz float32 contigua (``vectors.npy``, abierta
+    con memory-map) y los textos/metadatos en ``store.json``. El top-k se resuelve con
+    un único producto matriz-vector. Expone el subconjunto de la API de Chroma que usa
+    el sistema (get, delete, add_documents y búsqueda por vector) y devuelve la misma
+    distancia L2 al cuadrado que Chroma, de modo que ambos backends son intercambiables.
+
+    Cada escritura reescribe los archivos completos, por lo que solo es adecuado para
+    colecciones de unos pocos miles de documentos como la de leyes.
+    """
+
+    def __init__(self, collection_name: str, embedding_function, persist_directory: str):
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.directory = os.path.join(persist_directory, f"{collection_name}_numpy")
+        self._lock = threading.Lock()
+
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self._squared_norms = np.zeros(0, dtype=np.float32)
+        self._positions: Dict[str, int] = {}
+
+        self._load()
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.npy")
+
+    @property
+    def store_path(self) -> str:
+        return os.path.join(self.directory, "store.json")
+
+    def _load(self):
+        """Carga la colección desde disco si existe"""
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.store_path)):
+            return
+
+        with open(self.store_path, "r", encoding="utf-8") as f:
+            store = json.load(f)
+
+        self.ids = store["ids"]
+        self.documents = store["documents"]
+        self.metadatas = store["metadatas"]
+        self.vectors = np.load(self.vectors_path, mmap_mode="r")
+        self._reindex()
+
+    def _reindex(self):
+        """Recalcula las estructuras derivadas tras cargar o modificar la colección"""
+        self._positions = {doc_id: position for position, doc_id in enumerate(self.ids)}
+        if len(self.ids):
+            self._squared_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        else:
+            self._squared_norms = np.zeros(0, dtype=np.float32)
+
+    def _persist(self):
+        """Guarda la colección de forma atómica"""
+        os.makedirs(self.directory, exist_ok=True)
+
+        tmp_vectors = self.vectors_path + ".tmp.npy"
+        np.save(tmp_vectors, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        tmp_store = self.store_path + ".tmp"
+        with open(tmp_store, "w", encoding="utf-8") as f:
+            json.dump(
+                {"ids": self.ids, "documents": self.documents, "metadatas": self.metadatas},
+                f, ensure_ascii=False
+            )
+
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_store, self.store_path)
+
+    def count(self) -> int:
+        """Número de documentos en la colección"""
+        return len(self.ids)
+
+    def get(self, ids: Optional[Sequence[str]] = None, include: Optional[Sequence[str]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Lee documentos con el mismo formato de respuesta que Chroma.get
+
+        Args:
+            ids: Ids a leer (todos si es None)
+            include: Campos a incluir ("documents", "metadatas", "embeddings")
+            limit: Máximo de resultados
+            offset: Desplazamiento para paginar
+
+        Returns:
+            Dict: Listas paralelas "ids" y los campos solicitados
+        """
+        include = ["documents", "metadatas"] if include is None else include
+
+        if ids is None:
+            positions = list(range(len(self.ids)))
+        else:
+            positions = [self._positions[doc_id] for doc_id in ids if doc_id in self._positions]
+
+        start = offset or 0
+        positions = positions[start:start + limit] if limit is not None else positions[start:]
+
+        result = {"ids": [self.ids[position] for position in positions]}
+        if "documents" in include:
+            result["documents"] = [self.documents[position] for position in positions]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[position] for position in positions]
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(self.vectors[positions]) if positions else []
+        return result
+
+    def upsert_embeddings(self, ids: List[str], embeddings: List[List[float]], documents: List[Document]):
+        """
+        Inserta o reemplaza documentos con embeddings ya calculados
+
+        Args:
+            ids: Ids de los documentos
+            embeddings: Embeddings de cada documento
+            documents: Documentos originales
+        """
+        new_vectors = np.asarray(embeddings, dtype=np.float32)
+
+        with self._lock:
+            vectors = np.array(self.vectors, dtype=np.float32) if len(self.ids) else None
+            append_rows = []
+
+            for row, (doc_id, document) in enumerate(zip(ids, documents)):
+                position = self._positions.get(doc_id)
+                if position is None:
+                    self._positions[doc_id] = len(self.ids)
+                    self.ids.append(doc_id)
+                    self.documents.append(document.page_content)
+                    self.metadatas.append(document.metadata)
+                    append_rows.append(row)
+                else:
+                    self.documents[position] = document.page_content
+                    self.metadatas[position] = document.metadata
+                    vectors[position] = new_vectors[row]
+
+            if append_rows:
+                appended = new_vectors[append_rows]
+                vectors = appended if vectors is None else np.vstack([vectors, appended])
+
+            self.vectors = vectors
+            self._reindex()
+            self._persist()
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Embebe y agrega documentos
+
+        Args:
+            documents: Documentos a agregar
+            ids: Ids de los documentos
+
+        Returns:
+            List[str]: Ids agregados
+        """
+        if ids is None:
+            raise ValueError("NumpyVectorStore requiere ids explícitos")
+
+        embeddings = self.embedding_function.embed_documents([doc.page_content for doc in documents])
+        self.upsert_embeddings(ids, embeddings, documents)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None):
+        """
+        Elimina documentos por id
+
+        Args:
+            ids: Ids a eliminar
+        """
+        if not ids:
+            return
+
+        to_delete = set(ids)
+        with self._lock:
+            keep = [position for position, doc_id in enumerate(self.ids) if doc_id not in to_delete]
+            if len(keep) == len(self.ids):
+                return
+
+            self.ids = [self.ids[position] for position in keep]
+            self.documents = [self.documents[position] for position in keep]
+            self.metadatas = [self.metadatas[position] for position in keep]
+            self.vectors = np.array(self.vectors[keep], dtype=np.float32)
+            self._reindex()
+            self._persist()
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: List[float], k: int = 4,
+                                                          ids: Optional[Sequence[str]] = None) -> List[Tuple[Document, float]]:
+        """
+        Busca los k documentos más cercanos a un embedding
+
+        Args:
+            embedding: Embedding de la consulta
+            k: Número de resultados
+            ids: Si se indica, solo se puntúan estos documentos (pre-filtro)
+
+        Returns:
+            List[Tuple[Document, float]]: Documentos con su distancia L2 al cuadrado
+        """
+        vectors, squared_norms, positions_by_id = self.vectors, self._squared_norms, self._positions
+        if not len(self.ids):
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        if ids is None:
+            candidates = None
+            distances = squared_norms - 2.0 * (vectors @ query) + float(query @ query)
+        else:
+            candidates = np.array([positions_by_id[doc_id] for doc_id in ids if doc_id in positions_by_id],
+                                  dtype=np.int64)
+            if not len(candidates):
+                return []
+            distances = squared_norms[candidates] - 2.0 * (vectors[candidates] @ query) + float(query @ query)
+
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        positions = top if candidates is None else candidates[top]
+
+        return [
+            (Document(id=self.ids[position], page_content=self.documents[position],
+                      metadata=self.metadatas[position]), float(distances[row]))
+            for row, position in zip(top, positions)
+        ]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        """
+        Busca los k documentos más similares a una consulta de texto
+
+        Args:
+            query: Consulta
+            k: Número de resultados
+
+        Returns:
+            List[Document]: Documentos más similares
+        """
+        embedding = self.embedding_function.embed_query(query)
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k)]
+
+
+def count_documents(vector_store) -> int:
+    """
+    Cuenta los documentos de un vector store de cualquier backend
+
+    Args:
+        vector_store: Colección Chroma o NumpyVectorStore
+
+    Returns:
+        int: Número de documentos
+    """
+    if isinstance(vector_store, NumpyVectorStore):
+        return vector_store.count()
+    return vector_store._collection.count()
+
+
+def search_by_vector(vector_store, embedding: List[float], k: int,
+                     ids: Optional[Sequence[str]] = None) -> List[Tuple[Document, float]]:
+    """
+    Busca por embedding en un vector store de cualquier backend, opcionalmente solo
+    entre los ids indicados
+
+    Con ids el filtro se aplica antes de puntuar: NumpyVectorStore solo calcula las
+    distancias de esas filas y Chroma restringe la consulta a esos ids.
+
+    Args:
+        vector_store: Colección Chroma o NumpyVectorStore
+        embedding: Embedding de la consulta
+        k: Número de resultados
+        ids: Ids candidatos (None para buscar en toda la colección)
+
+    Returns:
+        List[Tuple[Document, float]]: Documentos con su distancia L2 al cuadrado
+    """
+    if isinstance(vector_store, NumpyVectorStore):
+        return vector_store.similarity_search_by_vector_with_relevance_scores(embedding, k=k, ids=ids)
+    if ids is None:
+        return vector_store.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+    if not ids:
+        return []
+
+    result = vector_store._collection.query(
+        query_embeddings=[embedding],
+        ids=list(ids),
+        n_results=min(k, len(ids)),
+        include=["documents", "metadatas", "distances"]
+    )
+    return [
+        (Document(id=doc_id, page_content=content, metadata=metadata or {}), distance)
+        for doc_id, content, metadata, distance in zip(
+            result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+        )
+    ]